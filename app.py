@@ -1,4 +1,5 @@
 import streamlit as st
+import threading
 import time
 import os
 import sys
@@ -13,9 +14,13 @@ sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 try:
     from src.search_engine import SearchEngine
     from src.evaluator import Evaluator
+    from src.instrumentation import Instrumentation
+    from src.search_client import SearchClient
 except ImportError:
     from search_engine import SearchEngine
     from evaluator import Evaluator
+    from instrumentation import Instrumentation
+    from search_client import SearchClient
 
 # --- CONFIGURATION ---
 # Custom CSS for Google-like look
@@ -66,14 +71,35 @@ st.markdown(f"""
 </style>
 """, unsafe_allow_html=True)
 
+# mode distant : SEARCH_SERVER_URL=http://hote:8765 interroge un src/server.py
+# au lieu de charger l'index dans le processus de l'interface
+SEARCH_SERVER_URL = os.environ.get("SEARCH_SERVER_URL")
+
 # --- LOADERS ---
 @st.cache_resource
 def load_engine():
-    return SearchEngine()
+    if SEARCH_SERVER_URL:
+        return SearchClient(SEARCH_SERVER_URL)
+    # recharge l'index en arriere-plan a chaque publication de indexer.py ;
+    # l'instrumentation alimente le panneau de debug (temps par etape, compteurs)
+    engine = SearchEngine(auto_reload=True, instrumentation=Instrumentation())
+    # index et NLTK charges en arriere-plan : la page s'affiche sans les attendre
+    threading.Thread(target=engine.warm_up, daemon=True).start()
+    return engine
 
 @st.cache_resource
 def load_evaluator():
-    return Evaluator()
+    # le meme moteur que la recherche : un seul index en memoire ; en mode
+    # distant, pas d'evaluation dans l'interface (elle chargerait l'index ici)
+    if SEARCH_SERVER_URL:
+        return None
+    return Evaluator(engine=load_engine())
+
+def last_trace():
+    # trace de la derniere recherche de ce thread (renvoyee par le serveur en mode distant)
+    if SEARCH_SERVER_URL:
+        return engine.last_trace()
+    return engine.instrumentation.last_trace()
 
 engine = load_engine()
 
@@ -82,8 +108,8 @@ if "page" not in st.session_state:
     st.session_state.page = 1
 if "search_query" not in st.session_state:
     st.session_state.search_query = ""
-if "results" not in st.session_state:
-    st.session_state.results = []
+if "search_model" not in st.session_state:
+    st.session_state.search_model = "bm25"
 if "relevant_docs" not in st.session_state:
     st.session_state.relevant_docs = set()
 if "last_query_run" not in st.session_state:
@@ -91,6 +117,9 @@ if "last_query_run" not in st.session_state:
 
 
 RESULTS_PER_PAGE = 10
+# nombre de documents classes ; le classement est garde dans le cache du moteur
+# et chaque page ne construit que ses propres snippets
+MAX_RESULTS = 50
 
 # --- MAIN INTERFACE ---
 tab_search, tab_eval, tab_stats = st.tabs(["Recherche", "Évaluation", "Statistiques"])
@@ -106,11 +135,11 @@ with tab_search:
         st.caption("Choisir le modèle de pertinence :")
         model_choice = st.radio(
             "Modèle", 
-            ["Probabiliste (BM25)", "Vectoriel (TF-IDF)"], 
+            ["Probabiliste (BM25)", "Vectoriel (TF-IDF)", "Multi-champs (BM25F)"], 
             horizontal=True, 
             label_visibility="collapsed"
         )
-        model_code = 'tfidf' if 'Vectoriel' in model_choice else 'bm25'
+        model_code = 'tfidf' if 'Vectoriel' in model_choice else 'bm25f' if 'BM25F' in model_choice else 'bm25'
         
         query_input = st.text_input("", placeholder="Rechercher sur le web...", label_visibility="collapsed")
         
@@ -124,38 +153,63 @@ with tab_search:
     # Trigger if button clicked OR enter pressed (query changed)
     # Also trigger if model changed? Maybe not, usually user types query then clicks.
     # But if they change model, they might expect refresh. Let's keep it simple: need to click or enter.
+    new_search = False
     if (search_clicked or query_input) and (query_input != st.session_state.last_query_run or search_clicked):
         # Allow re-run if button clicked even if query same (to apply new model)
         if query_input:
             st.session_state.search_query = query_input
+            st.session_state.search_model = model_code
             st.session_state.last_query_run = query_input
             st.session_state.page = 1
-            st.session_state.results = [] # Clear previous results
-            
-            with st.spinner(f"Recherche en cours ({model_choice})..."):
-                start_time = time.time()
-                # Get more results for pagination (e.g. 50)
-                st.session_state.results = engine.search(query_input, k=50, model=model_code)
-                st.session_state.duration = time.time() - start_time
+            new_search = True
     
     # DISPLAY RESULTS
-    if st.session_state.results:
-        results = st.session_state.results
-        total_results = len(results)
-        
-        st.markdown(f"About {total_results} results ({st.session_state.duration:.2f} seconds)")
-        st.divider()
+    current_results, total_results = [], 0
+    if st.session_state.search_query:
+        if st.session_state.page < 1: st.session_state.page = 1
+        # Only the current page is fetched: the ranking of the MAX_RESULTS best
+        # documents is computed once and reused from the engine's result cache,
+        # so a page turn only builds the snippets of its own results
+        start_time = time.time()
+        with st.spinner(f"Recherche en cours ({model_choice})..."):
+            current_results, total_results = engine.search_page(
+                st.session_state.search_query, st.session_state.page, RESULTS_PER_PAGE,
+                k=MAX_RESULTS, model=st.session_state.search_model)
+        if new_search:
+            st.session_state.duration = time.time() - start_time
+            # trace de la requete par ce thread (le moteur est partage entre les sessions)
+            st.session_state.trace = last_trace()
 
+    if total_results:
         # PAGINATION CALCULATION
         total_pages = (total_results // RESULTS_PER_PAGE) + (1 if total_results % RESULTS_PER_PAGE > 0 else 0)
         
-        # Ensure page range is valid
-        if st.session_state.page > total_pages: st.session_state.page = total_pages
-        if st.session_state.page < 1: st.session_state.page = 1
+        # Ensure page range is valid (the index may have been reloaded with fewer results)
+        if st.session_state.page > total_pages:
+            st.session_state.page = total_pages
+            current_results, total_results = engine.search_page(
+                st.session_state.search_query, st.session_state.page, RESULTS_PER_PAGE,
+                k=MAX_RESULTS, model=st.session_state.search_model)
         
-        start_idx = (st.session_state.page - 1) * RESULTS_PER_PAGE
-        end_idx = start_idx + RESULTS_PER_PAGE
-        current_results = results[start_idx:end_idx]
+        info_col, debug_col = st.columns([4, 1])
+        with info_col:
+            st.markdown(f"About {total_results} results ({st.session_state.get('duration', 0):.2f} seconds)")
+        with debug_col:
+            show_debug = st.checkbox("Debug", key="show_debug")
+
+        # DEBUG PANEL : temps par etape et compteurs de la derniere recherche
+        trace = st.session_state.get("trace")
+        if show_debug and trace:
+            st.caption(f"Moteur : {trace['total_ms']:.2f} ms pour « {trace['query']} » "
+                       "(score et select sont compris dans rank)")
+            stages_col, counters_col = st.columns(2)
+            with stages_col:
+                st.dataframe(pd.DataFrame(list(trace["stages_ms"].items()), columns=["Étape", "ms"]),
+                             hide_index=True, use_container_width=True)
+            with counters_col:
+                st.dataframe(pd.DataFrame(list(trace["counters"].items()), columns=["Compteur", "Valeur"]),
+                             hide_index=True, use_container_width=True)
+        st.divider()
 
         # RENDER RESULTS
         st.write(f"**Page {st.session_state.page} sur {total_pages}**")
@@ -168,16 +222,12 @@ with tab_search:
                 
                 # + Button / Expander for Full Content
                 with st.expander("Voir tout l'article"):
-                    # Retrieve content using doc map
-                    doc_info = engine.doc_map.get(res['id'])
-                    if doc_info:
-                        path = os.path.join("data", "documents", doc_info["path"])
-                        try:
-                            with open(path, "r", encoding="utf-8") as f:
-                                data = pd.read_json(f, typ='series')
-                                st.write(data['content'])
-                        except Exception as e:
-                            st.error(f"Erreur lecture fichier: {e}")
+                    # Retrieve content from the document store (or the document file)
+                    doc = engine.get_document(res['id'])
+                    if doc is not None:
+                        st.write(doc.get('content', ''))
+                    else:
+                        st.error(f"Document introuvable : {res['path']}")
                 
                 st.divider()
         
@@ -315,13 +365,32 @@ with tab_eval:
 
 with tab_stats:
     st.header("Statistiques du Moteur")
-    if engine and hasattr(engine, 'stats') and engine.stats:
+    loading = False
+    if SEARCH_SERVER_URL:
+        server_stats = engine.server_stats()
+        stats, n_terms = server_stats["stats"], server_stats["terms"]
+        generation, cache = server_stats["generation"], server_stats["cache"]
+    elif engine.loaded:
+        stats, n_terms = engine.stats, len(engine.inverted_index)
+        generation, cache = engine.generation, engine.cache_stats()
+    else:
+        # index encore en cours de chargement (warm_up) : on ne l'attend pas
+        loading, stats = True, None
+    if loading:
+        st.info("Chargement de l'index en cours...")
+    elif stats:
         c1, c2, c3 = st.columns(3)
         with c1: 
-            st.metric("Documents Indexés", engine.stats.get("total_docs", 0))
+            st.metric("Documents Indexés", stats.get("total_docs", 0))
         with c2: 
-            st.metric("Taille Index", f"{len(engine.inverted_index)} termes")
+            st.metric("Taille Index", f"{n_terms} termes")
         with c3: 
-            st.metric("Mots / Doc (Moy.)", f"{engine.stats.get('avg_doc_length', 0):.1f}")
+            st.metric("Mots / Doc (Moy.)", f"{stats.get('avg_doc_length', 0):.1f}")
+        st.caption(f"Génération de l'index : {generation}")
+        if SEARCH_SERVER_URL:
+            st.caption(f"Serveur de requêtes : {SEARCH_SERVER_URL}")
+        if cache:
+            st.caption(f"Cache des résultats : {cache['hits']} hits / {cache['misses']} misses "
+                       f"({cache['size']}/{cache['maxsize']} requêtes)")
     else:
         st.info("Statistiques non disponibles (Index vide ou non chargé).")
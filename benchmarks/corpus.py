@@ -0,0 +1,88 @@
+import json
+import os
+import random
+import re
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+
+# corpus synthetiques des benchmarks : mots tires selon leur frequence dans
+# data/documents, longueurs des documents tirees selon celles du vrai corpus
+WORD_RE = re.compile(r"[a-z][a-z'-]*")
+SENTENCE_WORDS = 15 # un point tous les ~15 mots (snippets realistes)
+
+# mots des requetes : hors des plus frequents (surtout des mots vides) et des plus rares
+QUERY_MIN_RANK = 100
+QUERY_MAX_RANK = 5000
+# nombre de termes des requetes de chaque melange
+QUERY_MIXES = {"short": (1, 2), "medium": (3, 4), "long": (5, 8)}
+
+
+class CorpusModel:
+    """Word frequencies and document lengths (in words) of a real corpus"""
+
+    def __init__(self, counts, lengths):
+        self.words = [word for word, _ in counts.most_common()]
+        self.cum_weights = list(accumulate(count for _, count in counts.most_common()))
+        self.lengths = lengths
+
+    @classmethod
+    def from_directory(cls, directory):
+        counts = Counter()
+        lengths = []
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".json"):
+                continue
+            with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+                words = WORD_RE.findall(json.load(f)["content"].lower())
+            counts.update(words)
+            lengths.append(len(words))
+        if not lengths:
+            raise ValueError(f"No documents in {directory} to draw a vocabulary from")
+        return cls(counts, lengths)
+
+    def sample(self, rng, n):
+        return rng.choices(self.words, cum_weights=self.cum_weights, k=n)
+
+    def document_length(self, rng, mean_words):
+        # la forme de la distribution reelle, ramenee a mean_words en moyenne
+        scale = mean_words / (sum(self.lengths) / len(self.lengths))
+        return max(1, int(rng.choice(self.lengths) * scale))
+
+
+def generate_corpus(model, n_docs, directory, seed=1, mean_words=400):
+    """Writes n_docs doc_N.json files (same fields as the collector) in directory"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for doc_id in range(1, n_docs + 1):
+        words = model.sample(rng, model.document_length(rng, mean_words))
+        sentences = [" ".join(words[i:i + SENTENCE_WORDS]).capitalize() + "."
+                     for i in range(0, len(words), SENTENCE_WORDS)]
+        content = " ".join(sentences)
+        document = {
+            "id": doc_id,
+            "title": " ".join(word.capitalize() for word in model.sample(rng, rng.randint(1, 3))),
+            "url": f"https://example.org/wiki/Synthetic_{doc_id}",
+            "content": content,
+            "summary": sentences[0] if sentences else ""
+        }
+        with open(os.path.join(directory, f"doc_{doc_id}.json"), "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False)
+
+
+def generate_queries(model, per_mix, seed=1, mixes=QUERY_MIXES):
+    """{mix: [query texts]}, terms drawn by frequency among the mid-frequency words"""
+    rng = random.Random(seed)
+    low = min(QUERY_MIN_RANK, len(model.words) - 1)
+    high = min(QUERY_MAX_RANK, len(model.words))
+    base = model.cum_weights[low - 1] if low else 0
+    queries = {}
+    for mix, (min_terms, max_terms) in mixes.items():
+        queries[mix] = []
+        for _ in range(per_mix):
+            terms = []
+            for _ in range(rng.randint(min_terms, max_terms)):
+                target = rng.uniform(base, model.cum_weights[high - 1])
+                terms.append(model.words[min(bisect_left(model.cum_weights, target), high - 1)])
+            queries[mix].append(" ".join(terms))
+    return queries
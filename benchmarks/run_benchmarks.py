@@ -0,0 +1,350 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(REPO_DIR, "src")
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import QUERY_MIXES, CorpusModel, generate_corpus, generate_queries
+
+# suite de benchmarks hors ligne : pour chaque taille de corpus synthetique,
+# construction de l'index, taille, chargement, memoire et latence des requetes.
+# Chaque etape tourne dans un processus a part (memoire mesuree par etape),
+# dans un dossier de travail temporaire : data/ du projet n'est pas touche.
+SOURCE_DIR = os.path.join(REPO_DIR, "data", "documents")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+
+WARMUP_QUERIES = 20
+PREPROCESS_DOCS = 200
+# au-dela de cet ecart relatif, une mesure est une regression
+TOLERANCE = 0.20
+# sens des mesures, selon leur suffixe : -1 plus petit est mieux, +1 plus grand est mieux
+DIRECTIONS = {"_s": -1, "_ms": -1, "_mb": -1, "_bytes": -1, "qps": 1, "per_s": 1}
+# demarrage a froid vise (secondes, nouvel interpreteur, meilleur de --repeat) :
+# app.py sans streamlit (ses imports et load_engine) et une requete en ligne de
+# commande. Mesures : 0.17 a 0.31 s et 0.73 s selon la machine, plus 50 % de marge
+# (--startup-targets pour une autre machine)
+STARTUP_TARGETS = {"app_start_s": 0.5, "cli_query_s": 1.5}
+APP_START_CODE = ("from search_engine import SearchEngine; from evaluator import Evaluator; "
+                  "from instrumentation import Instrumentation; "
+                  "SearchEngine(auto_reload=True, instrumentation=Instrumentation())")
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where resource is missing)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # octets sous macOS, kilo-octets sous Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_stats(durations):
+    """p50/p90/p99/mean in ms and throughput of a list of durations in seconds"""
+    ordered = sorted(durations)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1e3, 3)
+
+    total = sum(ordered)
+    return {"p50_ms": percentile(50), "p90_ms": percentile(90), "p99_ms": percentile(99),
+            "mean_ms": round(total / len(ordered) * 1e3, 3), "qps": round(len(ordered) / total, 1) if total else None}
+
+
+def _quiet():
+    # l'indexeur et le moteur affichent une ligne par document
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def stage_build(options):
+    from indexer import INDEX_BIN_FILE, INDEX_FILE, Indexer
+    from snippet_index import SNIPPETS_FILE
+
+    with _quiet():
+        indexer = Indexer()
+        # NLTK charge hors mesure (il l'etait a l'import avant le chargement paresseux)
+        indexer.preprocessor.load()
+        start = time.perf_counter()
+        indexer.build_index(workers=options["workers"])
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        indexer.save_index(fmt="both")
+        save_s = time.perf_counter() - start
+    return {"build_s": round(build_s, 3), "save_s": round(save_s, 3), "docs": indexer.total_docs,
+            "terms": len(indexer.inverted_index), "index_json_bytes": os.path.getsize(INDEX_FILE),
+            "index_bin_bytes": os.path.getsize(INDEX_BIN_FILE), "snippets_bytes": os.path.getsize(SNIPPETS_FILE),
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def stage_preprocess(options):
+    from preprocessing import Preprocessor
+
+    texts = []
+    directory = os.path.join("data", "documents")
+    for doc_id in range(1, PREPROCESS_DOCS + 1):
+        path = os.path.join(directory, f"doc_{doc_id}.json")
+        if not os.path.exists(path):
+            break
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(json.load(f)["content"])
+    preprocessor = Preprocessor()
+    preprocessor.load()
+    start = time.perf_counter()
+    tokens = sum(len(preprocessor.process(text)) for text in texts)
+    elapsed = time.perf_counter() - start
+    return {"docs": len(texts), "process_s": round(elapsed, 3),
+            "docs_per_s": round(len(texts) / elapsed, 1), "tokens_per_s": round(tokens / elapsed, 1)}
+
+
+def stage_query(options):
+    from search_engine import SearchEngine
+
+    with open("queries.json", "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    index_file = os.path.join("data", "index.bin" if options["format"] == "bin" else "index.json")
+    with _quiet():
+        start = time.perf_counter()
+        # sans cache des resultats : chaque requete est vraiment classee
+        engine = SearchEngine(index_file=index_file, backend=options["backend"], cache_size=0)
+        engine.warm_up()
+        load_s = time.perf_counter() - start
+    results = {"load_s": round(load_s, 3), "load_peak_rss_mb": peak_rss_mb()}
+
+    all_queries = [query for mix_queries in queries.values() for query in mix_queries]
+    for query in all_queries[:WARMUP_QUERIES]:
+        engine.search(query, k=options["k"])
+    for model in options["models"]:
+        results[model] = {}
+        for mix, mix_queries in queries.items():
+            durations = []
+            for query in mix_queries:
+                # le meilleur de plusieurs passages : moins sensible au bruit de la machine
+                best = None
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    engine.search(query, k=options["k"], model=model)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                durations.append(best)
+            results[model][mix] = latency_stats(durations)
+        start = time.perf_counter()
+        engine.search_many(all_queries, k=options["k"], model=model, snippets=False)
+        results[model]["batch_qps"] = round(len(all_queries) / (time.perf_counter() - start), 1)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def _cold_start_s(command, repeat):
+    """Best wall time of a command run in a new interpreter"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3)
+
+
+def stage_startup(options):
+    with open("queries.json", "r", encoding="utf-8") as f:
+        query = next(iter(json.load(f).values()))[0]
+    prelude = f"import sys; sys.path.insert(0, {SRC_DIR!r}); "
+    repeat = options["repeat"]
+    return {
+        # reference : un interpreteur qui ne fait rien
+        "interpreter_s": _cold_start_s([sys.executable, "-c", "pass"], repeat),
+        "import_s": _cold_start_s([sys.executable, "-c", prelude + "import search_engine"], repeat),
+        "app_start_s": _cold_start_s([sys.executable, "-c", prelude + APP_START_CODE], repeat),
+        "cli_query_s": _cold_start_s([sys.executable, os.path.join(SRC_DIR, "search_engine.py"), query], repeat),
+    }
+
+
+def missed_targets(results, targets=STARTUP_TARGETS):
+    """[(metric, value, target)] of the startup times above their target"""
+    return [(f"{size}.startup.{metric}", size_results["startup"][metric], target)
+            for size, size_results in results.items() for metric, target in targets.items()
+            if size_results.get("startup", {}).get(metric, 0) > target]
+
+
+STAGES = {"build": stage_build, "preprocess": stage_preprocess, "query": stage_query, "startup": stage_startup}
+
+
+def run_stage(name, workdir, options):
+    """Runs a stage in a child process (cwd = workdir) and returns its results"""
+    out_file = os.path.join(workdir, f"{name}.out.json")
+    subprocess.run([sys.executable, os.path.abspath(__file__), "--stage", name, "--stage-options",
+                    json.dumps(options), "--stage-output", out_file], cwd=workdir, check=True)
+    with open(out_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_suite(config):
+    model = CorpusModel.from_directory(config["source"])
+    results = {}
+    for size in config["docs"]:
+        workdir = tempfile.mkdtemp(prefix=f"bench_{size}_")
+        try:
+            print(f"Corpus of {size} documents ({config['words']} words on average) in {workdir}")
+            generate_corpus(model, size, os.path.join(workdir, "data", "documents"), config["seed"], config["words"])
+            with open(os.path.join(workdir, "queries.json"), "w", encoding="utf-8") as f:
+                json.dump(generate_queries(model, config["queries"], config["seed"]), f)
+
+            size_results = {"build": run_stage("build", workdir, {"workers": config["workers"]}),
+                            "preprocess": run_stage("preprocess", workdir, {}), "query": {}}
+            print(f"  build {size_results['build']['build_s']}s, {size_results['build']['terms']} terms")
+            for fmt in config["formats"]:
+                options = {"format": fmt, "backend": config["backend"], "models": config["models"], "k": config["k"],
+                           "repeat": config["repeat"]}
+                size_results["query"][fmt] = run_stage("query", workdir, options)
+                print(f"  {fmt}: load {size_results['query'][fmt]['load_s']}s")
+            size_results["startup"] = run_stage("startup", workdir, {"repeat": config["repeat"]})
+            print(f"  startup: app {size_results['startup']['app_start_s']}s, "
+                  f"CLI query {size_results['startup']['cli_query_s']}s")
+            results[str(size)] = size_results
+        finally:
+            if not config["keep"]:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def flatten(results, prefix=""):
+    """{"1000.query.bin.bm25.short.p50_ms": value, ...}"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        else:
+            flat[path] = value
+    return flat
+
+
+def _direction(metric):
+    for suffix, direction in DIRECTIONS.items():
+        if metric.endswith(suffix):
+            return direction
+    return None
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    (rows, regressions) comparing two result sets: a row per metric found
+    in both, with its relative change; a regression is a change in the bad
+    direction larger than tolerance.
+    """
+    current, previous = flatten(results), flatten(baseline)
+    rows, regressions = [], []
+    for metric, value in current.items():
+        base = previous.get(metric)
+        direction = _direction(metric)
+        if direction is None or not isinstance(value, (int, float)) or not isinstance(base, (int, float)) or not base:
+            continue
+        change = (value - base) / base
+        worse = -change * direction > tolerance
+        rows.append((metric, base, value, change, worse))
+        if worse:
+            regressions.append(metric)
+    return rows, regressions
+
+
+def print_comparison(rows, tolerance):
+    print(f"{'Metric':<45} | {'Baseline':>10} | {'Current':>10} | {'Change':>8}")
+    print("-" * 84)
+    for metric, base, value, change, worse in rows:
+        flag = "  REGRESSION" if worse else ""
+        print(f"{metric:<45} | {base:>10} | {value:>10} | {change:>+8.1%}{flag}")
+    print(f"(regression: more than {tolerance:.0%} worse than the baseline)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline indexing and query benchmarks on synthetic corpora")
+    parser.add_argument("--docs", type=int, nargs="+", default=[1000], help="corpus sizes (documents)")
+    parser.add_argument("--words", type=int, default=400, help="average words per document")
+    parser.add_argument("--queries", type=int, default=100, help="queries per mix (short, medium, long)")
+    parser.add_argument("--models", nargs="+", default=["bm25", "tfidf"], help="ranking models")
+    parser.add_argument("--formats", nargs="+", default=["bin"], choices=["bin", "json"], help="index formats to query")
+    parser.add_argument("--backend", default="python", choices=["python", "numpy"], help="scoring backend")
+    parser.add_argument("--workers", type=int, default=1, help="indexing processes")
+    parser.add_argument("--k", type=int, default=10, help="results per query")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per query (the fastest is kept)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the corpus and queries")
+    parser.add_argument("--source", default=SOURCE_DIR, help="documents whose vocabulary the corpus is drawn from")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/bench_<date>.json)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="also store the results as the baseline")
+    parser.add_argument("--startup-targets", nargs="*", metavar="METRIC=SECONDS",
+                        default=[f"{metric}={target}" for metric, target in STARTUP_TARGETS.items()],
+                        help="cold start targets (no value: no target)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative change flagged as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpora and indexes")
+    parser.add_argument("--stage", choices=sorted(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--stage-options", help=argparse.SUPPRESS)
+    parser.add_argument("--stage-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    try:
+        targets = {metric: float(target) for metric, target in
+                   (item.split("=", 1) for item in args.startup_targets)}
+    except ValueError:
+        parser.error("--startup-targets expects METRIC=SECONDS values")
+
+    if args.stage:
+        # processus enfant : une etape, dans le dossier de travail
+        sys.path.insert(0, SRC_DIR)
+        stage_results = STAGES[args.stage](json.loads(args.stage_options))
+        with open(args.stage_output, "w", encoding="utf-8") as f:
+            json.dump(stage_results, f)
+        sys.exit(0)
+
+    config = {"docs": args.docs, "words": args.words, "queries": args.queries, "models": args.models,
+              "formats": args.formats, "backend": args.backend, "workers": args.workers, "k": args.k,
+              "repeat": args.repeat,
+              "seed": args.seed, "source": args.source, "keep": args.keep,
+              "mixes": {mix: list(terms) for mix, terms in QUERY_MIXES.items()}}
+    results = run_suite(config)
+    report = {
+        "meta": {"date": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in config.items() if key not in ("source", "keep")},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+
+    status = 0
+    for metric, value, target in missed_targets(results, targets):
+        print(f"Startup target missed: {metric} = {value}s (target {target}s)")
+        status = 1
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("Warning: the baseline was measured with another configuration")
+        rows, regressions = compare(results, baseline["results"], args.tolerance)
+        print_comparison(rows, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            status = 1
+    elif not args.save_baseline:
+        # la reference depend de la machine : elle n'est pas dans le depot
+        print(f"No baseline in {args.baseline}: run again with --save-baseline to record one")
+    if args.save_baseline:
+        shutil.copyfile(output, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    sys.exit(status)
@@ -0,0 +1,325 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from itertools import accumulate
+
+try:
+    from src.codec import decode_varints, encode_varints
+    from src.instrumentation import current_trace
+    from src.ranking import IDF_FUNCTIONS, compute_idf, compute_term_bounds
+    from src.result_cache import LRUCache
+except ImportError:
+    from codec import decode_varints, encode_varints
+    from instrumentation import current_trace
+    from ranking import IDF_FUNCTIONS, compute_idf, compute_term_bounds
+    from result_cache import LRUCache
+
+# format binaire de l'index (voir INDEX_FORMAT.md), lu via mmap par le moteur
+MAGIC = b"BDRIDX"
+VERSION = 4 # v4 : postings compresses (ecart de numero de document + frequence en varint)
+
+# magic, version, nb termes, nb documents, longueur moyenne,
+# puis la position (en octets) de chaque section du fichier
+HEADER = struct.Struct("<6sHIId9Q")
+OFFSET = struct.Struct("<Q")
+IDF_VALUE = struct.Struct("<d")
+BOUND_VALUE = struct.Struct("<II")
+
+# nombre de listes de postings decodees gardees en memoire
+POSTINGS_CACHE_SIZE = 1024
+
+
+def _to_array(typecode, data):
+    """Builds a little-endian encoded array from raw bytes"""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _to_bytes(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def write_binary_index(path, inverted_index, doc_lengths, doc_map, stats, idf=None, term_bounds=None):
+    """
+    Writes the index in the binary format: term dictionary + compressed
+    postings (sorted by document number, varint gaps and frequencies) +
+    doc length array + precomputed idf and score bound statistics per term.
+    """
+    if idf is None:
+        idf = compute_idf(inverted_index, stats.get("total_docs", 0))
+    if term_bounds is None:
+        term_bounds = compute_term_bounds(inverted_index, doc_lengths)
+
+    # les documents recoivent un numero interne (position dans les tableaux)
+    doc_ids = list(doc_map.keys())
+    for doc_id in doc_lengths:
+        if doc_id not in doc_map:
+            doc_ids.append(doc_id)
+    doc_numbers = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+    docs_blob = json.dumps(
+        [[doc_id, doc_map.get(doc_id, {}).get("title", ""), doc_map.get(doc_id, {}).get("path", "")]
+         for doc_id in doc_ids],
+        ensure_ascii=False,
+    ).encode("utf-8")
+    lengths = array("I", [doc_lengths.get(doc_id, 0) for doc_id in doc_ids])
+
+    # les termes sont tries selon leurs octets utf-8 pour la recherche dichotomique
+    encoded_terms = sorted((term.encode("utf-8"), term) for term in inverted_index)
+    term_offsets = array("Q", [0])
+    postings_offsets = array("Q", [0])
+    terms_blob = bytearray()
+    postings = bytearray()
+    idf_arrays = {model: array("d") for model in IDF_FUNCTIONS}
+    bounds = array("I")
+    for raw, term in encoded_terms:
+        for model, values in idf_arrays.items():
+            values.append(idf[model][term])
+        bounds.extend(term_bounds.get(term, [0, 0]))
+        terms_blob += raw
+        term_offsets.append(len(terms_blob))
+        previous = 0
+        values = []
+        for number, freq in sorted((doc_numbers[doc_id], freq) for doc_id, freq in inverted_index[term].items()):
+            values.append(number - previous)
+            values.append(freq)
+            previous = number
+        postings += encode_varints(values)
+        postings_offsets.append(len(postings))
+
+    sections = [docs_blob, _to_bytes(lengths), _to_bytes(term_offsets), bytes(terms_blob),
+                _to_bytes(postings_offsets), bytes(postings)]
+    sections += [_to_bytes(idf_arrays[model]) for model in IDF_FUNCTIONS]
+    sections.append(_to_bytes(bounds))
+    positions = []
+    position = HEADER.size
+    for section in sections:
+        # alignement sur 8 octets
+        position += -position % 8
+        positions.append(position)
+        position += len(section)
+
+    header = HEADER.pack(MAGIC, VERSION, len(encoded_terms), len(doc_ids),
+                         float(stats.get("avg_doc_length", 0)), *positions)
+    with open(path, "wb") as f:
+        f.write(header)
+        for start, section in zip(positions, sections):
+            f.write(b"\0" * (start - f.tell()))
+            f.write(section)
+
+
+class CompressedPostings(Mapping):
+    """
+    Read-only doc_id -> freq mapping of one term, held as two arrays
+    (sorted document numbers, frequencies) decoded from the varint bytes:
+    8 bytes per posting and no dict. items() iterates in document order,
+    get() is a binary search on the document numbers.
+    """
+
+    __slots__ = ("_index", "numbers", "freqs")
+
+    def __init__(self, index, data):
+        self._index = index
+        values = decode_varints(data)
+        self.numbers = array("I", accumulate(values[0::2]))
+        self.freqs = array("I", values[1::2])
+
+    def _position(self, doc_id):
+        number = self._index.doc_numbers.get(doc_id)
+        if number is None:
+            return None
+        i = bisect_left(self.numbers, number)
+        if i < len(self.numbers) and self.numbers[i] == number:
+            return i
+        return None
+
+    def __getitem__(self, doc_id):
+        i = self._position(doc_id)
+        if i is None:
+            raise KeyError(doc_id)
+        return self.freqs[i]
+
+    def get(self, doc_id, default=None):
+        # inline de _position : appele pour chaque candidat pendant l'elagage
+        number = self._index.doc_numbers.get(doc_id)
+        if number is not None:
+            numbers = self.numbers
+            i = bisect_left(numbers, number)
+            if i < len(numbers) and numbers[i] == number:
+                return self.freqs[i]
+        return default
+
+    def __contains__(self, doc_id):
+        return self._position(doc_id) is not None
+
+    def __iter__(self):
+        return map(self._index.doc_ids.__getitem__, self.numbers)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def items(self):
+        return zip(self, self.freqs)
+
+    def values(self):
+        return iter(self.freqs)
+
+
+class PostingsView(Mapping):
+    """
+    Read-only term -> postings (CompressedPostings) mapping over the
+    memory-mapped index. Postings are decoded lazily, one term at a time,
+    on first access.
+    """
+
+    def __init__(self, index):
+        self._index = index
+        self._cache = LRUCache(POSTINGS_CACHE_SIZE)
+
+    def __getitem__(self, term):
+        postings = self._cache.get(term)
+        if postings is not None:
+            return postings
+
+        number = self._index.find_term(term)
+        if number is None:
+            raise KeyError(term)
+        postings = self._index.decode_postings(number)
+        self._cache.put(term, postings)
+        return postings
+
+    def __contains__(self, term):
+        return term in self._cache or self._index.find_term(term) is not None
+
+    def __iter__(self):
+        for number in range(self._index.n_terms):
+            yield self._index.term_at(number)
+
+    def __len__(self):
+        return self._index.n_terms
+
+
+class IdfView(Mapping):
+    """Read-only term -> idf mapping over one precomputed idf column"""
+
+    def __init__(self, index, position):
+        self._index = index
+        self._position = position
+
+    def __getitem__(self, term):
+        number = self._index.find_term(term)
+        if number is None:
+            raise KeyError(term)
+        return IDF_VALUE.unpack_from(self._index._mm, self._position + 8 * number)[0]
+
+    def __iter__(self):
+        return iter(self._index.inverted_index)
+
+    def __len__(self):
+        return self._index.n_terms
+
+
+class BoundsView(Mapping):
+    """Read-only term -> (max_tf, min_dl) mapping"""
+
+    def __init__(self, index, position):
+        self._index = index
+        self._position = position
+
+    def __getitem__(self, term):
+        number = self._index.find_term(term)
+        if number is None:
+            raise KeyError(term)
+        return BOUND_VALUE.unpack_from(self._index._mm, self._position + 8 * number)
+
+    def __iter__(self):
+        return iter(self._index.inverted_index)
+
+    def __len__(self):
+        return self._index.n_terms
+
+
+class BinaryIndex:
+    """Memory-mapped reader for the binary index format"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.n_terms, self.n_docs, avg_doc_length,
+         docs_pos, lengths_pos, term_offsets_pos, terms_pos,
+         postings_offsets_pos, postings_pos, *idf_positions, bounds_pos) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a binary index (version {VERSION})")
+
+        self._term_offsets_pos = term_offsets_pos
+        self._terms_pos = terms_pos
+        self._postings_offsets_pos = postings_offsets_pos
+        self._postings_pos = postings_pos
+
+        # seules les donnees par document sont chargees a l'ouverture
+        docs = json.loads(self._mm[docs_pos:lengths_pos].rstrip(b"\0").decode("utf-8"))
+        self.doc_ids = [doc_id for doc_id, _, _ in docs]
+        self.doc_numbers = {doc_id: number for number, doc_id in enumerate(self.doc_ids)}
+        self.doc_map = {doc_id: {"title": title, "path": filename} for doc_id, title, filename in docs}
+        lengths = _to_array("I", self._mm[lengths_pos:lengths_pos + 4 * self.n_docs])
+        self.doc_lengths = dict(zip(self.doc_ids, lengths))
+        self.stats = {"total_docs": self.n_docs, "avg_doc_length": avg_doc_length}
+        self.inverted_index = PostingsView(self)
+        self.idf = {model: IdfView(self, position) for model, position in zip(IDF_FUNCTIONS, idf_positions)}
+        self.term_bounds = BoundsView(self, bounds_pos)
+
+    def _offset(self, table_pos, i):
+        return OFFSET.unpack_from(self._mm, table_pos + 8 * i)[0]
+
+    def _term_bytes(self, number):
+        start = self._terms_pos + self._offset(self._term_offsets_pos, number)
+        end = self._terms_pos + self._offset(self._term_offsets_pos, number + 1)
+        return self._mm[start:end]
+
+    def term_at(self, number):
+        return self._term_bytes(number).decode("utf-8")
+
+    def find_term(self, term):
+        """Binary search in the sorted term dictionary, returns the term number or None"""
+        raw = term.encode("utf-8")
+        low, high = 0, self.n_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_bytes(middle) < raw:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_terms and self._term_bytes(low) == raw:
+            return low
+        return None
+
+    def decode_postings(self, number):
+        start = self._postings_pos + self._offset(self._postings_offsets_pos, number)
+        end = self._postings_pos + self._offset(self._postings_offsets_pos, number + 1)
+        trace = current_trace()
+        if trace is not None:
+            trace.count("postings_bytes", end - start)
+        return CompressedPostings(self, self._mm[start:end])
+
+    def close(self):
+        self._mm.close()
+
+
+def is_binary_index(path):
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,61 @@
+# encodage compact d'entiers croissants : differences (delta) puis varint
+# (7 bits par octet, bit de poids fort = "un octet suit")
+
+
+def delta_encode(values):
+    """Sorted integers -> first value then differences"""
+    previous = 0
+    deltas = []
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return deltas
+
+
+def delta_decode(deltas):
+    total = 0
+    values = []
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def encode_varints(values):
+    """Non-negative integers -> variable-byte encoding"""
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data):
+    if not data:
+        return []
+    if max(data) < 0x80:
+        # cas frequent (petits ecarts, petites frequences) : un octet par valeur
+        return list(data)
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        if byte < 0x80:
+            values.append(value | (byte << shift))
+            value = 0
+            shift = 0
+        else:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+    return values
+
+
+def encode_positions(positions):
+    """Sorted positions -> delta + varint bytes"""
+    return encode_varints(delta_encode(positions))
+
+
+def decode_positions(data):
+    return delta_decode(decode_varints(data))
@@ -1,11 +1,27 @@
-import wikipedia
+import argparse
 import json
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-#creation des dossier data et documents
+try:
+    from src.document_store import DocumentStore, save_document
+except ImportError:
+    from document_store import DocumentStore, save_document
+
+#dossier des documents collectes (cree par collect_documents)
 DATA_DIR = os.path.join("data", "documents")
-os.makedirs(DATA_DIR, exist_ok=True)
+
+# journal de la collecte : id reserve pour chaque sujet et sujets termines,
+# pour reprendre une collecte interrompue sans doublon ni collision d'id
+STATE_FILE = os.path.join("data", "collector_state.jsonl")
+
+COLLECT_WORKERS = 8 # requetes en vol en meme temps
+RATE_LIMIT = 10.0 # requetes par seconde vers l'API (0 : pas de limite)
+RETRIES = 3 # nouvelles tentatives apres une erreur reseau
+BACKOFF = 1.0 # secondes avant la premiere nouvelle tentative, doublees ensuite
 
 #des sujets de donnée collecter 
 TOPICS = [
@@ -30,86 +46,327 @@ def generate_metadata_file():
     """
     Generates a CSV metadata file from the collected JSON documents.
     """
+    rows = []
+    store = DocumentStore()
+    if store.exists():
+        # une lecture sequentielle du magasin au lieu d'un fichier par document
+        rows = [metadata_row(doc) for _, doc in store.scan()]
+    else:
+        for filename in os.listdir(DATA_DIR):
+            if filename.endswith(".json"):
+                filepath = os.path.join(DATA_DIR, filename)
+                with open(filepath, "r", encoding="utf-8") as f:
+                    rows.append(metadata_row(json.load(f)))
+    write_metadata(rows)
+
+
+def metadata_row(doc):
+    return [doc["id"], doc["title"], doc["url"], len(doc["content"])]
+
+
+def write_metadata(rows):
+    """Writes metadata.csv from [id, title, url, length_chars] rows (see metadata_row)"""
     import csv
-    docs = []
-    for filename in os.listdir(DATA_DIR):
-        if filename.endswith(".json"):
-            filepath = os.path.join(DATA_DIR, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                doc = json.load(f)
-                docs.append(doc)
-    
     # Sort by ID
-    docs.sort(key=lambda x: x["id"])
+    rows = sorted(rows, key=lambda row: int(row[0]))
     #enregistrement dans metadonne
     metadata_path = os.path.join(DATA_DIR, "..", "metadata.csv")
     with open(metadata_path, "w", encoding="utf-8", newline="") as f:
         writer = csv.writer(f)
         writer.writerow(["id", "title", "url", "length_chars"])
-        for doc in docs:
-            writer.writerow([doc["id"], doc["title"], doc["url"], len(doc["content"])])
-    
+        writer.writerows(rows)
 
-def collect_data(target_count=60):
+
+class TopicNotFound(Exception):
+    """No article for a topic (missing or ambiguous page): not retried"""
+
+
+class TokenBucket:
     """
-    Collects wikipedia articles and saves them as JSON files.
+    Thread-safe token bucket: `rate` requests per second on average, with
+    bursts of at most `capacity` requests.
     """
-    collected_count = 0
-    
-    # Existing files check
-    existing_files = [f for f in os.listdir(DATA_DIR) if f.endswith('.json')]
-    collected_count = len(existing_files)
+
+    def __init__(self, rate=RATE_LIMIT, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate or 0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request is allowed"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class WikipediaBackend:
+    """
+    Articles from the Wikipedia API (first search result of the topic).
+    api_url points the wikipedia package to another MediaWiki API, e.g. a
+    local fixture server.
+    """
+
+    def __init__(self, api_url=None):
+        import wikipedia
+        self.wikipedia = wikipedia
+        if api_url:
+            wikipedia.wikipedia.API_URL = api_url
+
+    def fetch(self, topic, limiter):
+        wikipedia = self.wikipedia
+        try:
+            limiter.acquire()
+            search_results = wikipedia.search(topic)
+            if not search_results:
+                raise TopicNotFound(f"No result for {topic}")
+            limiter.acquire()
+            page = wikipedia.page(search_results[0], auto_suggest=False)
+            # content et summary sont charges a la demande : une requete chacun
+            limiter.acquire()
+            content = page.content
+            limiter.acquire()
+            summary = page.summary
+        except wikipedia.exceptions.DisambiguationError as e:
+            raise TopicNotFound(f"Ambiguous topic {topic}: {e.options[:3]}")
+        except wikipedia.exceptions.PageError:
+            raise TopicNotFound(f"Page not found for {topic}")
+        return {"title": page.title, "url": page.url, "content": content, "summary": summary}
+
+
+class DumpBackend:
+    """
+    Articles from a local dump: a directory of doc_N.json files or a JSON
+    lines file of {title, url, content, summary}. A topic matches the
+    article with the same title, else the first title containing it.
+    """
+
+    def __init__(self, path):
+        articles = []
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith(".json"):
+                    with open(os.path.join(path, filename), "r", encoding="utf-8") as f:
+                        articles.append(json.load(f))
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                articles = [json.loads(line) for line in f if line.strip()]
+        self.articles = [{key: article.get(key, "") for key in ("title", "url", "content", "summary")}
+                         for article in articles]
+        self.titles = {article["title"].lower(): article for article in reversed(self.articles)}
+
+    def fetch(self, topic, limiter):
+        limiter.acquire()
+        article = self.titles.get(topic.lower())
+        if article is None:
+            article = next((a for a in self.articles if topic.lower() in a["title"].lower()), None)
+        if article is None:
+            raise TopicNotFound(f"Page not found for {topic}")
+        return dict(article)
+
+
+class CollectorState:
+    """
+    Append-only journal of the collector: {"topic", "id"} when a doc id is
+    given to a topic, {"topic", "status", "title"} when the topic is done
+    (saved, missing or duplicate). A topic keeps its id across runs; a line
+    cut by a crash is ignored.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.ids = {} # sujet -> doc id
+        self.done = {} # sujet -> statut
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "id" in entry:
+                        self.ids[entry["topic"]] = entry["id"]
+                    if "status" in entry:
+                        self.done[entry["topic"]] = entry["status"]
+
+    def reserve(self, topic, doc_id):
+        self.ids[topic] = doc_id
+        self._append({"topic": topic, "id": doc_id})
+
+    def finish(self, topic, status, title=None):
+        self.done[topic] = status
+        self._append({"topic": topic, "status": status, "title": title})
+
+    def _append(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def fetch_with_retry(backend, topic, limiter, retries=RETRIES, backoff=BACKOFF):
+    """backend.fetch(), retried with exponential backoff (and jitter) on errors other than TopicNotFound"""
+    for attempt in range(retries + 1):
+        try:
+            return backend.fetch(topic, limiter)
+        except TopicNotFound:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+            print(f"  Retrying {topic} in {delay:.1f}s ({e})")
+            time.sleep(delay)
+
+
+def _existing_documents(store):
+    """({title: doc id}, [doc ids]) of the documents already collected"""
+    if store is not None:
+        documents = (document for _, document in store.scan())
+    else:
+        documents = []
+        for filename in os.listdir(DATA_DIR):
+            if filename.endswith(".json"):
+                with open(os.path.join(DATA_DIR, filename), "r", encoding="utf-8") as f:
+                    documents.append(json.load(f))
+    titles = {}
+    ids = []
+    for document in documents:
+        ids.append(int(document["id"]))
+        titles.setdefault(document["title"], ids[-1])
+    return titles, ids
+
+
+def _open_collect_store():
+    # une fois les documents migres (document_store.py --migrate), on ecrit dans le magasin
+    store = DocumentStore()
+    return store if store.exists() else None
+
+
+def collect_documents(target_count=60, topics=None, backend=None, workers=COLLECT_WORKERS, rate=RATE_LIMIT,
+                      retries=RETRIES, state_file=STATE_FILE, store=None):
+    """
+    Yields new documents (with their doc id) until target_count documents
+    are collected. The caller saves each document before asking for the
+    next one: its topic is only marked done in the journal then.
+
+    Topics are fetched by a pool of threads sharing a token bucket (`rate`
+    API requests per second) and retried on network errors. The journal
+    (state_file) records the doc id of each topic and the topics done: an
+    interrupted run resumes where it stopped, and ids never collide with
+    the documents already there. backend defaults to the Wikipedia API.
+    """
+    topics = TOPICS if topics is None else topics
+    # cree a la premiere collecte, pas a l'import du module
+    os.makedirs(DATA_DIR, exist_ok=True)
+    existing, existing_ids = _existing_documents(store)
+    collected_count = len(existing_ids)
     
     # We continue collecting if we are below target
     if collected_count >= target_count:
-        generate_metadata_file()
         return
 
-    for topic in TOPICS:
-        if collected_count >= target_count:
-            break
-            
-        #la phase suivante pour eviter les doublons        
-        try:
-            print(f"Fetching: {topic}...")
-            search_results = wikipedia.search(topic)
-            if not search_results:
+    backend = backend or WikipediaBackend()
+    state = CollectorState(state_file)
+    next_id = max(existing_ids + list(state.ids.values()), default=0) + 1
+    pending = [topic for topic in dict.fromkeys(topics) if topic not in state.done]
+    limiter = TokenBucket(rate)
+    print(f"Fetching {len(pending)} topics ({workers} workers, {rate or 'no'} requests/s limit)...")
+
+    pool = ThreadPoolExecutor(max(1, workers))
+    try:
+        futures = {pool.submit(fetch_with_retry, backend, topic, limiter, retries): topic for topic in pending}
+        # les articles sont rendus par ce thread, dans l'ordre d'arrivee
+        for future in as_completed(futures):
+            topic = futures[future]
+            try:
+                page = future.result()
+            except TopicNotFound as e:
+                print(f"  {e}")
+                state.finish(topic, "missing")
+                continue
+            except Exception as e:
+                # pas marque comme termine : repris a la prochaine collecte
+                print(f"  Error fetching {topic}: {str(e)}")
                 continue
-                
-            page_title = search_results[0]
-            page = wikipedia.page(page_title, auto_suggest=False)
+
+            doc_id = state.ids.get(topic)
+            #la phase suivante pour eviter les doublons
+            if existing.get(page["title"], doc_id) != doc_id:
+                print(f"  Duplicate of doc {existing[page['title']]} for {topic} ({page['title']})")
+                state.finish(topic, "duplicate", page["title"])
+                continue
+            if doc_id is None:
+                # id reserve avant l'ecriture : apres un arret entre les deux,
+                # le sujet recupere le meme id et ecrase le meme document
+                doc_id = next_id
+                next_id += 1
+                state.reserve(topic, doc_id)
+
             #les document sont enregistrer de la façon suivante
-            doc_id = collected_count + 1
-            document = {
+            yield {
                 "id": doc_id,
-                "title": page.title,
-                "url": page.url,
-                "content": page.content,
-                "summary": page.summary
+                "title": page["title"],
+                "url": page["url"],
+                "content": page["content"],
+                "summary": page["summary"]
             }
-            
-            #enregistrer les document
-            filename = f"doc_{doc_id}.json"
-            filepath = os.path.join(DATA_DIR, filename)
-            #w=permet de write dans un document
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(document, f, ensure_ascii=False, indent=4)
-                
-            print(f"  Saved {filename} ({page.title})")
+            existing[page["title"]] = doc_id
+            state.finish(topic, "saved", page["title"])
             collected_count += 1
-            
-            time.sleep(0.5)
-            
-        except wikipedia.exceptions.DisambiguationError as e:
-            print(f"  Ambiguous topic {topic}: {e.options[:3]}")
-        except wikipedia.exceptions.PageError:
-            print(f"  Page not found for {topic}")
-        except Exception as e:
-            print(f"  Error fetching {topic}: {str(e)}")
+            if collected_count >= target_count:
+                break
+    finally:
+        # fin de la collecte ou appelant qui s'arrete avant (close du generateur) :
+        # les sujets pas encore commences ne sont pas telecharges
+        pool.shutdown(cancel_futures=True)
+
+
+def collect_data(target_count=60, topics=None, backend=None, workers=COLLECT_WORKERS, rate=RATE_LIMIT,
+                 retries=RETRIES, state_file=STATE_FILE):
+    """
+    Collects wikipedia articles and saves them as JSON files (see
+    collect_documents; ingest.py indexes them in the same pass instead).
+    """
+    store = _open_collect_store()
+    collected_count = 0
+    for document in collect_documents(target_count, topics, backend, workers, rate, retries, state_file, store):
+        #enregistrer les document
+        filename = save_document(document, store, DATA_DIR)
+        print(f"  Saved {filename} ({document['title']})")
+        collected_count += 1
 
-    print(f"\nCollection complete. Total documents: {collected_count}")
+    if store is not None:
+        total = len(store)
+    else:
+        total = len([f for f in os.listdir(DATA_DIR) if f.endswith(".json")])
+    print(f"\nCollection complete. New documents: {collected_count}, total documents: {total}")
     generate_metadata_file()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collects Wikipedia articles")
+    parser.add_argument("--target", type=int, default=60, help="number of documents to reach")
+    parser.add_argument("--topics", help="file of topics, one per line (default: the built-in list)")
+    parser.add_argument("--workers", type=int, default=COLLECT_WORKERS, help="concurrent requests")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT, help="API requests per second (0: no limit)")
+    parser.add_argument("--dump", help="read the articles from a local dump (directory of doc JSON or JSON lines)")
+    parser.add_argument("--api-url", help="MediaWiki API to query instead of Wikipedia (e.g. a fixture server)")
+    args = parser.parse_args()
+
+    topics = None
+    if args.topics:
+        with open(args.topics, "r", encoding="utf-8") as f:
+            topics = [line.strip() for line in f if line.strip()]
+    backend = DumpBackend(args.dump) if args.dump else WikipediaBackend(args.api_url)
     #appel des fonctions
-    collect_data(target_count=60)
+    collect_data(target_count=args.target, topics=topics, backend=backend, workers=args.workers, rate=args.rate)
@@ -0,0 +1,244 @@
+import argparse
+import hashlib
+import json
+import os
+import zlib
+
+try:
+    from src.forward_index import MappedFile
+    from src.instrumentation import current_trace
+    from src.publish import write_json
+except ImportError:
+    from forward_index import MappedFile
+    from instrumentation import current_trace
+    from publish import write_json
+
+# magasin de documents : un fichier d'enregistrements en ajout seul et une
+# table des positions, au lieu d'un fichier JSON par document
+STORE_FILE = os.path.join("data", "documents.dat")
+STORE_INDEX_FILE = os.path.join("data", "documents.idx")
+DOCS_DIR = os.path.join("data", "documents")
+
+MAGIC = b"BDRDOC01"
+VERSION = 1
+COMPRESSION_LEVEL = 6
+
+
+class DocumentStore(MappedFile):
+    """
+    Append-only document store.
+
+    documents.dat holds one record per document version (compact JSON,
+    zlib-compressed if compress=True: about 3x smaller, but decompressing
+    costs more than the read itself on random access); documents.idx maps
+    each doc id to the (offset, length, compressed, path, hash) of its
+    current record.
+    Records are read through mmap: random access by id costs no open or
+    seek, and scan() walks the live records in file order. Replacing or
+    deleting a document only rewrites the (small) offset table; compact()
+    drops the records no longer referenced, into a new data file named in
+    the table, so the offsets and the file they point into are published
+    together.
+    """
+
+    def __init__(self, data_file=STORE_FILE, index_file=STORE_INDEX_FILE, compress=False):
+        self.base_file = data_file
+        self.data_file = data_file # fichier de donnees courant (documents.N.dat apres N compactages)
+        self.index_file = index_file
+        self.compress = compress
+        self.records = {} # doc_id -> [offset, length, compressed, path, hash]
+        self.compactions = 0
+        self._mm = None
+        self._index_mtime = None
+        self.refresh()
+
+    def exists(self):
+        return os.path.exists(self.index_file) and os.path.exists(self.data_file)
+
+    def refresh(self):
+        """Reloads the offset table if another process published a new one"""
+        if not os.path.exists(self.index_file):
+            return
+        mtime = os.path.getmtime(self.index_file)
+        if mtime == self._index_mtime:
+            return
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise ValueError(f"{self.index_file} is not a document store index (version {VERSION})")
+        self.records = data["records"]
+        self.compactions = data.get("compactions", 0)
+        self.data_file = self._data_file(self.compactions)
+        self._index_mtime = mtime
+        self._close_map()
+
+    def _close_map(self):
+        # les lecteurs en cours gardent une reference : on laisse le GC fermer l'ancienne projection
+        self._mm = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, doc_id):
+        return str(doc_id) in self.records
+
+    def ids(self):
+        return list(self.records)
+
+    def path(self, doc_id):
+        """Name of the document (its original file name), or None"""
+        record = self.records.get(str(doc_id))
+        return record[3] if record else None
+
+    def content_hash(self, doc_id):
+        record = self.records.get(str(doc_id))
+        return record[4] if record else None
+
+    def raw(self, doc_id):
+        """Compact JSON bytes of a document, or None"""
+        record = self.records.get(str(doc_id))
+        if record is None:
+            return None
+        offset, length, compressed = record[0], record[1], record[2]
+        trace = current_trace()
+        if trace is not None:
+            trace.count("document_bytes", length)
+        try:
+            data = self._map(offset + length)[offset:offset + length]
+        except FileNotFoundError:
+            # compacte entre la lecture de la table et celle des donnees : on relit la table
+            data_file = self.data_file
+            self.refresh()
+            if self.data_file == data_file:
+                raise
+            return self.raw(doc_id)
+        return zlib.decompress(data) if compressed else data
+
+    def get(self, doc_id):
+        """The document dict, or None"""
+        raw = self.raw(doc_id)
+        return json.loads(raw) if raw is not None else None
+
+    def scan(self):
+        """Yields (doc_id, document) for every document, in file order (sequential reads)"""
+        for doc_id, record in sorted(self.records.items(), key=lambda item: item[1][0]):
+            offset, length, compressed = record[0], record[1], record[2]
+            data = self._map(offset + length)[offset:offset + length]
+            yield doc_id, json.loads(zlib.decompress(data) if compressed else data)
+
+    def put_many(self, documents, paths=None):
+        """
+        Appends documents (dicts with an "id") and publishes the new offset
+        table. A document whose content did not change is not rewritten.
+        Returns the number of records written.
+        """
+        paths = paths or {}
+        new_file = not os.path.exists(self.data_file)
+        written = 0
+        with open(self.data_file, "ab") as f:
+            if new_file:
+                f.write(MAGIC)
+            offset = f.tell()
+            for document in documents:
+                doc_id = str(document["id"])
+                raw = json.dumps(document, ensure_ascii=False).encode("utf-8")
+                digest = hashlib.sha1(raw).hexdigest()
+                record = self.records.get(doc_id)
+                path = paths.get(doc_id) or (record[3] if record else f"doc_{doc_id}.json")
+                if record is not None and record[4] == digest and record[3] == path:
+                    continue
+                data = zlib.compress(raw, COMPRESSION_LEVEL) if self.compress else raw
+                f.write(data)
+                self.records[doc_id] = [offset, len(data), int(self.compress), path, digest]
+                offset += len(data)
+                written += 1
+            f.flush()
+            os.fsync(f.fileno())
+        if written or new_file:
+            self._publish()
+        return written
+
+    def put(self, document, path=None):
+        return self.put_many([document], {str(document["id"]): path} if path else None)
+
+    def delete(self, doc_id):
+        if self.records.pop(str(doc_id), None) is not None:
+            self._publish()
+
+    def _publish(self):
+        # la table est publiee apres les donnees : un lecteur ne voit jamais
+        # une position qui pointe au-dela de ce qui est ecrit
+        write_json(self.index_file, {"version": VERSION, "compactions": self.compactions, "records": self.records})
+        self._index_mtime = os.path.getmtime(self.index_file)
+
+    def compact(self):
+        """
+        Writes the live records only to a new data file, then publishes the
+        table pointing to it: a reader sees either the old table and file or
+        the new ones. The old file is removed once the table is published.
+        """
+        old_file = self.data_file
+        new_file = self._data_file(self.compactions + 1)
+        records = {}
+        with open(new_file, "wb") as f:
+            f.write(MAGIC)
+            for doc_id, record in sorted(self.records.items(), key=lambda item: item[1][0]):
+                offset, length = record[0], record[1]
+                records[doc_id] = [f.tell()] + record[1:]
+                f.write(self._map(offset + length)[offset:offset + length])
+            f.flush()
+            os.fsync(f.fileno())
+        self.records = records
+        self.compactions += 1
+        self.data_file = new_file
+        self._close_map()
+        self._publish()
+        # les lecteurs qui ont deja projete l'ancien fichier le gardent jusqu'a leur fermeture
+        os.remove(old_file)
+
+
+def save_document(document, store=None, directory=DOCS_DIR):
+    """
+    Saves a collected document in the store, or as doc_<id>.json in
+    `directory` without one. Returns its file name (the path of the record).
+    """
+    filename = f"doc_{document['id']}.json"
+    if store is not None:
+        store.put(document, filename)
+    else:
+        # octets ecrits tels quels : le hash du manifeste de l'indexeur est celui du fichier
+        with open(os.path.join(directory, filename), "wb") as f:
+            f.write(json.dumps(document, ensure_ascii=False, indent=4).encode("utf-8"))
+    return filename
+
+
+def migrate_directory(directory=DOCS_DIR, store=None):
+    """Copies the doc_N.json files of a directory into the document store"""
+    store = store or DocumentStore()
+    filenames = sorted((f for f in os.listdir(directory) if f.endswith(".json")),
+                       key=lambda name: (len(name), name))
+    documents = []
+    paths = {}
+    for filename in filenames:
+        with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+            document = json.load(f)
+        documents.append(document)
+        paths[str(document["id"])] = filename
+    written = store.put_many(documents, paths)
+    print(f"Migrated {written} documents from {directory} to {store.data_file}")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Document store maintenance")
+    parser.add_argument("--migrate", action="store_true", help="copy data/documents/*.json into the store")
+    parser.add_argument("--compact", action="store_true", help="drop the records of replaced or deleted documents")
+    parser.add_argument("--compress", action="store_true", help="zlib-compress the records written")
+    args = parser.parse_args()
+
+    store = DocumentStore(compress=args.compress)
+    if args.migrate:
+        migrate_directory(DOCS_DIR, store)
+    if args.compact:
+        store.compact()
+        print(f"Store compacted: {len(store)} documents")
@@ -1,4 +1,7 @@
+import argparse
 import csv
+import hashlib
+import json
 import os
 import sys
 
@@ -6,23 +9,106 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 try:
+    from src.publish import atomic_path, write_json
     from src.search_engine import SearchEngine
 except ImportError:
      sys.path.append(os.path.join(os.path.dirname(__file__)))
+     from publish import atomic_path, write_json
      from search_engine import SearchEngine
 #ce fichier contient les 5 requetes  a tester 
 GROUND_TRUTH_FILE = os.path.join("data", "ground_truth.csv")
 #resultat de recherche
 OUTPUT_FILE = os.path.join("data", "evaluation_results.csv")
 CURVE_FILE = os.path.join("data", "evaluation_curve.csv")
+# classements deja calcules (format "run" TREC), par generation de l'index et parametres
+RUNS_DIR = os.path.join("data", "runs")
+MODELS = ['bm25', 'tfidf']
+
+
+def ranking_metrics(retrieved_ids, relevant_ids, k):
+    """
+    Metrics of one ranking in a single pass: ({relevant_retrieved,
+    precision, recall, f_measure, ap, rr} at k, [(P@i, R@i) for i=1..k]).
+    """
+    hits = 0
+    sum_precisions = 0
+    rr = 0.0
+    curve = []
+    n_relevant = len(relevant_ids)
+    for i in range(1, k + 1):
+        if i <= len(retrieved_ids) and retrieved_ids[i - 1] in relevant_ids:
+            hits += 1
+            sum_precisions += hits / i
+            if not rr:
+                rr = 1.0 / i
+        curve.append((hits / i, hits / n_relevant if n_relevant else 0))
+
+    # Basic Metrics
+    precision = hits / k if k > 0 else 0
+    recall = hits / n_relevant if n_relevant else 0
+    f_measure = 0
+    if (precision + recall) > 0:
+        f_measure = (2 * precision * recall) / (precision + recall)
+    # Advanced Metrics
+    ap = sum_precisions / n_relevant if n_relevant else 0.0
+    return {"relevant_retrieved": hits, "precision": precision, "recall": recall,
+            "f_measure": f_measure, "ap": ap, "rr": rr}, curve
+
+
+def write_run(path, rankings, texts, key, tag="run"):
+    """
+    Writes {query_id: [(doc_id, score)]} as a TREC run file
+    ("qid Q0 doc_id rank score tag" lines) and, next to it, the query texts
+    and the key it was computed with.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for query_id, ranking in rankings.items():
+                for rank, (doc_id, score) in enumerate(ranking, 1):
+                    f.write(f"{query_id} Q0 {doc_id} {rank} {score} {tag}\n")
+    write_json(path + ".json", {"key": key, "queries": texts})
+    # runs d'anciennes generations de l'index
+    prefix = f"g{key['generation']}_"
+    for name in os.listdir(os.path.dirname(path)):
+        if name.startswith("g") and not name.startswith(prefix):
+            os.remove(os.path.join(os.path.dirname(path), name))
+
+
+def read_run(path):
+    """{query_id: [(doc_id, score)]} of a TREC run file, in rank order"""
+    rankings = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            query_id, _, doc_id, _, score, _ = line.split()
+            rankings.setdefault(query_id, []).append((doc_id, float(score)))
+    return rankings
+
+
+def load_qrels(path):
+    """{query_id: {relevant doc ids}} of a TREC qrels file ("qid iter doc_id relevance" lines)"""
+    qrels = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 4 and int(fields[3]) > 0:
+                qrels.setdefault(fields[0], set()).add(fields[2])
+    return qrels
+
 
 class Evaluator:
-    def __init__(self):
-        self.engine = SearchEngine()
+    def __init__(self, models=None, qrels_file=None, engine=None):
+        # moteur partage (celui de app.py) ou le sien, dont l'index est lu a la premiere requete
+        self.engine = engine if engine is not None else SearchEngine()
+        self.models = models or MODELS
         self.queries = []
-        self.load_ground_truth()
+        self.load_ground_truth(qrels_file)
 
-    def load_ground_truth(self):
+    def load_ground_truth(self, qrels_file=None):
+        """
+        Queries of GROUND_TRUTH_FILE. qrels_file (TREC qrels) replaces its
+        relevant_doc_ids column for large judgment sets.
+        """
         if not os.path.exists(GROUND_TRUTH_FILE):
             print(f"Error: {GROUND_TRUTH_FILE} not found.")
             return
@@ -31,59 +117,86 @@ class Evaluator:
             reader = csv.DictReader(f)
             for row in reader:
                 # relevant_doc_ids is space-separated string
-                rel_ids = set(row["relevant_doc_ids"].split())
+                rel_ids = set((row.get("relevant_doc_ids") or "").split())
                 self.queries.append({
                     "id": row["query_id"],
                     "text": row["query_text"],
                     "relevant": rel_ids
                 })
+        if qrels_file:
+            qrels = load_qrels(qrels_file)
+            for q in self.queries:
+                q["relevant"] = qrels.get(q["id"], set())
 
     def calculate_ap(self, retrieved_ids, relevant_ids):
         """Calculates Average Precision (AP)"""
-        hits = 0
-        sum_precisions = 0
-        
-        for i, doc_id in enumerate(retrieved_ids):
-            if doc_id in relevant_ids:
-                hits += 1
-                precision_at_i = hits / (i + 1)
-                sum_precisions += precision_at_i
-                
-        if not relevant_ids:
-            return 0.0
-            
-        return sum_precisions / len(relevant_ids)
+        return ranking_metrics(retrieved_ids, relevant_ids, len(retrieved_ids))[0]["ap"]
 
     def calculate_rr(self, retrieved_ids, relevant_ids):
         """Calculates Reciprocal Rank (RR)"""
-        for i, doc_id in enumerate(retrieved_ids):
-            if doc_id in relevant_ids:
-                return 1.0 / (i + 1)
-        return 0.0
+        return ranking_metrics(retrieved_ids, relevant_ids, len(retrieved_ids))[0]["rr"]
+
+    def _run_key(self, model, k):
+        """Everything a ranking depends on: index generation and search parameters"""
+        engine = self.engine
+        key = {"generation": engine.generation, "total_docs": engine.stats.get("total_docs", 0),
+               "avg_doc_length": engine.stats.get("avg_doc_length", 0), "model": model, "k": k,
+               "k1": engine.k1, "b": engine.b, "proximity": engine.proximity}
+        if model == 'bm25f':
+            key["field_weights"] = engine.field_weights
+        return key
+
+    def run(self, model, k=10, workers=1, use_cache=True):
+        """
+        {query_id: [(doc_id, score)]} of every query. Rankings come from the
+        cached run file of the same index generation and parameters when
+        the query text did not change (use_cache=False ranks every query);
+        the other queries are ranked in one search_many batch (workers
+        processes) and saved in the run file.
+        """
+        key = self._run_key(model, k)
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(RUNS_DIR, f"g{key['generation']}_{model}_{digest}.run")
 
-    def evaluate(self, k=10, output_csv=True):
+        rankings, texts = {}, {}
+        if use_cache and os.path.exists(path) and os.path.exists(path + ".json"):
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                texts = json.load(f)["queries"]
+            rankings = read_run(path)
+        missing = [q for q in self.queries if texts.get(q["id"]) != q["text"]]
+        if missing:
+            batch = self.engine.search_many([q["text"] for q in missing], k=k, model=model,
+                                            snippets=False, workers=workers)
+            for q, results in zip(missing, batch):
+                rankings[q["id"]] = [(str(res["id"]), res["score"]) for res in results]
+                texts[q["id"]] = q["text"]
+            write_run(path, rankings, texts, key, tag=model)
+        print(f"  {len(self.queries) - len(missing)} queries from the cached run, {len(missing)} ranked")
+        return {q["id"]: rankings.get(q["id"], []) for q in self.queries}
+
+    def evaluate(self, k=10, output_csv=True, models=None, workers=1, use_cache=True):
+        """
+        Evaluates each model on the ground truth queries. Rankings are
+        batched (and cached as run files, see run()); all the metrics of a
+        query, and its precision/recall curve, come from one pass over its
+        ranking.
+        """
         print(f"Running evaluation with K={k}...\n")
         
         results_data = []
         curve_data = []
 
-        models: list[str] = ['bm25', 'tfidf']
+        models = models or self.models
 
         for model_name in models:
             print(f"--- Evaluating Model: {model_name} ---")
+            run = self.run(model_name, k, workers, use_cache)
             for q in self.queries:
-                results = self.engine.search(q["text"], k=k, model=model_name)
-                retrieved_ids = [str(res["id"]) for res in results]
-                retrieved_set = set(retrieved_ids)
-                
+                retrieved_ids = [doc_id for doc_id, _ in run[q["id"]]]
+                metrics, curve = ranking_metrics(retrieved_ids, q["relevant"], k)
+
                 # --- Curve Calculation (P@i, R@i for i=1..k) ---
-                for i in range(1, k + 1):
-                    subset_ids = retrieved_ids[:i]
-                    relevant_in_subset = len(set(subset_ids).intersection(q["relevant"]))
-                    
-                    p_at_i = relevant_in_subset / i
-                    r_at_i = relevant_in_subset / len(q["relevant"]) if q["relevant"] else 0
-                    
+                for i, (p_at_i, r_at_i) in enumerate(curve, 1):
                     curve_data.append({
                         "query_id": q["id"],
                         "query": q["text"],
@@ -92,34 +205,13 @@ class Evaluator:
                         "recall": r_at_i,
                         "model": model_name
                     })
-                # ---------------------------------------------
-                
-                # Intersection (for global metrics at k)
-                relevant_retrieved = retrieved_set.intersection(q["relevant"])
-                
-                # Basic Metrics
-                precision = len(relevant_retrieved) / k if k > 0 else 0
-                recall = len(relevant_retrieved) / len(q["relevant"]) if q["relevant"] else 0
-                
-                f_measure = 0
-                if (precision + recall) > 0:
-                    f_measure = (2 * precision * recall) / (precision + recall)
-                
-                # Advanced Metrics
-                ap = self.calculate_ap(retrieved_ids, q["relevant"])
-                rr = self.calculate_rr(retrieved_ids, q["relevant"])
 
                 results_data.append({
                     "query": q["text"],
                     "model": model_name,
                     "retrieved": len(retrieved_ids),
                     "relevant": len(q["relevant"]),
-                    "relevant_retrieved": len(relevant_retrieved),
-                    "precision": precision,
-                    "recall": recall,
-                    "f_measure": f_measure,
-                    "ap": ap,
-                    "rr": rr
+                    **metrics
                 })
 
         # Output to CSV if requested
@@ -148,9 +240,22 @@ class Evaluator:
         print("-" * 75)
         for res in results_data:
             print(f"{res['query']:<25} | {res['precision']:.4f} | {res['recall']:.4f} | {res['f_measure']:.4f} | {res['ap']:.4f} | {res['rr']:.4f}")
+        for model_name in models:
+            rows = [res for res in results_data if res["model"] == model_name]
+            if rows:
+                print(f"{model_name}: MAP {sum(res['ap'] for res in rows) / len(rows):.4f}, "
+                      f"MRR {sum(res['rr'] for res in rows) / len(rows):.4f} ({len(rows)} queries)")
             
         return results_data
 
 if __name__ == "__main__":
-    evaluator = Evaluator()
-    evaluator.evaluate(k=10)
+    parser = argparse.ArgumentParser(description="Evaluates the search engine on the ground truth queries")
+    parser.add_argument("--k", type=int, default=10, help="rank cutoff")
+    parser.add_argument("--models", nargs="+", default=MODELS, help="ranking models to evaluate (bm25, tfidf, bm25f)")
+    parser.add_argument("--workers", type=int, default=1, help="ranking processes (search_many)")
+    parser.add_argument("--qrels", help="TREC qrels file (relevance judgments) instead of relevant_doc_ids")
+    parser.add_argument("--no-cache", action="store_true", help=f"rank every query again (ignore the run files of {RUNS_DIR})")
+    args = parser.parse_args()
+
+    evaluator = Evaluator(models=args.models, qrels_file=args.qrels)
+    evaluator.evaluate(k=args.k, workers=args.workers, use_cache=not args.no_cache)
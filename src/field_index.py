@@ -0,0 +1,63 @@
+import json
+import os
+
+try:
+    from src.publish import write_json
+except ImportError:
+    from publish import write_json
+
+# index des champs courts des documents, pour le modele bm25f : pour chaque
+# champ, ses postings term -> {doc_id: freq} et la longueur (en tokens) du
+# champ de chaque document. Le contenu reste l'index principal ; le titre et
+# le resume, bien plus courts, sont ecrits en JSON a cote de lui
+# (data/fields.json) et mis a jour par les segments comme lui.
+FIELDS_FILENAME = "fields.json"
+INDEXED_FIELDS = ("title", "summary")
+# poids BM25F par defaut : un terme du titre compte trois fois un terme du contenu
+FIELD_WEIGHTS = {"content": 1.0, "title": 3.0, "summary": 1.5}
+
+
+def fields_file(index_file):
+    """Path of the field index saved next to an index file"""
+    return os.path.join(os.path.dirname(index_file), FIELDS_FILENAME)
+
+
+def new_fields():
+    return {name: {"inverted_index": {}, "doc_lengths": {}} for name in INDEXED_FIELDS}
+
+
+def index_fields(fields, doc_id, doc, preprocessor):
+    """Adds the title and summary terms of a document to a new_fields() dict"""
+    for name in INDEXED_FIELDS:
+        tokens = preprocessor.process(doc.get(name) or "")
+        field = fields[name]
+        field["doc_lengths"][doc_id] = len(tokens)
+        inverted_index = field["inverted_index"]
+        for term in tokens:
+            postings = inverted_index.setdefault(term, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+
+
+def read_fields(path):
+    """Field indexes saved by the indexer, or None (index built before them)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["fields"]
+
+
+def write_fields(path, fields):
+    write_json(path, {"fields": fields})
+
+
+def field_segments(segments, name):
+    """Index segments restricted to one field, for segments.apply_segments"""
+    return [
+        {
+            "inverted_index": segment.get("fields", {}).get(name, {}).get("inverted_index", {}),
+            "doc_lengths": segment.get("fields", {}).get(name, {}).get("doc_lengths", {}),
+            "doc_map": {},
+            "deleted": segment["deleted"],
+        }
+        for segment in segments
+    ]
@@ -0,0 +1,218 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from contextlib import contextmanager
+
+try:
+    from src.binary_index import _to_bytes
+    from src.publish import atomic_path, write_json
+except ImportError:
+    from binary_index import _to_bytes
+    from publish import atomic_path, write_json
+
+# index "par document" (snippets, positions) : un fichier d'enregistrements en
+# ajout seul et une table JSON doc_id -> [position, longueur de chaque partie].
+# Le repertoire des termes d'un document est :
+#   nb termes, offsets des termes (n + 1), offsets des donnees (n + 1),
+#   donnees de chaque terme, termes utf-8 tries (recherche dichotomique)
+UINT32 = struct.Struct("<I")
+UINT32_PAIR = struct.Struct("<II")
+
+
+def encode_term_block(payloads):
+    """{term: bytes} -> term directory of one document"""
+    terms = sorted(payloads, key=lambda term: term.encode("utf-8"))
+    encoded_terms = [term.encode("utf-8") for term in terms]
+    term_offsets = array("I", [0])
+    data_offsets = array("I", [0])
+    for term, raw in zip(terms, encoded_terms):
+        term_offsets.append(term_offsets[-1] + len(raw))
+        data_offsets.append(data_offsets[-1] + len(payloads[term]))
+    return (UINT32.pack(len(terms)) + _to_bytes(term_offsets) + _to_bytes(data_offsets)
+            + b"".join(payloads[term] for term in terms) + b"".join(encoded_terms))
+
+
+def find_term_payloads(buffer, base, terms):
+    """{term: bytes} of the given terms in the term directory at `base`"""
+    n_terms = UINT32.unpack_from(buffer, base)[0]
+    term_offsets = base + 4
+    data_offsets = term_offsets + 4 * (n_terms + 1)
+    data = data_offsets + 4 * (n_terms + 1)
+    blob = data + UINT32.unpack_from(buffer, data_offsets + 4 * n_terms)[0]
+
+    def term_at(number):
+        start, end = UINT32_PAIR.unpack_from(buffer, term_offsets + 4 * number)
+        return buffer[blob + start:blob + end]
+
+    found = {}
+    for term in terms:
+        if term in found:
+            continue
+        raw = term.encode("utf-8")
+        low, high = 0, n_terms
+        while low < high:
+            middle = (low + high) // 2
+            if term_at(middle) < raw:
+                low = middle + 1
+            else:
+                high = middle
+        if low < n_terms and term_at(low) == raw:
+            start, end = UINT32_PAIR.unpack_from(buffer, data_offsets + 4 * low)
+            found[term] = buffer[data + start:data + end]
+    return found
+
+
+class MappedFile:
+    """
+    Data file (self.data_file) read through mmap, shared by RecordFile and
+    DocumentStore. After N compactions the data file is base_file with a .N
+    suffix, named in the table that points into it.
+    """
+
+    _mm = None
+
+    def _data_file(self, compactions):
+        if not compactions:
+            return self.base_file
+        root, ext = os.path.splitext(self.base_file)
+        return f"{root}.{compactions}{ext}"
+
+    def _map(self, end):
+        """mmap of the data file covering at least `end` bytes (remapped after appends)"""
+        if self._mm is None or len(self._mm) < end:
+            with open(self.data_file, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+
+class RecordFile(MappedFile):
+    """
+    Append-only file of per-document records (each made of byte parts),
+    read through mmap. Subclasses set the file names, MAGIC and VERSION.
+    """
+
+    MAGIC = b""
+    VERSION = 1
+
+    def __init__(self, data_file, index_file):
+        self.base_file = data_file
+        self.data_file = data_file # fichier de donnees courant (base_file.N apres N compactages)
+        self.index_file = index_file
+        self.records = {} # doc_id -> [position, longueur de chaque partie...]
+        self.compactions = 0
+        self._load()
+
+    def _load(self):
+        """Reads the table (and the name of the data file it points into)"""
+        self._mm = None
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        compactions = data.get("compactions", 0)
+        # un fichier d'une autre version est ignore (reconstruit au prochain build)
+        if data.get("version") == self.VERSION and os.path.exists(self._data_file(compactions)):
+            self.records = data["records"]
+            self.compactions = compactions
+            self.data_file = self._data_file(compactions)
+
+    def exists(self):
+        return os.path.exists(self.index_file) and os.path.exists(self.data_file)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.records
+
+    def part(self, doc_id, number):
+        """(mmap, start, end) of a part of a document record"""
+        record = self.records[doc_id]
+        start = record[0] + sum(record[1:number + 1])
+        end = start + record[number + 1]
+        try:
+            return self._map(end), start, end
+        except FileNotFoundError:
+            # compacte entre la lecture de la table et celle des donnees : on relit la table
+            data_file = self.data_file
+            self._load()
+            if self.data_file == data_file:
+                raise
+            return self.part(doc_id, number)
+
+    def _parts(self, record):
+        """Byte parts of a record (subclasses encode their own records)"""
+        return record
+
+    def _append(self, f, records):
+        for doc_id, record in records.items():
+            parts = self._parts(record)
+            self.records[doc_id] = [f.tell()] + [len(part) for part in parts]
+            for part in parts:
+                f.write(part)
+
+    @contextmanager
+    def writer(self):
+        """
+        Writes a new file record by record: yields add(doc_id, record), the
+        file replaces the old one when the block ends (streaming build).
+        """
+        self.records = {}
+        with atomic_path(self.data_file) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(self.MAGIC)
+                yield lambda doc_id, record: self._append(f, {doc_id: record})
+        self._mm = None
+        self._publish()
+
+    def write(self, records):
+        """Replaces the whole file with {doc_id: record}"""
+        with self.writer() as add:
+            for doc_id, record in records.items():
+                add(doc_id, record)
+
+    def update(self, records, deleted=()):
+        """Appends new records and drops deleted documents (incremental indexing)"""
+        for doc_id in deleted:
+            self.records.pop(doc_id, None)
+        with open(self.data_file, "ab") as f:
+            if f.tell() == 0:
+                f.write(self.MAGIC)
+            self._append(f, records)
+            f.flush()
+            os.fsync(f.fileno())
+        self._publish()
+
+    def compact(self):
+        """
+        Copies the live records to a new data file, then publishes the table
+        pointing to it and removes the old file, as DocumentStore.compact()
+        does. Nothing is done when no record was replaced or deleted.
+        """
+        if not self.exists():
+            return
+        live = sum(sum(record[1:]) for record in self.records.values())
+        if len(self.MAGIC) + live == os.path.getsize(self.data_file):
+            return
+        old_file = self.data_file
+        new_file = self._data_file(self.compactions + 1)
+        records = {}
+        with open(new_file, "wb") as f:
+            f.write(self.MAGIC)
+            for doc_id, record in sorted(self.records.items(), key=lambda item: item[1][0]):
+                start, end = record[0], record[0] + sum(record[1:])
+                records[doc_id] = [f.tell()] + record[1:]
+                f.write(self._map(end)[start:end])
+            f.flush()
+            os.fsync(f.fileno())
+        self.records = records
+        self.compactions += 1
+        self.data_file = new_file
+        self._mm = None
+        self._publish()
+        # les lecteurs qui ont deja projete l'ancien fichier le gardent jusqu'a leur fermeture
+        os.remove(old_file)
+
+    def _publish(self):
+        # la table est publiee apres les donnees qu'elle designe
+        write_json(self.index_file, {"version": self.VERSION, "compactions": self.compactions,
+                                     "records": self.records})
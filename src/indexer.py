@@ -1,81 +1,514 @@
+import argparse
+import functools
+import hashlib
 import json
+import multiprocessing
 import os
+import threading
 from preprocessing import Preprocessor
+from binary_index import write_binary_index
+from document_store import DocumentStore
+from field_index import fields_file, index_fields, new_fields, read_fields, write_fields
+from positional_index import POSITIONS_FILE, PositionalIndex, token_positions
+from publish import atomic_path, bump_generation, write_json
+from ranking import compute_idf, compute_term_bounds
+from snippet_index import SNIPPETS_FILE, SnippetIndex, token_offsets, write_snippet_index
+from segments import clear_segments, list_segments, new_segment, read_segments, segments_dir, write_segment
+from sharding import SHARDS_DIR, read_shards, write_shards
 
 DATA_DIR = os.path.join("data", "documents")
 INDEX_FILE = os.path.join("data", "index.json")
+INDEX_BIN_FILE = os.path.join("data", "index.bin")
+# fichier (ou doc_id du magasin) -> {doc_id, mtime, hash} des documents deja indexes
+# (index de base + segments) ; pour le magasin, "mtime" est la position de l'enregistrement
+MANIFEST_FILE = os.path.join("data", "manifest.json")
+# au-dela de ce nombre de segments, sync() lance une fusion en arriere-plan
+MERGE_THRESHOLD = 8
+# preprocesseur propre a chaque processus de build_index(workers > 1)
+_worker_preprocessor = None
+# magasin de documents du processus (voir _open_store)
+_store = None
+
+
+def _open_store():
+    """The document store if documents were migrated to it, else None (one JSON file per document)"""
+    global _store
+    if _store is None:
+        _store = DocumentStore()
+    _store.refresh()
+    return _store if _store.exists() else None
+
+
+def _list_documents(store):
+    """{key: stamp} of the documents to index: doc ids and record offsets of the
+    store, or file names and mtimes of DATA_DIR"""
+    if store is not None:
+        return {doc_id: record[0] for doc_id, record in store.records.items()}
+    if not os.path.exists(DATA_DIR):
+        return {}
+    return {f: os.path.getmtime(os.path.join(DATA_DIR, f)) for f in os.listdir(DATA_DIR) if f.endswith(".json")}
+
+
+def _read_document(key, store):
+    """(document, path, manifest entry) of a store record or of a file of DATA_DIR"""
+    if store is not None:
+        doc = store.get(key)
+        entry = {"doc_id": str(doc["id"]), "mtime": store.records[key][0], "hash": store.content_hash(key)}
+        return doc, store.path(key), entry
+    filepath = os.path.join(DATA_DIR, key)
+    #rb ici pour *read* (octets bruts, pour le hash du contenu)
+    with open(filepath, "rb") as f:
+        raw = f.read()
+    doc = json.loads(raw)
+    entry = {"doc_id": str(doc["id"]), "mtime": os.path.getmtime(filepath), "hash": hashlib.sha1(raw).hexdigest()}
+    return doc, key, entry
+
+
+def _index_shard(keys, preprocessor=None, positions=False):
+    """
+    Reads and preprocesses a shard of documents (file names, or doc ids
+    when the document store is used), see _index_documents.
+    """
+    store = _open_store()
+    return _index_documents(((key,) + _read_document(key, store) for key in keys), preprocessor, positions)
+
+
+def _index_documents(items, preprocessor=None, positions=False):
+    """
+    Preprocesses (key, document, path, manifest entry) items.
+    Returns a partial index (inverted_index, doc_lengths, doc_map), the
+    (doc_id, title, length) of each document, in order, their manifest
+    entries, their snippet records (text and term offsets), with
+    positions=True the token positions of their terms, and the partial
+    index of their title and summary fields (field_index.new_fields()).
+    """
+    global _worker_preprocessor
+    if preprocessor is None:
+        if _worker_preprocessor is None:
+            _worker_preprocessor = Preprocessor()
+        preprocessor = _worker_preprocessor
+
+    inverted_index = {}
+    doc_lengths = {}
+    doc_map = {}
+    documents = []
+    manifest = {}
+    snippets = {}
+    term_positions = {}
+    fields = new_fields()
+    for key, doc, path, entry in items:
+        #prendre les cordonnées de chaque document   
+        doc_id = str(doc["id"]) 
+        content = doc["content"]
+        title = doc["title"]
+        
+        #ces cordonnées seront stockées dans le doc_map
+        doc_map[doc_id] = {"title": title, "path": path}
+        manifest[key] = entry
+        
+        #appel des methodes de preprocessing (avec la position de chaque token pour les snippets)
+        tokens, offsets = preprocessor.process_with_offsets(content)
+        snippets[doc_id] = token_offsets(content, tokens, offsets)
+        if positions:
+            term_positions[doc_id] = token_positions(tokens)
+        doc_lengths[doc_id] = len(tokens)
+        documents.append((doc_id, title, len(tokens)))
+        # titre et resume : postings et longueurs propres a chaque champ (bm25f)
+        index_fields(fields, doc_id, doc, preprocessor)
+        
+        # cette etape precise la forme de index.jsom , tel que donne un mot 
+        # et le nombre de fois qu'il apparaît dans un document
+        term_counts = {}
+        for term in tokens:
+            term_counts[term] = term_counts.get(term, 0) + 1
+        
+        for term, count in term_counts.items():
+            if term not in inverted_index:
+                inverted_index[term] = {}
+            inverted_index[term][doc_id] = count
+    return inverted_index, doc_lengths, doc_map, documents, manifest, snippets, term_positions, fields
+
+
+def _merge_postings(inverted_index, postings_by_term):
+    for term, postings in postings_by_term.items():
+        if term not in inverted_index:
+            inverted_index[term] = {}
+        inverted_index[term].update(postings)
+
+
+def _drop_postings(inverted_index, doc_ids):
+    for term in list(inverted_index):
+        postings = inverted_index[term]
+        for doc_id in doc_ids:
+            postings.pop(doc_id, None)
+        if not postings:
+            del inverted_index[term]
+
+
+def file_hash(filepath):
+    with open(filepath, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _document_hash(key, store):
+    if store is not None:
+        return store.content_hash(key)
+    return file_hash(os.path.join(DATA_DIR, key))
+
 # c'est 3 eme partie de la recherche
 class Indexer:
-    def __init__(self):
+    def __init__(self, positions=None, shards=None):
         self.preprocessor = Preprocessor()
         self.inverted_index = {} # term -> {doc_id: freq, ...}
         self.doc_lengths = {}    # doc_id -> int (number of tokens)
         self.doc_map = {}        # doc_id -> filepath or title (for quick lookup)
+        self.fields = new_fields() # champ -> {inverted_index, doc_lengths} du titre et du resume
         self.total_docs = 0
         self.avg_doc_length = 0
+        self.idf = {}            # model -> {term: idf}, precalcule pour le moteur
+        self.term_bounds = {}    # term -> [max_tf, min_dl], pour l'elagage du top-k
+        self.manifest = {}       # fichier -> {doc_id, mtime, hash}
+        self.snippet_records = {} # doc_id -> (texte, offsets des termes), pas encore ecrits
+        # index positionnel (requetes "entre guillemets" et proximite) ;
+        # None : comme l'index existant, donc maintenu une fois active
+        self.positions = PositionalIndex().exists() if positions is None else positions
+        self.position_records = {} # doc_id -> {terme: positions}, pas encore ecrits
+        # nombre de partitions ecrites par save_index (0 : index unique) ;
+        # None : autant que la partition existante
+        if shards is None:
+            existing = read_shards()
+            shards = len(existing[0]) if existing else 0
+        self.shards = shards
+        self._lock = threading.RLock() # une seule ecriture (segment ou fusion) a la fois
 
-    def build_index(self):
-        if not os.path.exists(DATA_DIR):
+    def build_index(self, workers=1):
+        """
+        Builds the index from DATA_DIR (or the document store once
+        documents were migrated to it). With workers > 1 the file list is
+        split in contiguous shards processed by a pool of processes, each
+        building a partial index; partials are merged in shard order so the
+        result is the same as the serial build.
+        """
+        store = _open_store()
+        if store is None and not os.path.exists(DATA_DIR):
             return
-        #l'appel des document 
-        files = [f for f in os.listdir(DATA_DIR) if f.endswith(".json")]
+        #l'appel des document (fichiers de DATA_DIR ou enregistrements du magasin)
+        files = list(_list_documents(store))
         self.total_docs = len(files)
-        total_length = 0
 
-        for filename in files:
-            filepath = os.path.join(DATA_DIR, filename)
-            #r ici pour *read*
-            with open(filepath, "r", encoding="utf-8") as f:
-                doc = json.load(f)
-            #prendre les cordonnées de chaque document   
-            doc_id = str(doc["id"]) 
-            content = doc["content"]
-            title = doc["title"]
-            
-            #ces cordonnées seront stockées dans le doc_map
-            self.doc_map[doc_id] = {"title": title, "path": filename}
-            
-            #appel des methodes de preprocessing
-            tokens = self.preprocessor.process(content)
-            length = len(tokens)
-            self.doc_lengths[doc_id] = length
-            total_length += length
-            
-            # cette etape precise la forme de index.jsom , tel que donne un mot 
-            # et le nombre de fois qu'il apparaît dans un document
-            term_counts = {}
-            for term in tokens:
-                term_counts[term] = term_counts.get(term, 0) + 1
-            
-            for term, count in term_counts.items():
-                if term not in self.inverted_index:
-                    self.inverted_index[term] = {}
-                self.inverted_index[term][doc_id] = count
-                
-            print(f"  Indexed document {doc_id}: {title} ({length} tokens)")
+        if workers > 1 and len(files) > 1:
+            size = -(-len(files) // workers)
+            shards = [files[i:i + size] for i in range(0, len(files), size)]
+            with multiprocessing.Pool(len(shards)) as pool:
+                partials = pool.map(functools.partial(_index_shard, positions=self.positions), shards)
+        else:
+            partials = [_index_shard(files, self.preprocessor, self.positions)]
+
+        total_length = 0
+        for partial in partials:
+            total_length += self._merge_partial(partial)
+        self._finish_build(total_length)
 
+    def _finish_build(self, total_length):
+        """Stats, idf and term bounds of a freshly built index"""
         if self.total_docs > 0:
             self.avg_doc_length = total_length / self.total_docs
+        # l'idf ne depend que de l'index : on le calcule une fois ici
+        self.idf = compute_idf(self.inverted_index, self.total_docs)
+        self.term_bounds = compute_term_bounds(self.inverted_index, self.doc_lengths)
         
         print(f"Index built. Terms: {len(self.inverted_index)}, Docs: {self.total_docs}, Avg Len: {self.avg_doc_length:.2f}")
 
-    def save_index(self):
+    def _merge_partial(self, partial):
+        """Adds a partial index to this one, returns its total token count"""
+        inverted_index, doc_lengths, doc_map, documents, manifest, snippets, term_positions, fields = partial
+        _merge_postings(self.inverted_index, inverted_index)
+        for name, field in fields.items():
+            target = self.fields.setdefault(name, {"inverted_index": {}, "doc_lengths": {}})
+            _merge_postings(target["inverted_index"], field["inverted_index"])
+            target["doc_lengths"].update(field["doc_lengths"])
+        self.doc_lengths.update(doc_lengths)
+        self.doc_map.update(doc_map)
+        self.manifest.update(manifest)
+        self.snippet_records.update(snippets)
+        self.position_records.update(term_positions)
+
+        total_length = 0
+        for doc_id, title, length in documents:
+            total_length += length
+            print(f"  Indexed document {doc_id}: {title} ({length} tokens)")
+        return total_length
+
+    def _remove_documents(self, doc_ids):
+        """Drops documents from the postings, doc lengths and doc map (and from the fields)"""
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return
+        _drop_postings(self.inverted_index, doc_ids)
+        for field in self.fields.values():
+            _drop_postings(field["inverted_index"], doc_ids)
+            for doc_id in doc_ids:
+                field["doc_lengths"].pop(doc_id, None)
+        for doc_id in doc_ids:
+            self.doc_lengths.pop(doc_id, None)
+            self.doc_map.pop(doc_id, None)
+
+    def _update_stats(self):
+        self.total_docs = len(self.doc_lengths)
+        self.avg_doc_length = sum(self.doc_lengths.values()) / self.total_docs if self.total_docs else 0
+
+    def load_index(self):
+        """
+        Loads the saved index (index.json, its segments and the manifest) to
+        apply incremental changes on top of it. Returns False if there is none.
+        """
+        if not os.path.exists(INDEX_FILE):
+            return False
+        with open(INDEX_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.inverted_index = data["inverted_index"]
+        self.doc_lengths = data["doc_lengths"]
+        self.doc_map = data["doc_map"]
+        self.total_docs = data["stats"]["total_docs"]
+        self.avg_doc_length = data["stats"]["avg_doc_length"]
+        self.idf = data.get("idf", {})
+        self.term_bounds = data.get("term_bounds", {})
+        fields = read_fields(fields_file(INDEX_FILE))
+        self.fields = fields if fields is not None else new_fields()
+
+        segments = read_segments(segments_dir(INDEX_FILE))
+        for segment in segments:
+            self._remove_documents(segment["deleted"])
+            self._merge_partial((segment["inverted_index"], segment["doc_lengths"], segment["doc_map"], [], {}, {}, {},
+                                 segment.get("fields", {})))
+        if segments:
+            self._update_stats()
+            self.idf, self.term_bounds = {}, {}
+
+        # sans manifeste (index construit avant), sync() reindexe tous les fichiers une fois
+        self.manifest = {}
+        if os.path.exists(MANIFEST_FILE):
+            with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        if fields is None:
+            # index construit avant l'index des champs : sync() reindexe aussi tout une fois, pour le remplir
+            self.manifest = {}
+        return True
+
+    def _save_shards(self):
+        """Rewrites the shards from the in-memory index (global idf and stats of the whole index)"""
+        stats = {"total_docs": self.total_docs, "avg_doc_length": self.avg_doc_length}
+        idf = self.idf or compute_idf(self.inverted_index, self.total_docs)
+        names = write_shards(self.shards, self.inverted_index, self.doc_lengths, self.doc_map, stats, idf)
+        print(f"Index split in {len(names)} shards in {SHARDS_DIR}")
+
+    def _save_manifest(self):
+        write_json(MANIFEST_FILE, self.manifest)
+
+    def _apply_changes(self, filenames, removed_ids=()):
+        """
+        (Re)indexes files and removes documents, patching the in-memory index
+        and the stats, then writes the change as a new segment. The base index
+        file is not rewritten. Returns the list of active segments.
+        """
+        if self.positions and not self.position_records and not PositionalIndex().exists():
+            # les documents deja indexes n'auraient pas de positions : une
+            # phrase ne trouverait plus que les documents modifies
+            raise ValueError(f"{POSITIONS_FILE} does not exist: rebuild the index with positions first")
+        with self._lock:
+            stale = list(removed_ids)
+            for filename in filenames:
+                entry = self.manifest.pop(filename, None)
+                if entry is not None:
+                    stale.append(entry["doc_id"])
+            for filename in [f for f, entry in self.manifest.items() if entry["doc_id"] in removed_ids]:
+                del self.manifest[filename]
+
+            partial = _index_shard(filenames, self.preprocessor, self.positions)
+            # un document reindexe remplace entierement son ancienne version
+            stale += [doc_id for doc_id in partial[1] if doc_id in self.doc_lengths]
+            stale = [doc_id for doc_id in dict.fromkeys(stale) if doc_id in self.doc_lengths]
+
+            self._remove_documents(stale)
+            self._merge_partial(partial)
+            self._update_stats()
+            # idf et bornes sont recalcules a la fusion
+            self.idf, self.term_bounds = {}, {}
+
+            segment = new_segment()
+            segment["inverted_index"], segment["doc_lengths"], segment["doc_map"] = partial[:3]
+            segment["fields"] = partial[7]
+            segment["deleted"] = stale
+            names = write_segment(segments_dir(INDEX_FILE), segment)
+            SnippetIndex().update(self.snippet_records, stale)
+            self.snippet_records = {}
+            if self.positions:
+                PositionalIndex().update(self.position_records, stale)
+                self.position_records = {}
+            if self.shards:
+                # les shards ne lisent pas les segments : on les reecrit avant la publication
+                self._save_shards()
+            self._save_manifest()
+            bump_generation(os.path.dirname(INDEX_FILE))
+        return names
+
+    def add_document(self, filename):
+        """Indexes one file of DATA_DIR, or one doc id of the document store
+        (replaces the document if its id is already indexed)"""
+        self._apply_changes([filename])
+
+    def update_document(self, filename):
+        """Reindexes one modified document (file name or doc id of the store)"""
+        self._apply_changes([filename])
+
+    def delete_document(self, doc_id):
+        """Removes a document from the index by its id"""
+        self._apply_changes([], [str(doc_id)])
+
+    def sync(self):
+        """
+        Indexes the changes of DATA_DIR (or of the document store) since the
+        last build or sync, as one segment. Documents are compared to the
+        manifest: one whose mtime (record offset) moved is only reindexed if
+        its content hash changed. Merges the segments in
+        the background once there are MERGE_THRESHOLD of them.
+        Returns the number of (added, updated, deleted) files.
+        """
+        with self._lock:
+            store = _open_store()
+            files = _list_documents(store)
+            added, updated = [], []
+            touched = False
+            for filename, mtime in files.items():
+                entry = self.manifest.get(filename)
+                if entry is None:
+                    added.append(filename)
+                    continue
+                if entry["mtime"] != mtime:
+                    if _document_hash(filename, store) != entry["hash"]:
+                        updated.append(filename)
+                    else:
+                        entry["mtime"] = mtime
+                        touched = True
+            deleted = [filename for filename in self.manifest if filename not in files]
+
+            if added or updated or deleted:
+                removed_ids = [self.manifest[filename]["doc_id"] for filename in deleted]
+                for filename in deleted:
+                    del self.manifest[filename]
+                names = self._apply_changes(added + updated, removed_ids)
+                if len(names) >= MERGE_THRESHOLD:
+                    self.merge_segments(background=True)
+            elif touched:
+                self._save_manifest()
+        print(f"Index synced. Added: {len(added)}, Updated: {len(updated)}, Deleted: {len(deleted)}")
+        return len(added), len(updated), len(deleted)
+
+    def merge_segments(self, background=False):
+        """
+        Folds the segments into the base index files (rewritten from the
+        in-memory index). With background=True the merge runs in a thread,
+        which is returned; sync() calls wait for it to finish.
+        """
+        if background:
+            thread = threading.Thread(target=self.merge_segments)
+            thread.start()
+            return thread
+        with self._lock:
+            if not list_segments(segments_dir(INDEX_FILE)):
+                return None
+            # les mises a jour ajoutent des enregistrements sans retirer les anciens
+            SnippetIndex().compact()
+            PositionalIndex().compact()
+            self.save_index()
+        return None
+
+    def save_index(self, fmt=None):
+        """
+        Saves the index to disk. fmt is "json" (readable export),
+        "bin" (memory-mapped format used by the search engine) or "both";
+        by default "both" when an index.bin exists (the engine reads it
+        first), else "json". With fmt="json" an existing index.bin is removed.
+        The saved index contains every change: segments are dropped.
+        """
+        if fmt is None:
+            fmt = "both" if os.path.exists(INDEX_BIN_FILE) else "json"
+        if not self.idf and self.inverted_index:
+            self.idf = compute_idf(self.inverted_index, self.total_docs)
+            self.term_bounds = compute_term_bounds(self.inverted_index, self.doc_lengths)
+
+        if self.snippet_records:
+            # apres build_index : tous les documents (la fusion ne reecrit pas les snippets)
+            write_snippet_index(self.snippet_records)
+            self.snippet_records = {}
+            print(f"Snippet index saved to {SNIPPETS_FILE}")
+        if self.position_records:
+            PositionalIndex().write(self.position_records)
+            self.position_records = {}
+            print(f"Positional index saved to {POSITIONS_FILE}")
+        # avant l'index principal : un moteur qui recharge trouve les champs a jour
+        write_fields(fields_file(INDEX_FILE), self.fields)
+        print(f"Field index saved to {fields_file(INDEX_FILE)}")
+        if self.shards:
+            self._save_shards()
+
+        if fmt in ("bin", "both"):
+            stats = {"total_docs": self.total_docs, "avg_doc_length": self.avg_doc_length}
+            with atomic_path(INDEX_BIN_FILE) as tmp_path:
+                write_binary_index(tmp_path, self.inverted_index, self.doc_lengths, self.doc_map, stats,
+                                   self.idf, self.term_bounds)
+            print(f"Index saved to {INDEX_BIN_FILE}")
+        if fmt not in ("json", "both"):
+            bump_generation(os.path.dirname(INDEX_BIN_FILE))
+            return
+
+        # l'indexeur recharge index.json : les segments ne sont supprimes qu'une fois celui-ci a jour
         data = {
             "inverted_index": self.inverted_index,
             "doc_lengths": self.doc_lengths,
             "doc_map": self.doc_map,
+            "idf": self.idf,
+            "term_bounds": self.term_bounds,
             "stats": {
                 "total_docs": self.total_docs,
                 "avg_doc_length": self.avg_doc_length
             }
         }
         
-        with open(INDEX_FILE, "w", encoding="utf-8") as f:
-            #dump permet d'crire dans un fichier json
-            json.dump(data, f, ensure_ascii=False) 
+        # ecriture dans un fichier temporaire puis renommage : un moteur qui
+        # recharge l'index ne lit jamais un fichier a moitie ecrit
+        with atomic_path(INDEX_FILE) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                #dump permet d'crire dans un fichier json
+                json.dump(data, f, ensure_ascii=False) 
         print(f"Index saved to {INDEX_FILE}")
+        if fmt == "json" and os.path.exists(INDEX_BIN_FILE):
+            # le moteur le lirait avant index.json
+            os.remove(INDEX_BIN_FILE)
+        self._save_manifest()
+        clear_segments(segments_dir(INDEX_FILE))
+        # en dernier : les moteurs qui surveillent l'index rechargent a ce moment
+        bump_generation(os.path.dirname(INDEX_FILE))
 
 if __name__ == "__main__":
-    indexer = Indexer()
-    indexer.build_index()
-    indexer.save_index()
+    parser = argparse.ArgumentParser(description="Builds the inverted index")
+    parser.add_argument("--workers", type=int, default=1, help="number of indexing processes")
+    parser.add_argument("--update", action="store_true", help="only index the changes since the last run")
+    parser.add_argument("--merge", action="store_true", help="fold the segments into the base index")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="also write the index as N partitions (sharding.ShardedSearchEngine)")
+    parser.add_argument("--positions", action="store_true",
+                        help="also store token positions (phrase queries and proximity boost)")
+    args = parser.parse_args()
+
+    indexer = Indexer(positions=True if args.positions else None, shards=args.shards)
+    if (args.update or args.merge) and indexer.load_index():
+        if args.update:
+            if args.positions and not PositionalIndex().exists():
+                parser.error("this index has no positions: rebuild it with indexer.py --positions")
+            indexer.sync()
+        if args.merge:
+            indexer.merge_segments()
+    else:
+        indexer.build_index(workers=args.workers)
+        indexer.save_index(fmt="both")
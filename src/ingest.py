@@ -0,0 +1,250 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+
+try:
+    from src.data_collector import WikipediaBackend, collect_documents, metadata_row, write_metadata
+    from src.document_store import save_document
+    from src.indexer import (DATA_DIR, Indexer, _index_documents, _list_documents, _open_store,
+                             _read_document, file_hash)
+    from src.positional_index import PositionalIndex
+    from src.snippet_index import SnippetIndex
+except ImportError:
+    from data_collector import WikipediaBackend, collect_documents, metadata_row, write_metadata
+    from document_store import save_document
+    from indexer import DATA_DIR, Indexer, _index_documents, _list_documents, _open_store, _read_document, file_hash
+    from positional_index import PositionalIndex
+    from snippet_index import SnippetIndex
+
+# ingestion en flux : les documents nouveaux (collecteur ou export JSON lines)
+# sont enregistres, pretraites et indexes au fil de l'eau, puis les documents
+# deja presents sont relus une fois ; snippets, positions et metadata.csv sont
+# ecrits dans la meme passe. Des files bornees relient les etapes : la memoire
+# garde l'index, pas le corpus.
+INGEST_QUEUE_SIZE = 16 # lots en attente entre deux etapes
+INGEST_BATCH = 32 # documents par lot de pretraitement
+
+_DONE = object()
+
+
+class _StageError:
+    """Exception of a stage thread, passed down the queues to the caller"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    # une file pleine ne bloque pas un arret demande par une autre etape
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def read_jsonl(path):
+    """Documents of a JSON lines file, one at a time"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _max_doc_id(store):
+    if store is not None:
+        ids = [int(doc_id) for doc_id in store.ids() if doc_id.isdigit()]
+    elif os.path.exists(DATA_DIR):
+        ids = [int(match.group(1)) for match in map(re.compile(r"doc_(\d+)\.json$").match, os.listdir(DATA_DIR))
+               if match]
+    else:
+        ids = []
+    return max(ids, default=0)
+
+
+def number_documents(documents, store):
+    """Gives the documents without an "id" the next free ids"""
+    next_id = None
+    for document in documents:
+        if "id" not in document:
+            if next_id is None:
+                next_id = _max_doc_id(store) + 1
+            document = dict(document, id=next_id)
+            next_id += 1
+        yield document
+
+
+def _source_stage(documents, store, out, stop, rows):
+    """
+    Saves the new documents, then reads the documents already there (not
+    replaced), and passes them down in batches of (key, document, path,
+    manifest entry); the metadata rows are collected on the way.
+    """
+    try:
+        seen = set() # cles (fichier ou id du magasin) deja passees
+        seen_ids = set()
+        batch = []
+        for document in documents:
+            doc_id = str(document["id"])
+            if doc_id in seen_ids:
+                print(f"  Skipped document {doc_id}: id already ingested")
+                continue
+            seen_ids.add(doc_id)
+            filename = save_document(document, store, DATA_DIR)
+            if store is not None:
+                key = doc_id
+                entry = {"doc_id": key, "mtime": store.records[key][0], "hash": store.content_hash(key)}
+            else:
+                key = filename
+                filepath = os.path.join(DATA_DIR, filename)
+                entry = {"doc_id": doc_id, "mtime": os.path.getmtime(filepath), "hash": file_hash(filepath)}
+            seen.add(key)
+            rows.append(metadata_row(document))
+            batch.append((key, document, filename, entry))
+            if len(batch) >= INGEST_BATCH:
+                if not _put(out, batch, stop):
+                    return
+                batch = []
+
+        for key in _list_documents(store):
+            if key in seen:
+                continue
+            item = (key,) + _read_document(key, store)
+            rows.append(metadata_row(item[1]))
+            batch.append(item)
+            if len(batch) >= INGEST_BATCH:
+                if not _put(out, batch, stop):
+                    return
+                batch = []
+        if batch:
+            _put(out, batch, stop)
+        _put(out, _DONE, stop)
+    except Exception as e:
+        _put(out, _StageError(e), stop)
+
+
+def _preprocess_stage(source, out, stop, positions, pool):
+    """Preprocesses the batches into partial indexes, in order (in a process pool if given)"""
+    try:
+        while True:
+            batch = _get(source, stop)
+            if batch is _DONE or isinstance(batch, _StageError):
+                _put(out, batch, stop)
+                return
+            if pool is not None:
+                partial = pool.submit(_index_documents, batch, None, positions)
+            else:
+                partial = _index_documents(batch, None, positions)
+            if not _put(out, partial, stop):
+                return
+    except Exception as e:
+        _put(out, _StageError(e), stop)
+
+
+def ingest(documents=(), workers=1, positions=None, shards=None, fmt="both"):
+    """
+    Builds the index in a single pass: new documents (dicts with an id,
+    e.g. from collect_documents or read_jsonl) are saved in the store or
+    DATA_DIR and indexed as they arrive, then the documents already there
+    are read once. Snippet and positional indexes and metadata.csv are
+    written during the pass. workers > 1 preprocesses the batches in a pool
+    of processes. Returns the Indexer, its index saved like build_index.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    store = _open_store()
+    indexer = Indexer(positions=positions, shards=shards)
+    batches = queue.Queue(INGEST_QUEUE_SIZE)
+    # avec un pool, la file borne aussi le nombre de lots en cours de pretraitement
+    partials = queue.Queue(INGEST_QUEUE_SIZE if workers <= 1 else 2 * workers)
+    stop = threading.Event()
+    rows = []
+    pool = None
+    if workers > 1:
+        # les processus du pool demarrent a la demande, quand les threads des
+        # etapes tournent deja : un fork copierait leurs verrous dans l'etat
+        # du moment. forkserver (sinon spawn) part d'un processus sans threads.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method))
+    threads = [
+        threading.Thread(target=_source_stage, args=(documents, store, batches, stop, rows), daemon=True),
+        threading.Thread(target=_preprocess_stage, args=(batches, partials, stop, indexer.positions, pool),
+                         daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    total_length = 0
+    position_writer = PositionalIndex().writer() if indexer.positions else nullcontext()
+    try:
+        with SnippetIndex().writer() as add_snippet, position_writer as add_positions:
+            while True:
+                partial = _get(partials, stop)
+                if partial is _DONE:
+                    break
+                if isinstance(partial, _StageError):
+                    raise partial.error
+                if isinstance(partial, Future):
+                    partial = partial.result()
+                total_length += indexer._merge_partial(partial)
+                # snippets et positions vont directement dans leurs fichiers
+                for doc_id, record in indexer.snippet_records.items():
+                    add_snippet(doc_id, record)
+                indexer.snippet_records = {}
+                for doc_id, record in indexer.position_records.items():
+                    add_positions(doc_id, record)
+                indexer.position_records = {}
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    indexer.total_docs = len(indexer.doc_lengths)
+    indexer._finish_build(total_length)
+    write_metadata(rows)
+    indexer.save_index(fmt=fmt)
+    return indexer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collects or imports documents and indexes them in one pass")
+    parser.add_argument("--dump", help="JSON lines file of documents ({title, url, content, summary}, id optional)")
+    parser.add_argument("--collect", type=int, metavar="N", help="collect Wikipedia articles until N documents")
+    parser.add_argument("--topics", help="file of topics to collect, one per line (default: the built-in list)")
+    parser.add_argument("--rate", type=float, default=None, help="API requests per second of the collector")
+    parser.add_argument("--workers", type=int, default=1, help="preprocessing processes")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="also write the index as N partitions (sharding.ShardedSearchEngine)")
+    parser.add_argument("--positions", action="store_true",
+                        help="also store token positions (phrase queries and proximity boost)")
+    args = parser.parse_args()
+
+    documents = ()
+    if args.dump:
+        documents = number_documents(read_jsonl(args.dump), _open_store())
+    elif args.collect:
+        topics = None
+        if args.topics:
+            with open(args.topics, "r", encoding="utf-8") as f:
+                topics = [line.strip() for line in f if line.strip()]
+        options = {"rate": args.rate} if args.rate is not None else {}
+        documents = collect_documents(args.collect, topics, WikipediaBackend(), store=_open_store(), **options)
+    ingest(documents, workers=args.workers, positions=True if args.positions else None, shards=args.shards)
@@ -0,0 +1,106 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# instrumentation des requetes (SearchEngine(instrumentation=...)) : temps par
+# etape et compteurs d'une requete, rassembles dans une trace propre au thread
+# qui l'execute. Sans instrumentation, aucune trace n'existe et chaque point de
+# mesure se resume a un test "is None".
+TRACE_HISTORY = 100 # traces gardees pour l'affichage (Instrumentation.recent)
+TRACE_LOGGER = "search.trace"
+
+_NO_STAGE = nullcontext()
+
+
+class _TraceSlot(threading.local):
+    trace = None
+
+
+_slot = _TraceSlot()
+
+
+def current_trace():
+    """QueryTrace of the query running in this thread, or None (not instrumented)"""
+    return _slot.trace
+
+
+def stage(trace, name):
+    """trace.stage(name), or a context that does nothing without a trace"""
+    return _NO_STAGE if trace is None else trace.stage(name)
+
+
+class QueryTrace:
+    """Stage timings (seconds, summed over repeated stages) and counters of one query"""
+
+    __slots__ = ("query", "stages", "counters", "total")
+
+    def __init__(self, query):
+        self.query = query
+        self.stages = {}
+        self.counters = {}
+        self.total = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {
+            "query": self.query,
+            "total_ms": round(self.total * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+class Instrumentation:
+    """
+    Collects a QueryTrace per query of a SearchEngine and hands it, as a
+    dict, to each sink (a callable, e.g. a metrics callback or log_sink())
+    when the query ends. The last traces are kept in `recent`.
+    """
+
+    def __init__(self, sinks=(), history=TRACE_HISTORY):
+        self.sinks = list(sinks)
+        self.recent = deque(maxlen=history)
+        self._last = threading.local()
+
+    @contextmanager
+    def trace(self, query):
+        trace = QueryTrace(query)
+        previous = _slot.trace
+        _slot.trace = trace
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.total = time.perf_counter() - start
+            _slot.trace = previous
+            data = trace.as_dict()
+            self.recent.append(data)
+            self._last.trace = data
+            for sink in self.sinks:
+                sink(data)
+
+    def last_trace(self):
+        """Trace dict of the last query run by this thread, or None"""
+        return getattr(self._last, "trace", None)
+
+
+def log_sink(logger=None, level=logging.INFO):
+    """Sink writing each trace as a JSON line on a logger"""
+    logger = logger or logging.getLogger(TRACE_LOGGER)
+
+    def sink(data):
+        logger.log(level, json.dumps(data, ensure_ascii=False))
+    return sink
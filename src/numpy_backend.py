@@ -0,0 +1,107 @@
+import numpy as np
+
+try:
+    from src.result_cache import LRUCache
+except ImportError:
+    from result_cache import LRUCache
+
+# tableaux de postings gardes en memoire (par terme)
+ARRAYS_CACHE_SIZE = 4096
+
+
+class NumpyScorer:
+    """
+    Vectorized scoring backend for SearchEngine (backend="numpy").
+
+    Postings are held as NumPy arrays (document numbers + term frequencies
+    per term) and a whole query is scored with array operations, top-k being
+    selected with argpartition. The arithmetic is the same as the pure Python
+    path, in the same order, so scores and rankings are identical.
+    `engine` is the IndexSnapshot being scored (one scorer per snapshot).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.n_docs = len(engine.doc_ids)
+        self.doc_lengths = np.array([engine.doc_lengths.get(doc_id, 0) for doc_id in engine.doc_ids], dtype=np.float64)
+        self._arrays = LRUCache(ARRAYS_CACHE_SIZE)
+        self.update_norms()
+
+    def update_norms(self):
+        """k1 * (1 - b + b * dl / avgdl) for every document, as a float array"""
+        k1, b = self.engine.k1, self.engine.b
+        avgdl = self.engine.stats.get("avg_doc_length", 0)
+        if avgdl:
+            self.norms = k1 * (1 - b + b * (self.doc_lengths / avgdl))
+        else:
+            self.norms = np.full(self.n_docs, k1 * (1 - b))
+
+    def postings(self, term):
+        """(document numbers, frequencies) arrays of a term"""
+        arrays = self._arrays.get(term)
+        if arrays is not None:
+            return arrays
+
+        binary_index = self.engine.binary_index
+        if binary_index is not None:
+            # tableaux (numeros, frequences) deja decodes par l'index binaire
+            postings = binary_index.inverted_index.get(term)
+            if postings is None:
+                arrays = (np.zeros(0, dtype=np.intp), np.zeros(0))
+            else:
+                arrays = (np.frombuffer(postings.numbers, dtype=np.uint32).astype(np.intp),
+                          np.frombuffer(postings.freqs, dtype=np.uint32).astype(np.float64))
+        else:
+            numbers = self.engine.doc_numbers
+            postings = self.engine.inverted_index.get(term, {})
+            arrays = (np.fromiter((numbers[doc_id] for doc_id in postings), dtype=np.intp, count=len(postings)),
+                      np.fromiter(postings.values(), dtype=np.float64, count=len(postings)))
+        self._arrays.put(term, arrays)
+        return arrays
+
+    def impacts(self, term):
+        """(document numbers, bm25f scores) arrays of a term (IndexSnapshot.field_impacts)"""
+        key = ("bm25f", term)
+        arrays = self._arrays.get(key)
+        if arrays is not None:
+            return arrays
+        numbers = self.engine.doc_numbers
+        impacts = self.engine.field_impacts(term)
+        arrays = (np.fromiter((numbers[doc_id] for doc_id in impacts), dtype=np.intp, count=len(impacts)),
+                  np.fromiter(impacts.values(), dtype=np.float64, count=len(impacts)))
+        self._arrays.put(key, arrays)
+        return arrays
+
+    def score(self, query_terms, model):
+        """Returns (scores, matched) arrays over all documents"""
+        scores = np.zeros(self.n_docs)
+        matched = np.zeros(self.n_docs, dtype=bool)
+        k1_plus_1 = self.engine.k1 + 1
+        for term in query_terms:
+            docs, freqs = self.impacts(term) if model == 'bm25f' else self.postings(term)
+            if not len(docs):
+                continue
+            # bm25f : scores des champs deja fusionnes, ajoutes avec un idf de 1 comme en Python
+            idf = 1.0 if model == 'bm25f' else self.engine.term_idf(term, model)
+            if model != 'bm25':
+                scores[docs] += freqs * idf
+            else:
+                scores[docs] += idf * (freqs * k1_plus_1 / (freqs + self.norms[docs]))
+            matched[docs] = True
+        return scores, matched
+
+    def top_k(self, query_terms, model, k):
+        """[(doc_id, score)] of the k best documents, same order as the Python path"""
+        if k <= 0:
+            return []
+        scores, matched = self.score(query_terms, model)
+        candidates = np.flatnonzero(matched)
+        if len(candidates) > k:
+            candidate_scores = scores[candidates]
+            kth = candidate_scores[np.argpartition(-candidate_scores, k - 1)[k - 1]]
+            # marge de 0.0001 : le classement final se fait sur le score arrondi
+            candidates = candidates[candidate_scores >= kth - 0.0001]
+
+        doc_ids = self.engine.doc_ids
+        ranked = sorted(((round(float(scores[number]), 4), -int(number)) for number in candidates), reverse=True)[:k]
+        return [(doc_ids[-negative], float(scores[-negative])) for _, negative in ranked]
@@ -0,0 +1,115 @@
+import os
+from bisect import bisect_left
+
+try:
+    from src.codec import decode_positions, encode_positions
+    from src.forward_index import RecordFile, encode_term_block, find_term_payloads
+except ImportError:
+    from codec import decode_positions, encode_positions
+    from forward_index import RecordFile, encode_term_block, find_term_payloads
+
+# index positionnel (optionnel, indexer.py --positions) : pour chaque document,
+# le repertoire de ses termes (forward_index), chaque terme ayant la liste de
+# ses positions de token codee en delta + varint
+POSITIONS_FILE = os.path.join("data", "positions.dat")
+POSITIONS_INDEX_FILE = os.path.join("data", "positions.idx")
+
+
+def token_positions(tokens):
+    """{term: [token positions]} of a processed document (stop words already removed)"""
+    positions = {}
+    for position, term in enumerate(tokens):
+        positions.setdefault(term, []).append(position)
+    return positions
+
+
+def gallop(values, target, start=0):
+    """First index >= start whose value is >= target (exponential then binary search)"""
+    n = len(values)
+    bound = 1
+    while start + bound < n and values[start + bound] < target:
+        bound *= 2
+    return bisect_left(values, target, start + bound // 2, min(start + bound + 1, n))
+
+
+def phrase_match(position_lists):
+    """
+    True if the terms occur consecutively: a position p such that p + i is
+    in position_lists[i] for every i. The candidates come from the shortest
+    list; each other list is searched by galloping from its last cursor.
+    """
+    if not all(position_lists):
+        return False
+    pivot = min(range(len(position_lists)), key=lambda i: len(position_lists[i]))
+    cursors = [0] * len(position_lists)
+    for position in position_lists[pivot]:
+        start = position - pivot
+        if start < 0:
+            continue
+        for i, values in enumerate(position_lists):
+            if i == pivot:
+                continue
+            cursors[i] = gallop(values, start + i, cursors[i])
+            if cursors[i] == len(values):
+                return False
+            if values[cursors[i]] != start + i:
+                break
+        else:
+            return True
+    return False
+
+
+def min_span(position_lists):
+    """Length (in tokens) of the smallest window holding one position of each list"""
+    events = sorted((position, i) for i, values in enumerate(position_lists) for position in values)
+    counts = [0] * len(position_lists)
+    covered = 0
+    best = None
+    left = 0
+    for position, i in events:
+        counts[i] += 1
+        if counts[i] == 1:
+            covered += 1
+        while covered == len(position_lists):
+            left_position, left_i = events[left]
+            span = position - left_position + 1
+            if best is None or span < best:
+                best = span
+            counts[left_i] -= 1
+            if not counts[left_i]:
+                covered -= 1
+            left += 1
+    return best
+
+
+class PositionalIndex(RecordFile):
+    """
+    Token positions of every term of every document, read per document
+    through mmap (binary search of the query terms, then varint decoding of
+    their positions only).
+    """
+
+    MAGIC = b"BDRPOS01"
+    VERSION = 1
+
+    def __init__(self, data_file=POSITIONS_FILE, index_file=POSITIONS_INDEX_FILE):
+        super().__init__(data_file, index_file)
+
+    def _parts(self, positions):
+        # {terme: [positions]} -> repertoire des termes du document
+        return [_encode(positions)]
+
+    def positions(self, doc_id, terms):
+        """{term: [token positions]} of the given terms in a document"""
+        if doc_id not in self.records:
+            return {}
+        mm, start, _ = self.part(doc_id, 0)
+        return {term: decode_positions(payload) for term, payload in find_term_payloads(mm, start, terms).items()}
+
+    def contains_phrase(self, doc_id, phrase):
+        positions = self.positions(doc_id, phrase)
+        return phrase_match([positions.get(term, []) for term in phrase])
+
+
+def _encode(positions):
+    return encode_term_block({term: encode_positions(values) for term, values in positions.items()})
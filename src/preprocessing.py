@@ -1,48 +1,185 @@
 import re
 import string
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import PorterStemmer
+import threading
+from functools import lru_cache
 #c'est fichier numero 2 dans la preparation des donner pour l'evaluation
 
-# Download necessary NLTK data (safe to run multiple times, checks first)
-try:
+# NLTK (long a importer) et ses donnees ne sont charges qu'au premier besoin,
+# une seule fois par processus : l'import de ce module n'a aucun effet de bord
+_resources = {}
+_resources_lock = threading.Lock()
+
+
+def _shared_resource(name, load):
+    resource = _resources.get(name)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = _resources[name] = load()
+    return resource
+
+
+def _ensure_nltk_data(path, package):
+    # Download necessary NLTK data (checks first)
+    import nltk
+    try:
+        nltk.data.find(path)
+    except LookupError:
+        print(f"Downloading NLTK data ({package})...")
+        nltk.download(package)
+
+
+def _load_stop_words():
+    #lister les mot vide
+    _ensure_nltk_data('corpora/stopwords', 'stopwords')
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+def _load_stemmer():
+    from nltk.stem import PorterStemmer
+    return PorterStemmer()
+
+
+def _load_word_tokenize():
     #Découper le texte en phrases et en mots
-    nltk.data.find('tokenizers/punkt')
-    #lister les mot vide 
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    print("Downloading NLTK data...")
-    nltk.download('punkt')
-    nltk.download('stopwords')
+    _ensure_nltk_data('tokenizers/punkt', 'punkt')
+    import nltk
+    return nltk.word_tokenize
+
+
+def stop_words():
+    """English stop words, loaded on first use and shared by every Preprocessor"""
+    return _shared_resource("stop_words", _load_stop_words)
+
+
+def stemmer():
+    """Porter stemmer, created on first use and shared by every Preprocessor"""
+    return _shared_resource("stemmer", _load_stemmer)
+
+# regex de ponctuation compilee une seule fois (et non a chaque clean_text)
+PUNCTUATION_RE = re.compile(f"[{re.escape(string.punctuation)}]")
+
+# Une fois la ponctuation ascii supprimee, les seules regles de nltk.word_tokenize
+# qui changent encore le decoupage sont les guillemets unicode et quelques
+# contractions ("cannot" -> "can" "not"). Le mode "fast" n'applique que celles-ci.
+QUOTES_RE = re.compile("([«“‘„»”’])")
+# (mot recherche avant d'appliquer la regex, regex de nltk)
+CONTRACTIONS_RE = [
+    ("cannot", re.compile(r"(?i)\b(can)(not)\b")),
+    ("gimme", re.compile(r"(?i)\b(gim)(me)\b")),
+    ("gonna", re.compile(r"(?i)\b(gon)(na)\b")),
+    ("gotta", re.compile(r"(?i)\b(got)(ta)\b")),
+    ("lemme", re.compile(r"(?i)\b(lem)(me)\b")),
+    ("wanna", re.compile(r"(?i)\b(wan)(na)(?=\s)")),
+]
+
+STEM_CACHE_SIZE = 100000
+QUERY_CACHE_SIZE = 1024
+
+
+def fast_tokenize(text):
+    """Same tokens as nltk.word_tokenize on punctuation-stripped text, without Punkt"""
+    text = QUOTES_RE.sub(r" \1 ", text) + " "
+    lowered = text.lower()
+    for word, regexp in CONTRACTIONS_RE:
+        # une recherche de sous-chaine evite de parcourir le texte avec chaque regex
+        if word in lowered:
+            text = regexp.sub(r" \1 \2 ", text)
+    return text.split()
+
 
 class Preprocessor:
-    def __init__(self):
-        self.stop_words = set(stopwords.words('english'))
-        self.stemmer = PorterStemmer()
+    def __init__(self, tokenizer="fast"):
+        # "fast" : decoupage par regex precompilees ; "nltk" : nltk.word_tokenize exact
+        if tokenizer not in ("fast", "nltk"):
+            raise ValueError(f"Unknown tokenizer: {tokenizer}")
+        self.tokenizer = tokenizer
+        # le vocabulaire est tres repetitif : un token deja vu n'est pas re-stemme
+        self._normalize = lru_cache(maxsize=STEM_CACHE_SIZE)(self._normalize_token)
+        self._process_cached = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._process_tuple)
 
     def clean_text(self, text):
         # minuscules
         text = text.lower()
         # supprimer les ponctuation et les remplacer par des espaces
-        text = re.sub(f"[{re.escape(string.punctuation)}]", " ", text)
+        text = PUNCTUATION_RE.sub(" ", text)
         return text
 
+    @property
+    def stop_words(self):
+        return stop_words()
+
+    @property
+    def stemmer(self):
+        return stemmer()
+
+    def load(self):
+        """Loads the NLTK resources now rather than on the first text processed"""
+        stop_words()
+        stemmer()
+        if self.tokenizer == "nltk":
+            _shared_resource("word_tokenize", _load_word_tokenize)
+
     def tokenize(self, text):
         #tocken=mot ,nombre, symbole 
-        tokens = nltk.word_tokenize(text)
+        if self.tokenizer == "fast":
+            return fast_tokenize(text)
+        tokens = _shared_resource("word_tokenize", _load_word_tokenize)(text)
         return tokens
 
+    def _normalize_token(self, token):
+        """Stem of a token, or None for stop words and one-character tokens"""
+        if token not in self.stop_words and len(token) > 1:
+            return self.stemmer.stem(token)
+        return None
+
     def process(self, text):
         # de texte brut à une liste de tokens
         text = self.clean_text(text)
         tokens = self.tokenize(text)
-        
+
         # supprimer les mots vides et les stemmer
         processed_tokens = []
+        normalize = self._normalize
         for token in tokens:
-            if token not in self.stop_words and len(token) > 1:
-                stemmed = self.stemmer.stem(token)
+            stemmed = normalize(token)
+            if stemmed is not None:
+                processed_tokens.append(stemmed)
+
+        return processed_tokens
+
+    def process_with_offsets(self, text):
+        """
+        process() plus, for each kept token, its character offset in `text`
+        (-1 when it cannot be located). Tokens are the same as process().
+        """
+        cleaned = self.clean_text(text)
+        # clean_text garde les positions, sauf si lower() change la longueur (rare)
+        aligned = len(cleaned) == len(text)
+        processed_tokens = []
+        offsets = []
+        normalize = self._normalize
+        position = 0
+        for token in self.tokenize(cleaned):
+            start = cleaned.find(token, position) if aligned else -1
+            if start != -1:
+                position = start + len(token)
+            stemmed = normalize(token)
+            if stemmed is not None:
                 processed_tokens.append(stemmed)
-                
-        return processed_tokens
\ No newline at end of file
+                offsets.append(start)
+        return processed_tokens, offsets
+
+    def _process_tuple(self, text):
+        return tuple(self.process(text))
+
+    def process_query(self, query):
+        """process() with a bounded LRU cache, for short and often repeated texts"""
+        # copie : l'appelant peut modifier la liste
+        return list(self._process_cached(query))
+
+    def cache_info(self):
+        """Stem cache statistics (hits, misses, maxsize, currsize)"""
+        return self._normalize.cache_info()
@@ -0,0 +1,52 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# fichier ecrit en dernier a chaque publication (index, segment ou fusion) :
+# les moteurs de recherche le surveillent pour recharger l'index
+GENERATION_FILE = "generation.json"
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yields a temporary path next to `path`; once the block has written it,
+    the file is flushed to disk and renamed over `path` in one step, so a
+    reader sees either the old file or the new one, never a partial write.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        yield tmp_path
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_json(path, data):
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+
+def generation_file(directory):
+    return os.path.join(directory, GENERATION_FILE)
+
+
+def read_generation(directory):
+    """Current generation number of the index published in `directory` (0 if none)"""
+    try:
+        with open(generation_file(directory), "r", encoding="utf-8") as f:
+            return json.load(f)["generation"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def bump_generation(directory):
+    """Marks a new publication of the index files of `directory`"""
+    generation = read_generation(directory) + 1
+    write_json(generation_file(directory), {"generation": generation, "published_at": time.time()})
+    return generation
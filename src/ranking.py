@@ -0,0 +1,52 @@
+import math
+
+# formules partagees entre l'indexeur (valeurs precalculees) et le moteur
+
+
+def bm25_idf(total_docs, doc_freq):
+    return math.log((total_docs - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
+
+
+def tfidf_idf(total_docs, doc_freq):
+    return math.log(1 + total_docs / (doc_freq + 1))
+
+
+IDF_FUNCTIONS = {"bm25": bm25_idf, "tfidf": tfidf_idf}
+
+
+def compute_idf(inverted_index, total_docs):
+    """Returns {model: {term: idf}} for every term of the index"""
+    return {
+        model: {term: idf_function(total_docs, len(postings)) for term, postings in inverted_index.items()}
+        for model, idf_function in IDF_FUNCTIONS.items()
+    }
+
+
+def bm25_length_norms(doc_lengths, avg_doc_length, k1, b):
+    """Per-document part of the BM25 denominator: k1 * (1 - b + b * dl / avgdl)"""
+    if not avg_doc_length:
+        return {doc_id: k1 * (1 - b) for doc_id in doc_lengths}
+    return {doc_id: k1 * (1 - b + b * (dl / avg_doc_length)) for doc_id, dl in doc_lengths.items()}
+
+
+def compute_term_bounds(inverted_index, doc_lengths):
+    """
+    Returns {term: [max_tf, min_dl]}. Both are independent of k1/b and give
+    an upper bound of the score a term can add to any document.
+    """
+    return {
+        term: [max(postings.values()), min(doc_lengths.get(doc_id, 0) for doc_id in postings)]
+        for term, postings in inverted_index.items()
+        if postings
+    }
+
+
+def term_upper_bound(model, idf, max_tf, min_dl, avg_doc_length, k1, b):
+    """Highest score a term can contribute (tf grows the score, doc length lowers it)"""
+    if model == 'tfidf':
+        return max_tf * idf
+    if avg_doc_length:
+        norm = k1 * (1 - b + b * (min_dl / avg_doc_length))
+    else:
+        norm = k1 * (1 - b)
+    return idf * (max_tf * (k1 + 1) / (max_tf + norm))
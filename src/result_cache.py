@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+# taille et duree de vie par defaut du cache des classements de SearchEngine
+RESULT_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = 600.0 # secondes (None : pas d'expiration)
+
+
+class LRUCache:
+    """
+    Bounded LRU mapping safe to share between threads (the per-term caches
+    of the index: decoded or merged postings, numpy arrays, bm25f scores).
+    A value evicted by another thread between two calls is just a miss;
+    values are computed outside the lock, possibly twice for the same key.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResultCache:
+    """
+    Bounded LRU cache with an optional time to live, safe to share between
+    threads (Streamlit sessions). Values are stored as is: callers keep them
+    immutable.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # cle -> (date d'insertion, valeur)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached value, or None (counted as a miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry (the counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                    "maxsize": self.maxsize, "ttl": self.ttl}
@@ -0,0 +1,130 @@
+import argparse
+import json
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+# client du serveur de requetes (server.py) : memes methodes de recherche que
+# SearchEngine, sans charger l'index ni NLTK dans le processus appelant
+SERVER_URL = "http://127.0.0.1:8765"
+CLIENT_TIMEOUT = 30.0 # secondes
+
+
+class SearchServerError(Exception):
+    """Error answered by the query server (HTTP status and message)"""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class SearchClient:
+    """
+    search(), search_page(), search_many() and get_document() of a
+    SearchEngine served by server.py. The trace of the last search of the
+    calling thread (server started with --trace) is given by last_trace().
+    """
+
+    def __init__(self, url=SERVER_URL, timeout=CLIENT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._last = threading.local()
+
+    def _request(self, path, payload=None):
+        data = None
+        headers = {"Accept": "application/json"}
+        if payload is not None:
+            data = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(self.url + path, data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise SearchServerError(e.code, message) from None
+
+    def search_page(self, query, page=1, page_size=10, k=50, model='bm25', snippets=True):
+        """(hits of a page of the top-k, number of ranked results); pages start at 1"""
+        body = self._request("/search", {"query": query, "page": page, "page_size": page_size, "k": k,
+                                         "model": model, "snippets": snippets})
+        self._last.trace = body.get("trace")
+        return body["results"], body["total"]
+
+    def search(self, query, k=10, model='bm25', snippets=True):
+        return self.search_page(query, 1, k, k, model, snippets)[0]
+
+    def search_many(self, queries, k=10, model='bm25', snippets=True):
+        return self._request("/batch", {"queries": list(queries), "k": k, "model": model,
+                                        "snippets": snippets})["results"]
+
+    def get_document(self, doc_id):
+        """Full document dict, or None"""
+        try:
+            return self._request(f"/documents/{quote(str(doc_id), safe='')}")
+        except SearchServerError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def health(self):
+        return self._request("/health")
+
+    def server_stats(self):
+        """Index stats, term count, generation and result cache of the server"""
+        return self._request("/stats")
+
+    def last_trace(self):
+        return getattr(self._last, "trace", None)
+
+
+def _print_results(results):
+    if not results:
+        print("No results.")
+    for rank, hit in enumerate(results, 1):
+        print(f"{rank}. {hit['title']} ({hit['score']}) - {hit['path']}")
+        if "snippet" in hit:
+            print(f"   {hit['snippet']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queries a running server.py")
+    parser.add_argument("query", nargs="?", help="query to run")
+    parser.add_argument("--url", default=SERVER_URL, help="address of the server")
+    parser.add_argument("--k", type=int, default=10, help="number of results")
+    parser.add_argument("--model", choices=["bm25", "tfidf", "bm25f"], default="bm25", help="ranking model")
+    parser.add_argument("--batch", metavar="FILE", help="run the queries of a file (one per line) in one request")
+    parser.add_argument("--doc", metavar="ID", help="print a document")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON answer")
+    args = parser.parse_args()
+
+    client = SearchClient(args.url)
+    if args.doc:
+        answer = client.get_document(args.doc)
+        if answer is None:
+            print(f"No document {args.doc}")
+        elif not args.json:
+            print(f"{answer.get('title', '')}\n{answer.get('url', '')}\n\n{answer.get('content', '')}")
+    elif args.batch:
+        with open(args.batch, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+        answer = client.search_many(queries, k=args.k, model=args.model, snippets=False)
+        if not args.json:
+            for query, results in zip(queries, answer):
+                print(f"# {query}")
+                _print_results(results)
+    elif args.query:
+        answer = client.search(args.query, k=args.k, model=args.model)
+        if not args.json:
+            _print_results(answer)
+    else:
+        answer = client.health()
+        if not args.json:
+            print(f"Server {args.url}: {answer['status']}, {answer['documents']} documents, "
+                  f"generation {answer['generation']}")
+    if args.json:
+        print(json.dumps(answer, ensure_ascii=False, indent=2))
@@ -1,146 +1,1036 @@
+import argparse
+import copy
+import heapq
 import json
+import multiprocessing
 import os
-import math
 import re
-#dans ce fichier on va faire la recherche d'une requete ,ensuite on va faire une evaluation 
+import threading
+#dans ce fichier on va faire la recherche d'une requete ,ensuite on va faire une evaluation
 try:
     from src.preprocessing import Preprocessor
+    from src.binary_index import BinaryIndex, is_binary_index
+    from src.document_store import STORE_FILE, STORE_INDEX_FILE, DocumentStore
+    from src.field_index import FIELD_WEIGHTS, field_segments, fields_file, read_fields
+    from src.instrumentation import current_trace, stage
+    from src.positional_index import POSITIONS_FILE, POSITIONS_INDEX_FILE, PositionalIndex, min_span
+    from src.publish import GENERATION_FILE, read_generation
+    from src.ranking import IDF_FUNCTIONS, bm25_idf, bm25_length_norms, compute_term_bounds, term_upper_bound
+    from src.result_cache import RESULT_CACHE_SIZE, RESULT_CACHE_TTL, LRUCache, ResultCache
+    from src.segments import apply_segments, read_segments, segments_dir
+    from src.snippet_index import SNIPPETS_FILE, SNIPPETS_INDEX_FILE, SnippetIndex
 except ImportError:
     from preprocessing import Preprocessor
+    from binary_index import BinaryIndex, is_binary_index
+    from document_store import STORE_FILE, STORE_INDEX_FILE, DocumentStore
+    from field_index import FIELD_WEIGHTS, field_segments, fields_file, read_fields
+    from instrumentation import current_trace, stage
+    from positional_index import POSITIONS_FILE, POSITIONS_INDEX_FILE, PositionalIndex, min_span
+    from publish import GENERATION_FILE, read_generation
+    from ranking import IDF_FUNCTIONS, bm25_idf, bm25_length_norms, compute_term_bounds, term_upper_bound
+    from result_cache import RESULT_CACHE_SIZE, RESULT_CACHE_TTL, LRUCache, ResultCache
+    from segments import apply_segments, read_segments, segments_dir
+    from snippet_index import SNIPPETS_FILE, SNIPPETS_INDEX_FILE, SnippetIndex
 
 INDEX_FILE = os.path.join("data", "index.json")
+INDEX_BIN_FILE = os.path.join("data", "index.bin")
 DOCS_DIR = os.path.join("data", "documents")
+MODELS = ("bm25", "tfidf", "bm25f")
 
-class SearchEngine:
-    def __init__(self, k1=1.5, b=0.75):
-        self.k1 = k1 #valeur de bm25
-        self.b = b #valeur de bm25
-        self.preprocessor = Preprocessor()
-        self.inverted_index = {} 
+# marge relative sur les bornes : l'ordre des additions flottantes peut differer
+BOUND_SLACK = 1e-9
+# listes de scores bm25f (postings des champs fusionnes) gardees par snapshot
+IMPACTS_CACHE_SIZE = 4096
+
+# rechargement : intervalle de scrutation sans watchdog, et nombre d'essais
+# quand une publication a lieu pendant la lecture de l'index
+RELOAD_POLL_INTERVAL = 1.0
+RELOAD_ATTEMPTS = 5
+
+# "texte entre guillemets" d'une requete : les termes doivent se suivre
+PHRASE_RE = re.compile(r'"([^"]+)"')
+# bonus de proximite : nombre de documents (au moins k) reclasses
+PROXIMITY_DEPTH = 100
+
+def _rank_chunk(task):
+    """(generation, rankings) of a block of queries, in a search_many process"""
+    engine_options, term_lists, model, k = task
+    # un bloc par processus : le moteur est ouvert ici, d'apres les options
+    # de la tache (rien n'est herite du processus parent)
+    snapshot = SearchEngine(cache_size=0, **engine_options)._snapshot
+    return snapshot.generation, snapshot.rank_many(term_lists, model, k)
+
+
+class IndexSnapshot:
+    """
+    One loaded generation of the index, with everything derived from it for
+    a given k1/b (length norms, score bounds, numpy arrays, bm25f scores).
+
+    A snapshot is not modified once in use: a query reads a single snapshot
+    from start to end, and a reload or a k1/b change builds a new one that
+    SearchEngine swaps in with one reference assignment.
+    """
+
+    def __init__(self, index_file=None, k1=1.5, b=0.75, backend='python', generation=0, field_weights=None):
+        self.k1 = k1
+        self.b = b
+        self.backend = backend
+        self.field_weights = dict(FIELD_WEIGHTS if field_weights is None else field_weights) #poids bm25f par champ
+        self.generation = generation #numero de publication de l'index (publish.py)
+        self.inverted_index = {}
         self.doc_lengths = {} #longeur de chaque document
         self.doc_map = {} #affiche info comme titre chemin
         self.stats = {} #stat globale afficher dans le site (nb total de doc, longuer moyenne ,nb de mot)
-        self.load_index()
+        self.idf = {"bm25": {}, "tfidf": {}} #idf par terme, precalcule par l'indexeur
+        self._idf_cache = {"bm25": {}, "tfidf": {}} #idf calcule a la demande (ancien index)
+        self.doc_norms = {} #k1 * (1 - b + b * dl / avgdl) par document
+        self.term_bounds = {} #terme -> (max_tf, min_dl), pour les bornes de score
+        self.doc_ids = [] #numero interne -> doc_id (sert aussi a departager les ex aequo)
+        self.doc_numbers = {} #doc_id -> numero interne
+        self._bound_cache = {}
+        self.binary_index = None #lecteur mmap quand l'index est au format binaire
+        self._numpy_scorer = None
+        self.index_file = None #fichier lu (l'index des champs est a cote)
+        self._segment_fields = [] #champs et documents supprimes des segments, pour l'index des champs
+        self._fields = None #champ -> (postings, longueurs, longueur moyenne), lu a la premiere requete bm25f
+        self._field_norms = None #champ -> 1 - b + b * longueur / moyenne par document
+        self._impacts = LRUCache(IMPACTS_CACHE_SIZE) #terme -> {doc_id: score bm25f}, partage par les threads
+        self._load(index_file)
 
-    def load_index(self):
-        """Loads index and stats from disk"""
-        if not os.path.exists(INDEX_FILE):
-            print(f"Error: Index file {INDEX_FILE} not found. Run indexer.py first.")
+    def _load(self, index_file):
+        """Loads index and stats from disk (binary format if available, else JSON)"""
+        if index_file is None:
+            index_file = INDEX_BIN_FILE if os.path.exists(INDEX_BIN_FILE) else INDEX_FILE
+        if not os.path.exists(index_file):
+            print(f"Error: Index file {index_file} not found. Run indexer.py first.")
             return
-        #read et applic et affiche des coordonnées sur un document
-        with open(INDEX_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            self.inverted_index = data["inverted_index"]
-            self.doc_lengths = data["doc_lengths"]
-            self.doc_map = data["doc_map"]
-            self.stats = data["stats"]
-            
+        self.index_file = index_file
+
+        if is_binary_index(index_file):
+            # les postings restent sur disque (mmap) et sont decodes terme par terme
+            index = BinaryIndex(index_file)
+            self.inverted_index = index.inverted_index
+            self.doc_lengths = index.doc_lengths
+            self.doc_map = index.doc_map
+            self.stats = index.stats
+            self.idf = index.idf
+            self.term_bounds = index.term_bounds
+            self.doc_ids = index.doc_ids
+            self.binary_index = index
+        else:
+            #read et applic et affiche des coordonnées sur un document
+            with open(index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                self.inverted_index = data["inverted_index"]
+                self.doc_lengths = data["doc_lengths"]
+                self.doc_map = data["doc_map"]
+                self.stats = data["stats"]
+                # les index produits avant le precalcul n'ont pas de bloc "idf"
+                self.idf = data.get("idf", {"bm25": {}, "tfidf": {}})
+                self.term_bounds = data.get("term_bounds", {})
+            self.doc_ids = list(self.doc_map)
+            self.doc_ids += [doc_id for doc_id in self.doc_lengths if doc_id not in self.doc_map]
+            self.binary_index = None
+
+        # changements indexes depuis (indexer.py --update), pas encore fusionnes
+        segments = read_segments(segments_dir(index_file))
+        if segments:
+            self._apply_segments(segments)
+            self._segment_fields = [{"fields": segment.get("fields", {}), "deleted": segment["deleted"]}
+                                    for segment in segments]
+
+        self.doc_numbers = {doc_id: number for number, doc_id in enumerate(self.doc_ids)}
+        self._update_norms()
         print(f"Index loaded. {self.stats['total_docs']} documents.")
+
+    def _apply_segments(self, segments):
+        """Layers index segments over the loaded base index"""
+        self.inverted_index, self.doc_lengths, self.doc_map, _ = apply_segments(
+            segments, self.inverted_index, self.doc_lengths, self.doc_map)
+        total_docs = len(self.doc_lengths)
+        avg_doc_length = sum(self.doc_lengths.values()) / total_docs if total_docs else 0
+        self.stats = dict(self.stats, total_docs=total_docs, avg_doc_length=avg_doc_length)
+        # l'idf et les bornes precalcules ne valent que pour l'index de base :
+        # ils sont recalcules a la demande
+        self.idf = {"bm25": {}, "tfidf": {}}
+        self.term_bounds = {}
+        self.doc_ids = list(self.doc_map)
+        self.doc_ids += [doc_id for doc_id in self.doc_lengths if doc_id not in self.doc_map]
+        # les postings ne se lisent plus directement dans le fichier binaire
+        self.binary_index = None
+
+    def _update_norms(self):
+        """Computes the per-document BM25 length norms for k1/b"""
+        self.doc_norms = bm25_length_norms(self.doc_lengths, self.stats.get("avg_doc_length", 0), self.k1, self.b)
+        # les bornes BM25 et les scores bm25f dependent aussi de k1 et b
+        self._bound_cache = {}
+        self._field_norms = None
+        self._impacts = LRUCache(IMPACTS_CACHE_SIZE)
+        self._numpy_scorer = None
+        if self.backend == 'numpy':
+            # import ici : numpy n'est requis que pour ce backend
+            try:
+                from src.numpy_backend import NumpyScorer
+            except ImportError:
+                from numpy_backend import NumpyScorer
+            self._numpy_scorer = NumpyScorer(self)
+
+    def with_params(self, k1, b):
+        """Same index data with other BM25 parameters (a new snapshot)"""
+        snapshot = copy.copy(self)
+        snapshot.k1 = k1
+        snapshot.b = b
+        snapshot._update_norms()
+        return snapshot
+
+    def term_idf(self, term, model='bm25'):
+        """Precomputed idf of a term, computed once and cached if the index has none"""
+        idf = self.idf[model].get(term)
+        if idf is None:
+            idf = self._idf_cache[model].get(term)
+            if idf is None:
+                n_t = len(self.inverted_index.get(term, {}))
+                idf = IDF_FUNCTIONS[model](self.stats["total_docs"], n_t)
+                self._idf_cache[model][term] = idf
+        return idf
+
     #methode de bm25
     def score_bm25(self, term, doc_id):
        #frenquence de mot dans doc
-        term_data = self.inverted_index.get(term, {})
-        freq = term_data.get(doc_id, 0)
-        
+        freq = self.inverted_index.get(term, {}).get(doc_id, 0)
+
         if freq == 0:
             return 0.0
 
-        N = self.stats["total_docs"]
-        avgdl = self.stats["avg_doc_length"]
-        n_t = len(term_data)
-        dl = self.doc_lengths.get(doc_id, 0)
-
-        idf = math.log((N - n_t + 0.5) / (n_t + 0.5) + 1)
         #ajuste la frequence % au longueur de doc
-        numerator = freq * (self.k1 + 1)
-        denominator = freq + self.k1 * (1 - self.b + self.b * (dl / avgdl))
-        
-        return idf * (numerator / denominator)
-    #methode vectoriel 
+        return self.term_idf(term, 'bm25') * (freq * (self.k1 + 1) / (freq + self.doc_norms[doc_id]))
+    #methode vectoriel
     def score_tfidf(self, term, doc_id):
-        
-        term_data = self.inverted_index.get(term, {})
-        freq = term_data.get(doc_id, 0)
-        
+
+        freq = self.inverted_index.get(term, {}).get(doc_id, 0)
+
         if freq == 0:
             return 0.0
 
-        N = self.stats["total_docs"]
-        n_t = len(term_data)
-        
-        tf = freq 
-        idf = math.log(1 + N / (n_t + 1)) 
-        
-        return tf * idf
-    #faire un snippet (extrait de l'article ) pour l'affichage
-    def get_snippet(self, doc_id, query_terms):
-        
-        doc_info = self.doc_map.get(doc_id)
-        if not doc_info:
-            return ""
-            
-        filepath = os.path.join(DOCS_DIR, doc_info["path"])
+        return freq * self.term_idf(term, 'tfidf')
+
+    def score_bm25f(self, term, doc_id):
+        return self.field_impacts(term).get(doc_id, 0.0)
+
+    def _field_data(self):
+        """{field: (postings, doc lengths, avg length)} of the title and summary, loaded on first use"""
+        fields = self._fields
+        if fields is None:
+            fields = {}
+            saved = read_fields(fields_file(self.index_file)) if self.index_file else None
+            if saved is None:
+                print("No field index (data/fields.json): run indexer.py, bm25f scores the content only.")
+            for name, field in (saved or {}).items():
+                postings, lengths = field["inverted_index"], field["doc_lengths"]
+                if self._segment_fields:
+                    postings, lengths, _, _ = apply_segments(field_segments(self._segment_fields, name),
+                                                             postings, lengths, {})
+                fields[name] = (postings, lengths, sum(lengths.values()) / len(lengths) if lengths else 0)
+            self._fields = fields
+        return fields
+
+    def _weighted_fields(self):
+        """[(weight, postings, length norms)] of the fields with a weight, content first"""
+        fields = self._field_data()
+        if self._field_norms is None:
+            norms = {"content": bm25_length_norms(self.doc_lengths, self.stats.get("avg_doc_length", 0), 1.0, self.b)}
+            for name, (_, lengths, avg_length) in fields.items():
+                norms[name] = bm25_length_norms(lengths, avg_length, 1.0, self.b)
+            self._field_norms = norms
+        postings = {"content": self.inverted_index}
+        postings.update((name, field[0]) for name, field in fields.items())
+        return [(self.field_weights[name], postings[name], self._field_norms[name])
+                for name in postings if self.field_weights.get(name, 0) > 0]
+
+    def field_impacts(self, term):
+        """{doc_id: bm25f score of the term}, merged once over the weighted fields and cached"""
+        impacts = self._impacts.get(term)
+        if impacts is not None:
+            return impacts
+
+        # frequence pseudo : somme sur les champs de poids * tf / (1 - b + b * len / avg_len),
+        # saturee une seule fois ensuite (idf : documents qui ont le terme dans un champ)
+        numbers = self.doc_numbers
+        pseudo = {}
+        for weight, postings, norms in self._weighted_fields():
+            for doc_id, freq in (postings.get(term) or {}).items():
+                # l'index des champs est lu apres l'index : une publication entre les
+                # deux peut y ajouter des documents inconnus de ce snapshot
+                if doc_id in numbers:
+                    pseudo[doc_id] = pseudo.get(doc_id, 0.0) + weight * freq / norms[doc_id]
+        idf = bm25_idf(self.stats.get("total_docs", 0), len(pseudo))
+        k1 = self.k1
+        k1_plus_1 = k1 + 1
+        impacts = {doc_id: idf * (tf * k1_plus_1 / (tf + k1)) for doc_id, tf in pseudo.items()}
+        self._impacts.put(term, impacts)
+        return impacts
+
+    def _postings(self, term, model):
+        """
+        (postings, weight) a term is scored with: its frequencies and idf, or for
+        bm25f its merged field scores and a weight of 1 (scores are then added
+        as tf-idf ones). postings is None when no document has the term.
+        """
+        if model == 'bm25f':
+            return self.field_impacts(term) or None, 1.0
+        postings = self.inverted_index.get(term)
+        if not postings:
+            return None, 0.0
+        return postings, self.term_idf(term, model)
+
+    def _score_terms(self, query_terms, model):
+        """
+        Term-at-a-time scoring: idf and length norms are precomputed, so each
+        posting only costs one norm lookup and the tf weighting.
+        """
+        scores = {}
+        for term in query_terms:
+            postings, idf = self._postings(term, model)
+            if not postings:
+                continue
+            if model != 'bm25':
+                for doc_id, freq in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + freq * idf
+            else:
+                k1_plus_1 = self.k1 + 1
+                norms = self.doc_norms
+                for doc_id, freq in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * (freq * k1_plus_1 / (freq + norms[doc_id]))
+        return scores
+    def term_bound(self, term, model='bm25'):
+        """Upper bound of the score a term can add to a single document"""
+        bound = self._bound_cache.get((term, model))
+        if bound is None:
+            if model == 'bm25f':
+                # scores deja calcules : la borne est le plus grand
+                bound = max(self.field_impacts(term).values(), default=0.0)
+            else:
+                stats = self.term_bounds.get(term)
+                if stats is None:
+                    postings = self.inverted_index.get(term, {})
+                    stats = compute_term_bounds({term: postings}, self.doc_lengths).get(term, (0, 0))
+                max_tf, min_dl = stats
+                bound = term_upper_bound(model, self.term_idf(term, model), max_tf, min_dl,
+                                         self.stats.get("avg_doc_length", 0), self.k1, self.b)
+            bound *= 1 + BOUND_SLACK
+            self._bound_cache[(term, model)] = bound
+        return bound
+
+    def _score_docs(self, query_terms, model, doc_ids):
+        """_score_terms restricted to some documents (same additions in the same order)"""
+        scores = {}
+        k1_plus_1 = self.k1 + 1
+        norms = self.doc_norms
+        for term in query_terms:
+            postings, idf = self._postings(term, model)
+            if not postings:
+                continue
+            for doc_id in doc_ids:
+                freq = postings.get(doc_id)
+                if not freq:
+                    continue
+                if model != 'bm25':
+                    scores[doc_id] = scores.get(doc_id, 0.0) + freq * idf
+                else:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * (freq * k1_plus_1 / (freq + norms[doc_id]))
+        return scores
+
+    def rank(self, query_terms, model, k, pruning=True, candidates=None):
+        """
+        [(doc_id, score)] of the k best documents for preprocessed query
+        terms, among `candidates` only if given (documents matching a phrase)
+        """
+        trace = current_trace()
+        if trace is not None:
+            return self._traced_rank(trace, query_terms, model, k, pruning, candidates)
+        if candidates is not None:
+            return self._select_top_k(self._score_docs(query_terms, model, candidates), k)
+        if self._numpy_scorer is not None:
+            return self._numpy_scorer.top_k(query_terms, model, k)
+        if pruning:
+            return self._top_k_maxscore(query_terms, model, k)
+        return self._top_k_exhaustive(query_terms, model, k)
+
+    def _traced_rank(self, trace, query_terms, model, k, pruning, candidates):
+        """rank() with the scoring and the final selection timed, and the postings and documents counted"""
+        trace.count("terms", len(query_terms))
+        with trace.stage("score"):
+            # decodage (ou fusion des champs pour bm25f) compris dans le calcul
+            trace.count("postings", sum(len(self._postings(term, model)[0] or ()) for term in query_terms))
+            if candidates is not None:
+                scores = self._score_docs(query_terms, model, candidates)
+            elif self._numpy_scorer is not None:
+                # selection comprise dans le calcul vectorise
+                return self._numpy_scorer.top_k(query_terms, model, k)
+            elif pruning:
+                scores = self._maxscore_scores(query_terms, model, k)
+            else:
+                scores = self._score_terms(query_terms, model)
+        trace.count("candidates", len(scores))
+        with trace.stage("select"):
+            return self._select_top_k(scores, k)
+
+    def _top_k_exhaustive(self, query_terms, model, k):
+        """Scores every matching document and keeps the k best with a bounded heap"""
+        scores = self._score_terms(query_terms, model)
+        return self._select_top_k(scores, k)
+
+    def _select_top_k(self, scores, k):
+        numbers = self.doc_numbers
+        return heapq.nlargest(k, scores.items(), key=lambda item: (round(item[1], 4), -numbers[item[0]]))
+
+    def _top_k_maxscore(self, query_terms, model, k):
+        return self._select_top_k(self._maxscore_scores(query_terms, model, k), k)
+
+    def _maxscore_scores(self, query_terms, model, k):
+        """Scores of the top-k candidates, term-at-a-time with MaxScore pruning (same ranking as _score_terms)"""
+        if k <= 0:
+            return {}
+
+        terms = []
+        for term in query_terms:
+            postings, idf = self._postings(term, model)
+            if postings:
+                terms.append((postings, idf, self.term_bound(term, model)))
+        # remaining[i] = somme des bornes des termes i..fin
+        remaining = [0.0] * (len(terms) + 1)
+        for i in range(len(terms) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + terms[i][2]
+
+        # tf-idf et bm25f : contribution freq * idf (bm25f : score deja calcule, idf de 1)
+        tfidf = model != 'bm25'
+        k1_plus_1 = self.k1 + 1
+        norms = self.doc_norms
+        scores = {}
+        # des que la somme des bornes des termes restants ne peut plus atteindre le
+        # k-ieme score, les listes suivantes ne servent qu'a completer les candidats
+        closed = False # plus aucun nouveau document ne peut entrer dans le top-k
+        for i, (postings, idf, _) in enumerate(terms):
+            if len(scores) >= k:
+                # un score final x tel que x < threshold - 0.0001 s'arrondit
+                # forcement sous le k-ieme score arrondi : il ne peut pas entrer
+                threshold = round(heapq.nlargest(k, scores.values())[-1], 4)
+                cutoff = (threshold - 0.0001) / (1 + BOUND_SLACK) - remaining[i]
+                if not closed and cutoff > 0:
+                    closed = True
+                if closed:
+                    scores = {doc_id: score for doc_id, score in scores.items() if score >= cutoff}
+
+            if closed and len(postings) < len(scores):
+                # liste plus courte que les candidats : on la parcourt
+                for doc_id, freq in postings.items():
+                    score = scores.get(doc_id)
+                    if score is not None:
+                        if tfidf:
+                            scores[doc_id] = score + freq * idf
+                        else:
+                            scores[doc_id] = score + idf * (freq * k1_plus_1 / (freq + norms[doc_id]))
+            elif closed:
+                for doc_id, score in scores.items():
+                    freq = postings.get(doc_id)
+                    if freq:
+                        if tfidf:
+                            scores[doc_id] = score + freq * idf
+                        else:
+                            scores[doc_id] = score + idf * (freq * k1_plus_1 / (freq + norms[doc_id]))
+            elif tfidf:
+                for doc_id, freq in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + freq * idf
+            else:
+                for doc_id, freq in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * (freq * k1_plus_1 / (freq + norms[doc_id]))
+
+        return scores
+
+    def _term_contributions(self, term, model):
+        """[(doc_id, score added by the term)] for every document containing it"""
+        postings, idf = self._postings(term, model)
+        if not postings:
+            return []
+        if model != 'bm25':
+            return [(doc_id, freq * idf) for doc_id, freq in postings.items()]
+        k1_plus_1 = self.k1 + 1
+        norms = self.doc_norms
+        return [(doc_id, idf * (freq * k1_plus_1 / (freq + norms[doc_id]))) for doc_id, freq in postings.items()]
+
+    def rank_many(self, term_lists, model, k):
+        """Top-k of several preprocessed queries, sharing the per-term work"""
+        if self._numpy_scorer is not None:
+            # les tableaux de postings du backend numpy sont deja partages
+            return [self._numpy_scorer.top_k(query_terms, model, k) for query_terms in term_lists]
+
+        contributions = {}
+        ranked = []
+        for query_terms in term_lists:
+            scores = {}
+            for term in query_terms:
+                term_scores = contributions.get(term)
+                if term_scores is None:
+                    term_scores = contributions[term] = self._term_contributions(term, model)
+                for doc_id, score in term_scores:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+            ranked.append(self._select_top_k(scores, k))
+        return ranked
+
+
+class _GenerationWatcher:
+    """watchdog event handler: reloads the engine when generation.json is replaced"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def dispatch(self, event):
+        paths = (event.src_path, getattr(event, "dest_path", ""))
+        if any(os.path.basename(path) == GENERATION_FILE for path in paths):
+            self.engine._reload_quietly()
+
+
+class SearchEngine:
+    models = MODELS #modeles de classement acceptes par search()
+
+    def __init__(self, k1=1.5, b=0.75, index_file=None, pruning=True, backend='python', auto_reload=False,
+                 proximity=0.0, cache_size=RESULT_CACHE_SIZE, cache_ttl=RESULT_CACHE_TTL, instrumentation=None,
+                 field_weights=None):
+        self._k1 = k1 #valeur de bm25
+        self._b = b #valeur de bm25
+        self.index_file = index_file #None: index.bin s'il existe, sinon index.json
+        self.pruning = pruning #top-k avec elagage MaxScore (False: score exhaustif)
+        self.backend = backend #'python' ou 'numpy' (calcul vectorise, voir numpy_backend.py)
+        if backend not in ('python', 'numpy'):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.preprocessor = Preprocessor()
+        self._current = None #IndexSnapshot courant (charge a la premiere requete), remplace en bloc au rechargement
+        # ouverts avec l'index (voir les proprietes documents, snippets, positions)
+        self._documents = None #DocumentStore, None si les documents sont des fichiers JSON
+        self._snippets = None #SnippetIndex ecrit par l'indexeur (None pour un index plus ancien)
+        self._positions = None #PositionalIndex (indexer.py --positions), pour les phrases et la proximite
+        self.proximity = proximity #poids du bonus de proximite des termes (0 : desactive)
+        # poids BM25F des champs (content, title, summary) pour model='bm25f'
+        self.field_weights = dict(FIELD_WEIGHTS if field_weights is None else field_weights)
+        # classements deja calcules, partages par tous les utilisateurs (cache_size=0 : desactive)
+        self.cache = ResultCache(cache_size, cache_ttl) if cache_size else None
+        # instrumentation.Instrumentation : temps par etape et compteurs de chaque requete (None : desactivee)
+        self.instrumentation = instrumentation
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        if auto_reload:
+            self.start_watching()
+
+    @property
+    def k1(self):
+        return self._k1
+
+    @k1.setter
+    def k1(self, value):
+        with self._reload_lock:
+            self._k1 = value
+            if self._current is not None:
+                self._current = self._current.with_params(self._k1, self._b)
+
+    @property
+    def b(self):
+        return self._b
+
+    @b.setter
+    def b(self, value):
+        with self._reload_lock:
+            self._b = value
+            if self._current is not None:
+                self._current = self._current.with_params(self._k1, self._b)
+
+    @property
+    def _snapshot(self):
+        return self._current or self._first_load()
+
+    def _first_load(self):
+        # premier usage : l'index n'est pas lu a la construction du moteur
+        with self._reload_lock:
+            if self._current is None:
+                self.load_index()
+            return self._current
+
+    # donnees de l'index courant (lecture seule)
+    inverted_index = property(lambda self: self._snapshot.inverted_index)
+    doc_lengths = property(lambda self: self._snapshot.doc_lengths)
+    doc_map = property(lambda self: self._snapshot.doc_map)
+    stats = property(lambda self: self._snapshot.stats)
+    idf = property(lambda self: self._snapshot.idf)
+    term_bounds = property(lambda self: self._snapshot.term_bounds)
+    doc_norms = property(lambda self: self._snapshot.doc_norms)
+    doc_ids = property(lambda self: self._snapshot.doc_ids)
+    doc_numbers = property(lambda self: self._snapshot.doc_numbers)
+    binary_index = property(lambda self: self._snapshot.binary_index)
+    generation = property(lambda self: self._snapshot.generation)
+
+    # fichiers ouverts par load_index : le premier acces charge l'index
+    @property
+    def documents(self):
+        self._snapshot
+        return self._documents
+
+    @property
+    def snippets(self):
+        self._snapshot
+        return self._snippets
+
+    @property
+    def positions(self):
+        self._snapshot
+        return self._positions
+
+    def _index_dir(self):
+        return os.path.dirname(self.index_file or INDEX_FILE)
+
+    def _data_path(self, path):
+        """Same file as `path` (a default data/ path) in the directory of the index"""
+        return os.path.join(self._index_dir(), os.path.relpath(path, os.path.dirname(INDEX_FILE)))
+
+    def _load_snapshot(self, generation):
+        return IndexSnapshot(self.index_file, self.k1, self.b, self.backend, generation, self.field_weights)
+
+    def load_index(self):
+        """
+        Loads the published index and swaps it in. Queries already running
+        finish on the previous snapshot.
+        """
+        directory = self._index_dir()
+        for attempt in range(RELOAD_ATTEMPTS):
+            generation = read_generation(directory)
+            try:
+                snapshot = self._load_snapshot(generation)
+            except FileNotFoundError:
+                # un segment supprime par une fusion pendant la lecture : on relit
+                if attempt == RELOAD_ATTEMPTS - 1:
+                    raise
+                continue
+            # une publication pendant la lecture : la copie lue peut melanger deux generations
+            if read_generation(directory) == generation:
+                break
+        # documents, snippets et positions du meme repertoire que l'index
+        store = DocumentStore(self._data_path(STORE_FILE), self._data_path(STORE_INDEX_FILE))
+        self._documents = store if store.exists() else None
+        snippets = SnippetIndex(self._data_path(SNIPPETS_FILE), self._data_path(SNIPPETS_INDEX_FILE))
+        self._snippets = snippets if snippets.exists() else None
+        positions = PositionalIndex(self._data_path(POSITIONS_FILE), self._data_path(POSITIONS_INDEX_FILE))
+        self._positions = positions if positions.exists() else None
+        self._current = snapshot
+        if self.cache is not None:
+            # les cles contiennent la generation : on libere seulement la place
+            self.cache.clear()
+
+    @property
+    def loaded(self):
+        """True once the index is loaded (reading the index data before loads it and waits)"""
+        return self._current is not None
+
+    def warm_up(self):
+        """Loads the index and the preprocessing resources now instead of on the first query"""
+        self.preprocessor.load()
+        if self._current is None:
+            self._first_load()
+
+    def check_reload(self):
+        """Loads the index again if a new generation was published. Returns True if it did."""
+        # pas encore charge : le premier usage lira la derniere generation
+        if self._current is None or read_generation(self._index_dir()) == self._current.generation:
+            return False
+        with self._reload_lock:
+            if read_generation(self._index_dir()) == self._current.generation:
+                return False
+            self.load_index()
+        return True
+
+    def _reload_quietly(self):
+        try:
+            self.check_reload()
+        except Exception as e:
+            # le moteur continue sur l'index courant
+            print(f"Error: index reload failed: {e}")
+
+    def start_watching(self, interval=RELOAD_POLL_INTERVAL):
+        """
+        Reloads the index in the background whenever indexer.py publishes a
+        new generation: with watchdog if installed, else by polling
+        generation.json every `interval` seconds.
+        """
+        if self._watcher is not None:
+            return
+        directory = self._index_dir() or "."
+        try:
+            from watchdog.observers import Observer
+        except ImportError:
+            Observer = None
+
+        if Observer is not None and os.path.isdir(directory):
+            observer = Observer()
+            observer.schedule(_GenerationWatcher(self), directory, recursive=False)
+            observer.daemon = True
+            observer.start()
+            self._watcher = observer
+        else:
+            stop = threading.Event()
+
+            def poll():
+                while not stop.wait(interval):
+                    self._reload_quietly()
+
+            thread = threading.Thread(target=poll, daemon=True)
+            thread.stop = stop.set
+            thread.start()
+            self._watcher = thread
+        # une publication entre le chargement et le debut de la surveillance
+        self._reload_quietly()
+
+    def stop_watching(self):
+        if self._watcher is None:
+            return
+        self._watcher.stop()
+        self._watcher.join()
+        self._watcher = None
+
+    def term_idf(self, term, model='bm25'):
+        return self._snapshot.term_idf(term, model)
+
+    def score_bm25(self, term, doc_id):
+        return self._snapshot.score_bm25(term, doc_id)
+
+    def score_tfidf(self, term, doc_id):
+        return self._snapshot.score_tfidf(term, doc_id)
+
+    def score_bm25f(self, term, doc_id):
+        return self._snapshot.score_bm25f(term, doc_id)
+
+    def term_bound(self, term, model='bm25'):
+        return self._snapshot.term_bound(term, model)
+
+    def get_document(self, doc_id, path=None):
+        """Full document dict (from the document store, else its JSON file), or None"""
+        documents = self.documents
+        if documents is not None:
+            return documents.get(doc_id)
+        if path is None:
+            path = self.doc_map.get(doc_id, {}).get("path")
+            if not path:
+                return None
+        try:
+            with open(os.path.join(self._data_path(DOCS_DIR), path), "rb") as f:
+                data = f.read()
+        except:
+            return None
+        trace = current_trace()
+        if trace is not None:
+            trace.count("document_bytes", len(data))
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                doc = json.load(f)
-                content = doc.get("content", "")
+            return json.loads(data)
         except:
+            return None
+
+    #faire un snippet (extrait de l'article ) pour l'affichage
+    def get_snippet(self, doc_id, query_terms, path=None):
+        """
+        Extract of the document around the query terms. With the snippet
+        index, the window with the most query terms is found from the stored
+        term offsets; otherwise the document is read and searched.
+        """
+        snippets = self.snippets
+        if snippets is not None and doc_id in snippets:
+            return snippets.snippet(doc_id, query_terms)
+
+        doc = self.get_document(doc_id, path)
+        if doc is None:
             return ""
+        return self._make_snippet(doc.get("content", ""), query_terms)
 
+    def _make_snippet(self, content, query_terms):
         lower_content = content.lower()
         best_pos = -1
-        
+
         for term in query_terms:
             pos = lower_content.find(term)
             if pos != -1:
                 best_pos = pos
                 break
-        
+
         if best_pos == -1:
             return content[:200] + "..."
-            
+
         start = max(0, best_pos - 50)
         end = min(len(content), best_pos + 150)
-        
+
         snippet = content[start:end]
         if start > 0:
             snippet = "..." + snippet
         if end < len(content):
             snippet = snippet + "..."
-            
+
         return snippet
+    def parse_query(self, query):
+        """
+        (terms, phrases) of a query: all its preprocessed terms, and the
+        preprocessed terms of each "quoted phrase"
+        """
+        terms = self.preprocessor.process_query(query)
+        phrases = []
+        if '"' in query:
+            for text in PHRASE_RE.findall(query):
+                phrase = self.preprocessor.process_query(text)
+                if phrase:
+                    phrases.append(phrase)
+        return terms, phrases
+
+    def _uses_positions(self, terms, phrases):
+        if self.positions is None:
+            # sans index positionnel, les guillemets sont ignores
+            return False
+        return bool(phrases) or (self.proximity > 0 and len(set(terms)) > 1)
+
+    def _phrase_matches(self, snapshot, positions, phrases):
+        """
+        Doc ids containing every phrase. Candidates are the documents of the
+        shortest postings list found in all the others; the phrase is then
+        checked on their token positions.
+        """
+        matches = None
+        for phrase in phrases:
+            lists = sorted((snapshot.inverted_index.get(term) or {} for term in dict.fromkeys(phrase)), key=len)
+            docs = lists[0] if matches is None else matches
+            matches = [doc_id for doc_id in docs
+                       if all(doc_id in postings for postings in lists) and positions.contains_phrase(doc_id, phrase)]
+        return matches
+
+    def _proximity_rerank(self, snapshot, positions, query_terms, ranked, k):
+        """
+        Adds to each score proximity * (m - 1) / (span - m + 1), where m query
+        terms (m >= 2) occur in the document and span is the smallest window
+        of tokens holding all of them (m when they are adjacent).
+        """
+        terms = list(dict.fromkeys(query_terms))
+        scores = {}
+        for doc_id, score in ranked:
+            doc_positions = positions.positions(doc_id, terms)
+            matched = len(doc_positions)
+            if matched > 1:
+                span = min_span(list(doc_positions.values()))
+                score += self.proximity * (matched - 1) / (span - matched + 1)
+            scores[doc_id] = score
+        return snapshot._select_top_k(scores, k)
+
+    def _rank(self, snapshot, query_terms, phrases, model, k):
+        """Top-k of a parsed query: phrase constraints, then scoring, then the proximity boost"""
+        positions = self.positions
+        if not self._uses_positions(query_terms, phrases):
+            return snapshot.rank(query_terms, model, k, self.pruning)
+
+        trace = current_trace()
+        candidates = None
+        if phrases:
+            with stage(trace, "phrases"):
+                candidates = self._phrase_matches(snapshot, positions, phrases)
+        proximity = self.proximity > 0 and len(set(query_terms)) > 1
+        ranked = snapshot.rank(query_terms, model, max(k, PROXIMITY_DEPTH) if proximity else k,
+                               self.pruning, candidates)
+        if proximity:
+            with stage(trace, "proximity"):
+                ranked = self._proximity_rerank(snapshot, positions, query_terms, ranked, k)
+        return ranked
+
+    def _cache_key(self, snapshot, query_terms, phrases, model, k):
+        # tout ce dont depend le classement
+        return (tuple(query_terms), tuple(tuple(phrase) for phrase in phrases), model, k,
+                snapshot.k1, snapshot.b, snapshot.generation, self.proximity,
+                tuple(self.field_weights.items()) if model == 'bm25f' else None)
+
+    def _cached_rank(self, snapshot, query_terms, phrases, model, k):
+        """_rank() through the result cache; the ranking is returned as a tuple (shared, not to be modified)"""
+        cache = self.cache
+        if cache is None:
+            return tuple(self._rank(snapshot, query_terms, phrases, model, k))
+        key = self._cache_key(snapshot, query_terms, phrases, model, k)
+        ranked = cache.get(key)
+        trace = current_trace()
+        if trace is not None:
+            trace.count("cache_misses" if ranked is None else "cache_hits")
+        if ranked is None:
+            ranked = tuple(self._rank(snapshot, query_terms, phrases, model, k))
+            cache.put(key, ranked)
+        return ranked
+
+    def cache_stats(self):
+        """Hits, misses and size of the result cache (None if disabled)"""
+        return self.cache.stats() if self.cache is not None else None
+
 #inicialiser le recherche telque par defait le model est bm25
-    def search(self, query, k=10, model='bm25'):
+    def search(self, query, k=10, model='bm25', snippets=True, offset=0, limit=None):
+        """Top-k hits of a query ('bm25', 'tfidf' or 'bm25f'), or their offset/limit slice"""
+        return self._search(query, k, model, snippets, offset, limit)[0]
+
+    def search_page(self, query, page=1, page_size=10, k=50, model='bm25', snippets=True):
+        """(hits of a page of the top-k, number of ranked results); pages start at 1"""
+        if page < 1 or page_size < 1:
+            raise ValueError(f"page and page_size must be at least 1, got {page} and {page_size}")
+        return self._search(query, k, model, snippets, (page - 1) * page_size, page_size)
+
+    def _check_query_args(self, k, model):
+        if model not in self.models:
+            if model in MODELS:
+                raise ValueError(f"{model} is not available with {type(self).__name__}")
+            raise ValueError(f"Unknown model: {model}")
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+
+    def _search(self, query, k, model, snippets, offset=0, limit=None):
+        self._check_query_args(k, model)
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._run_search(None, query, k, model, snippets, offset, limit)
+        with instrumentation.trace(query) as trace:
+            return self._run_search(trace, query, k, model, snippets, offset, limit)
+
+    def _run_search(self, trace, query, k, model, snippets, offset, limit):
         #nettoyer la requete
-        query_terms = self.preprocessor.process(query)
+        with stage(trace, "preprocess"):
+            query_terms, phrases = self.parse_query(query)
         if not query_terms:
-            return []
+            return [], 0
 
-        scores = {}
-        #recherche dans indexer
-        for term in query_terms:
-            if term in self.inverted_index:
-                for doc_id in self.inverted_index[term]:
-                    if model == 'tfidf':
-                        score = self.score_tfidf(term, doc_id)
-                    else:
-                        score = self.score_bm25(term, doc_id)
-                        
-                    scores[doc_id] = scores.get(doc_id, 0.0) + score
-        #resultat :ensemple des documents
-        results = []
-        for doc_id, score in scores.items():
-            doc_info = self.doc_map.get(doc_id, {})
-            snippet = self.get_snippet(doc_id, query_terms)
-            
-            results.append({
-                "id": doc_id,
-                "score": round(score, 4),
-                "title": doc_info.get("title", "Unknown"),
-                "path": doc_info.get("path", ""),
-                "snippet": snippet
-            })
-
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:k]
+        # toute la requete travaille sur la meme generation de l'index
+        snapshot = self._snapshot
+        # phase 1 et 2 : calcul des scores et selection des k meilleurs documents
+        with stage(trace, "rank"):
+            ranked = self._cached_rank(snapshot, query_terms, phrases, model, k)
+        page = ranked[offset:] if limit is None else ranked[offset:offset + limit]
+        hits = [{"id": doc_id, "score": round(score, 4)} for doc_id, score in page]
 
+        # phase 3 : snippets et metadonnees seulement pour les resultats demandes
+        with stage(trace, "hydrate"):
+            hits = self._hydrate(snapshot, hits, query_terms, snippets)
+        if trace is not None:
+            trace.count("results", len(ranked))
+        return hits, len(ranked)
+
+    def search_many(self, queries, k=10, model='bm25', snippets=True, workers=1):
+        """Results of a batch of queries in input order, as search() would return them"""
+        self._check_query_args(k, model)
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._search_many(None, queries, k, model, snippets, workers)
+        with instrumentation.trace(f"<batch of {len(queries)} queries>") as trace:
+            return self._search_many(trace, queries, k, model, snippets, workers)
+
+    def _search_many(self, trace, queries, k, model, snippets, workers):
+        unique = {}
+        with stage(trace, "preprocess"):
+            for query in queries:
+                if query not in unique:
+                    unique[query] = self.parse_query(query)
+        texts = [query for query, (terms, _) in unique.items() if terms]
+
+        snapshot = self._snapshot
+        with stage(trace, "rank"):
+            ranked = self._rank_batch(snapshot, unique, texts, model, k, workers)
+
+        results = {}
+        with stage(trace, "hydrate"):
+            for query in texts:
+                hits = [{"id": doc_id, "score": round(score, 4)} for doc_id, score in ranked[query]]
+                results[query] = self._hydrate(snapshot, hits, unique[query][0], snippets)
+        # copies : une requete repetee ne partage pas ses dicts de resultats
+        return [[dict(hit) for hit in results.get(query, [])] for query in queries]
+
+    def _rank_batch(self, snapshot, unique, texts, model, k, workers):
+        """{query: ranking} of the distinct queries of a batch, through the result cache"""
+        ranked = {}
+        if self.cache is not None:
+            for query in texts:
+                cached = self.cache.get(self._cache_key(snapshot, *unique[query], model, k))
+                if cached is not None:
+                    ranked[query] = cached
+        # les phrases et la proximite se classent requete par requete
+        batch = [query for query in texts if query not in ranked and not self._uses_positions(*unique[query])]
+        term_lists = [unique[query][0] for query in batch]
+        if workers > 1 and len(term_lists) > 1:
+            fresh = dict(zip(batch, self._rank_parallel(snapshot, term_lists, model, k, workers)))
+        else:
+            fresh = dict(zip(batch, snapshot.rank_many(term_lists, model, k)))
+        for query in texts:
+            if query not in ranked and query not in fresh:
+                fresh[query] = self._rank(snapshot, *unique[query], model, k)
+        for query, query_ranked in fresh.items():
+            ranked[query] = tuple(query_ranked)
+            if self.cache is not None:
+                self.cache.put(self._cache_key(snapshot, *unique[query], model, k), ranked[query])
+        return ranked
+
+    def _rank_parallel(self, snapshot, term_lists, model, k, workers):
+        options = {"k1": snapshot.k1, "b": snapshot.b, "index_file": os.path.abspath(snapshot.index_file),
+                   "pruning": self.pruning, "backend": snapshot.backend, "field_weights": snapshot.field_weights}
+        # des blocs contigus : les requetes d'un bloc partagent leurs termes
+        size = -(-len(term_lists) // workers)
+        tasks = [(options, term_lists[i:i + size], model, k) for i in range(0, len(term_lists), size)]
+
+        # pas de fork : les threads du moteur (rechargement, serveur, Streamlit)
+        # peuvent tenir un verrou a ce moment. forkserver (sinon spawn) part
+        # d'un processus sans threads.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        with multiprocessing.get_context(method).Pool(len(tasks)) as pool:
+            chunks = pool.map(_rank_chunk, tasks)
+        if any(generation != snapshot.generation for generation, _ in chunks):
+            # index republie entre-temps : on classe avec la generation de la requete
+            return snapshot.rank_many(term_lists, model, k)
+        return [query_ranked for _, chunk in chunks for query_ranked in chunk]
+
+    def hydrate(self, hits, query, snippets=True):
+        """Adds title, path and snippet to lightweight hits (in place).
+
+        `query` is either the raw query string or its preprocessed terms.
+        Hits that already carry a snippet are left untouched.
+        """
+        return self._hydrate(self._snapshot, hits, query, snippets)
+
+    def _hydrate(self, snapshot, hits, query, snippets):
+        if snippets and isinstance(query, str):
+            query = self.preprocessor.process_query(query)
+
+        for hit in hits:
+            doc_info = snapshot.doc_map.get(hit["id"], {})
+            hit.setdefault("title", doc_info.get("title", "Unknown"))
+            hit.setdefault("path", doc_info.get("path", ""))
+            if snippets and "snippet" not in hit:
+                # chemin du document dans la generation qui l'a classe
+                hit["snippet"] = self.get_snippet(hit["id"], query, hit["path"]) if hit["path"] else ""
+        return hits
+
+
+def _print_results(engine, query, k, model):
+    results = engine.search(query, k=k, model=model)
+    if not results:
+        print("No results.")
+    for rank, hit in enumerate(results, 1):
+        print(f"{rank}. {hit['title']} ({hit['score']}) - {hit['path']}")
+        print(f"   {hit['snippet']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Searches the index from the command line")
+    parser.add_argument("query", nargs="?", help="query to run (default: ask for queries until an empty line)")
+    parser.add_argument("--k", type=int, default=10, help="number of results")
+    parser.add_argument("--model", choices=MODELS, default="bm25", help="ranking model")
+    args = parser.parse_args()
+
+    engine = SearchEngine()
+    if args.query:
+        _print_results(engine, args.query, args.k, args.model)
+    else:
+        while True:
+            try:
+                query = input("Query: ").strip()
+            except EOFError:
+                break
+            if not query:
+                break
+            _print_results(engine, query, args.k, args.model)
@@ -0,0 +1,141 @@
+import json
+import os
+from collections.abc import Mapping
+
+try:
+    from src.publish import write_json
+    from src.result_cache import LRUCache
+except ImportError:
+    from publish import write_json
+    from result_cache import LRUCache
+
+# segments d'index incrementaux, ecrits a cote de l'index de base :
+#   data/segments/segments.json   liste ordonnee des segments actifs
+#   data/segments/seg_000001.json changements (documents ajoutes/supprimes,
+#                                 avec leurs champs titre et resume)
+SEGMENTS_DIRNAME = "segments"
+SEGMENTS_LIST = "segments.json"
+
+# listes de postings fusionnees gardees en memoire
+MERGED_CACHE_SIZE = 1024
+
+
+def segments_dir(index_file):
+    return os.path.join(os.path.dirname(index_file), SEGMENTS_DIRNAME)
+
+
+def new_segment():
+    return {"inverted_index": {}, "doc_lengths": {}, "doc_map": {}, "fields": {}, "deleted": []}
+
+
+def list_segments(directory):
+    """Names of the active segments, oldest first"""
+    path = os.path.join(directory, SEGMENTS_LIST)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["segments"]
+
+
+def read_segments(directory):
+    segments = []
+    for name in list_segments(directory):
+        with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+            segments.append(json.load(f))
+    return segments
+
+
+def write_segment(directory, segment):
+    """Writes a new segment file and appends it to the segment list"""
+    os.makedirs(directory, exist_ok=True)
+    names = list_segments(directory)
+    number = int(names[-1][4:10]) + 1 if names else 1
+    name = f"seg_{number:06d}.json"
+    write_json(os.path.join(directory, name), segment)
+    # la liste n'est mise a jour qu'une fois le segment ecrit
+    write_json(os.path.join(directory, SEGMENTS_LIST), {"segments": names + [name]})
+    return names + [name]
+
+
+def clear_segments(directory):
+    """Drops every segment (after they were merged into the base index)"""
+    names = list_segments(directory)
+    if not names:
+        return
+    write_json(os.path.join(directory, SEGMENTS_LIST), {"segments": []})
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class LayeredPostings(Mapping):
+    """
+    term -> {doc_id: freq} view of a base index with segments on top.
+    Base postings of deleted (or re-indexed) documents are hidden and the
+    postings added by the segments are merged in, per term, on access.
+    """
+
+    def __init__(self, base, deleted, added):
+        self._base = base
+        self._deleted = deleted # documents dont les postings de base sont ignores
+        self._added = added     # term -> {doc_id: freq} venant des segments
+        self._cache = LRUCache(MERGED_CACHE_SIZE)
+
+    def __getitem__(self, term):
+        postings = self._cache.get(term)
+        if postings is not None:
+            return postings
+
+        base_postings = self._base.get(term, {})
+        postings = {doc_id: freq for doc_id, freq in base_postings.items() if doc_id not in self._deleted}
+        postings.update(self._added.get(term, {}))
+        if not postings:
+            raise KeyError(term)
+        self._cache.put(term, postings)
+        return postings
+
+    def __contains__(self, term):
+        try:
+            self[term]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        # les termes dont tous les documents ont ete supprimes restent
+        # listes jusqu'a la prochaine fusion
+        yield from self._base
+        for term in self._added:
+            if term not in self._base:
+                yield term
+
+    def __len__(self):
+        return len(self._base) + sum(1 for term in self._added if term not in self._base)
+
+
+def apply_segments(segments, inverted_index, doc_lengths, doc_map):
+    """
+    Layers segments over a loaded base index.
+    Returns (inverted_index, doc_lengths, doc_map, removed doc ids): new
+    objects, the base ones are left untouched.
+    """
+    deleted = set()
+    added = {}
+    doc_lengths = dict(doc_lengths)
+    doc_map = dict(doc_map)
+    for segment in segments:
+        removed = set(segment["deleted"])
+        if removed:
+            deleted |= removed
+            for doc_id in removed:
+                doc_lengths.pop(doc_id, None)
+                doc_map.pop(doc_id, None)
+            for postings in added.values():
+                for doc_id in removed.intersection(postings):
+                    del postings[doc_id]
+        for term, postings in segment["inverted_index"].items():
+            added.setdefault(term, {}).update(postings)
+        doc_lengths.update(segment["doc_lengths"])
+        doc_map.update(segment["doc_map"])
+    return LayeredPostings(inverted_index, deleted, added), doc_lengths, doc_map, deleted
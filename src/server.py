@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+try:
+    from src.instrumentation import Instrumentation, log_sink
+    from src.search_engine import SearchEngine
+except ImportError:
+    from instrumentation import Instrumentation, log_sink
+    from search_engine import SearchEngine
+
+# serveur de requetes HTTP/JSON : un moteur charge une fois par processus et
+# partage par ses threads (l'index binaire est lu via mmap), au lieu d'un
+# chargement de l'index par script ou par rerun de l'interface
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+MAX_CONCURRENT = 8 # requetes traitees en meme temps par processus
+QUEUE_TIMEOUT = 2.0 # secondes d'attente d'une place avant de repondre 503
+MAX_BODY = 1024 * 1024 # octets d'un corps de requete POST
+MAX_BATCH = 1000 # requetes d'un POST /batch
+MAX_K = 1000
+
+
+class RequestError(Exception):
+    """Invalid request, answered with its HTTP status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(params, name, default, minimum, maximum):
+    value = params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RequestError(400, f"{name} must be an integer")
+    if not minimum <= value <= maximum:
+        raise RequestError(400, f"{name} must be between {minimum} and {maximum}")
+    return value
+
+
+def _bool_param(params, name, default):
+    value = params.get(name, default)
+    if isinstance(value, str):
+        return value.lower() not in ("0", "false", "no", "")
+    return bool(value)
+
+
+def _model_param(params, engine):
+    model = params.get("model", "bm25")
+    if model not in engine.models:
+        raise RequestError(400, f"model must be one of {', '.join(engine.models)}")
+    return model
+
+
+class SearchServer(ThreadingHTTPServer):
+    """HTTP server of one SearchEngine, at most max_concurrent requests at a time"""
+
+    daemon_threads = True
+
+    def __init__(self, address, engine, max_concurrent=MAX_CONCURRENT, queue_timeout=QUEUE_TIMEOUT, verbose=False):
+        super().__init__(address, SearchHandler)
+        self.engine = engine
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.queue_timeout = queue_timeout
+        self.verbose = verbose
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of SearchServer:
+
+        GET  /search?q=...&k=10&model=bm25&page=1&page_size=10&snippets=1
+        POST /search   {"query": ..., same options}
+        POST /batch    {"queries": [...], "k": 10, "model": "bm25", "snippets": true}
+        GET  /documents/<id>
+        GET  /health, GET /stats
+    """
+
+    server_version = "BarreDeRecherche/1.0"
+    protocol_version = "HTTP/1.1" # keep-alive pour les clients qui le gerent
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        self._dispatch("GET", url.path, params)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            params = self._read_json()
+        except RequestError as e:
+            self._send(e.status, {"error": str(e)})
+            return
+        self._dispatch("POST", url.path, params)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # corps de longueur inconnue : impossible de le sauter, on ferme la connexion
+            self.close_connection = True
+            raise RequestError(400, "invalid Content-Length")
+        if length > MAX_BODY:
+            # le corps n'est pas lu : il serait pris pour la requete suivante
+            self.close_connection = True
+            raise RequestError(413, f"request body larger than {MAX_BODY} bytes")
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise RequestError(400, "request body is not valid JSON")
+        if not isinstance(data, dict):
+            raise RequestError(400, "request body must be a JSON object")
+        return data
+
+    def _dispatch(self, method, path, params):
+        routes = {
+            ("GET", "/search"): self._search,
+            ("POST", "/search"): self._search,
+            ("POST", "/batch"): self._batch,
+            ("GET", "/health"): self._health,
+            ("GET", "/stats"): self._stats,
+        }
+        handler = routes.get((method, path.rstrip("/") or "/"))
+        if handler is None and method == "GET" and path.startswith("/documents/"):
+            handler = self._document
+        if handler is None:
+            self._send(404, {"error": f"no route for {method} {path}"})
+            return
+        # au-dela de max_concurrent requetes, on attend une place puis on refuse
+        if not self.server.slots.acquire(timeout=self.server.queue_timeout):
+            self._send(503, {"error": "server busy, retry later"}, {"Retry-After": "1"})
+            return
+        try:
+            status, body = 200, handler(path, params)
+        except RequestError as e:
+            status, body = e.status, {"error": str(e)}
+        except Exception as e:
+            status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.server.slots.release()
+        self._send(status, body)
+
+    def _search(self, path, params):
+        engine = self.server.engine
+        query = params.get("query", params.get("q"))
+        if not isinstance(query, str) or not query.strip():
+            raise RequestError(400, "missing query")
+        k = _int_param(params, "k", 10, 1, MAX_K)
+        page = _int_param(params, "page", 1, 1, MAX_K)
+        page_size = _int_param(params, "page_size", k, 1, MAX_K)
+        hits, total = engine.search_page(query, page, page_size, k=k, model=_model_param(params, engine),
+                                         snippets=_bool_param(params, "snippets", True))
+        body = {"query": query, "total": total, "page": page, "results": hits}
+        if engine.instrumentation is not None:
+            # trace de cette requete (executee par ce thread)
+            body["trace"] = engine.instrumentation.last_trace()
+        return body
+
+    def _batch(self, path, params):
+        queries = params.get("queries")
+        if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+            raise RequestError(400, "queries must be a list of strings")
+        if len(queries) > MAX_BATCH:
+            raise RequestError(413, f"more than {MAX_BATCH} queries")
+        engine = self.server.engine
+        results = engine.search_many(queries, k=_int_param(params, "k", 10, 1, MAX_K),
+                                     model=_model_param(params, engine),
+                                     snippets=_bool_param(params, "snippets", True))
+        return {"results": results}
+
+    def _document(self, path, params):
+        doc_id = unquote(path[len("/documents/"):])
+        document = self.server.engine.get_document(doc_id)
+        if document is None:
+            raise RequestError(404, f"no document {doc_id}")
+        return document
+
+    def _health(self, path, params):
+        engine = self.server.engine
+        return {"status": "ok", "generation": engine.generation, "documents": engine.stats.get("total_docs", 0)}
+
+    def _stats(self, path, params):
+        engine = self.server.engine
+        return {"stats": engine.stats, "terms": len(engine.inverted_index), "generation": engine.generation,
+                "cache": engine.cache_stats(), "pid": os.getpid()}
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, processes=1, max_concurrent=MAX_CONCURRENT, auto_reload=True,
+          verbose=False, **engine_options):
+    """
+    Serves a SearchEngine over HTTP until interrupted. With processes > 1
+    (fork only), the index is loaded once and the processes forked after
+    it share its pages and accept on the same socket, each with its own
+    threads, result cache and concurrency limit.
+    """
+    if processes > 1 and not hasattr(os, "fork"):
+        raise ValueError("processes > 1 needs os.fork")
+    # charge avant le fork : les processus partagent l'index deja lu
+    engine = SearchEngine(**engine_options)
+    engine.warm_up()
+    server = SearchServer((host, port), engine, max_concurrent, verbose=verbose)
+    if threading.current_thread() is threading.main_thread():
+        # SIGTERM termine proprement : le processus parent arrete aussi les autres
+        signal.signal(signal.SIGTERM, _terminate)
+
+    children = [] # None dans les processus enfants
+    for _ in range(processes - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = None
+            break
+        children.append(pid)
+    # les threads ne survivent pas au fork : la surveillance demarre dans chaque processus
+    if auto_reload:
+        engine.start_watching()
+    if children is not None:
+        print(f"Serving on http://{host}:{server.server_address[1]} ({processes} processes)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pid in children or ():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves search queries over HTTP (JSON)")
+    parser.add_argument("--host", default=SERVER_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="port to listen on")
+    parser.add_argument("--processes", type=int, default=1, help="server processes sharing the loaded index (fork)")
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT,
+                        help="requests handled at once per process (more wait, then get 503)")
+    parser.add_argument("--index", help="index file (default: data/index.bin, else data/index.json)")
+    parser.add_argument("--backend", default="python", choices=["python", "numpy"], help="scoring backend")
+    parser.add_argument("--proximity", type=float, default=0.0, help="proximity boost weight (positional index)")
+    parser.add_argument("--no-reload", action="store_true", help="do not reload the index when indexer.py publishes")
+    parser.add_argument("--trace", action="store_true",
+                        help="instrument queries: trace in each /search response and as JSON log lines")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    if args.trace:
+        import logging
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    serve(args.host, args.port, args.processes, args.max_concurrent, auto_reload=not args.no_reload,
+          verbose=args.verbose, index_file=args.index, backend=args.backend, proximity=args.proximity,
+          instrumentation=Instrumentation([log_sink()]) if args.trace else None)
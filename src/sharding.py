@@ -0,0 +1,314 @@
+import heapq
+import json
+import multiprocessing
+import os
+import weakref
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from src.binary_index import BinaryIndex, write_binary_index
+    from src.publish import atomic_path, write_json
+    from src.ranking import IDF_FUNCTIONS, bm25_length_norms, compute_term_bounds
+    from src.search_engine import IndexSnapshot, SearchEngine
+except ImportError:
+    from binary_index import BinaryIndex, write_binary_index
+    from publish import atomic_path, write_json
+    from ranking import IDF_FUNCTIONS, bm25_length_norms, compute_term_bounds
+    from search_engine import IndexSnapshot, SearchEngine
+
+# partitions de l'index (indexer.py --shards N) : des plages contigues de
+# documents, chacune un index binaire complet avec l'idf et la longueur
+# moyenne du corpus entier, pour que les scores soient ceux de l'index unique
+SHARDS_DIR = os.path.join("data", "shards")
+SHARDS_FILE = "shards.json"
+
+# versions (k1, b) d'un shard gardees par processus
+SHARD_PARAMS_CACHE = 4
+
+
+def write_shards(n_shards, inverted_index, doc_lengths, doc_map, stats, idf, directory=SHARDS_DIR):
+    """
+    Splits the index in n_shards binary indexes of contiguous documents (in
+    doc_map order) and publishes shards.json. Each shard keeps the global
+    idf and stats. Returns the shard file names.
+    """
+    doc_ids = list(doc_map)
+    doc_ids += [doc_id for doc_id in doc_lengths if doc_id not in doc_map]
+    size = max(1, -(-len(doc_ids) // max(1, n_shards)))
+    groups = [doc_ids[i:i + size] for i in range(0, len(doc_ids), size)] or [[]]
+    shard_of = {doc_id: number for number, group in enumerate(groups) for doc_id in group}
+
+    # un seul passage sur les postings, chaque posting va dans son shard
+    shard_indexes = [{} for _ in groups]
+    for term, postings in inverted_index.items():
+        for doc_id, freq in postings.items():
+            shard_indexes[shard_of[doc_id]].setdefault(term, {})[doc_id] = freq
+
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for number, (group, shard_index) in enumerate(zip(groups, shard_indexes)):
+        lengths = {doc_id: doc_lengths.get(doc_id, 0) for doc_id in group}
+        shard_map = {doc_id: doc_map[doc_id] for doc_id in group if doc_id in doc_map}
+        shard_idf = {model: {term: values[term] for term in shard_index} for model, values in idf.items()}
+        name = f"shard_{number:03d}.bin"
+        with atomic_path(os.path.join(directory, name)) as tmp_path:
+            write_binary_index(tmp_path, shard_index, lengths, shard_map, stats, shard_idf,
+                               compute_term_bounds(shard_index, lengths))
+        names.append(name)
+
+    write_json(os.path.join(directory, SHARDS_FILE), {"shards": names, "stats": stats})
+    # shards d'une partition precedente plus grande
+    for name in os.listdir(directory):
+        if name.startswith("shard_") and name.endswith(".bin") and name not in names:
+            os.remove(os.path.join(directory, name))
+    return names
+
+
+def read_shards(directory=SHARDS_DIR):
+    """(shard paths, global stats), or None if the index is not sharded"""
+    path = os.path.join(directory, SHARDS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [os.path.join(directory, name) for name in data["shards"]], data["stats"]
+
+
+class _ShardState:
+    """IndexSnapshots of one shard, one per (k1, b) asked by the coordinator"""
+
+    def __init__(self, index_file, k1, b, backend, generation):
+        self.snapshots = {(k1, b): IndexSnapshot(index_file, k1, b, backend, generation)}
+
+    def rank(self, term_lists, model, k, k1, b, candidates=None):
+        snapshot = self.snapshots.get((k1, b))
+        if snapshot is None:
+            snapshot = next(iter(self.snapshots.values())).with_params(k1, b)
+            if len(self.snapshots) >= SHARD_PARAMS_CACHE:
+                del self.snapshots[next(iter(self.snapshots))]
+            self.snapshots[(k1, b)] = snapshot
+        if candidates is not None or len(term_lists) == 1:
+            return [snapshot.rank(query_terms, model, k, True, candidates) for query_terms in term_lists]
+        return snapshot.rank_many(term_lists, model, k)
+
+
+# shard charge par un processus de ShardedSearchEngine(executor="process")
+_shard_state = None
+
+
+def _init_shard(index_file, k1, b, backend, generation):
+    global _shard_state
+    _shard_state = _ShardState(index_file, k1, b, backend, generation)
+
+
+def _shard_ready():
+    return _shard_state is not None
+
+
+def _rank_shard(task):
+    return _shard_state.rank(*task)
+
+
+def _shutdown(executors):
+    for executor in executors:
+        executor.shutdown(wait=False)
+
+
+class ShardedPostings(Mapping):
+    """term -> {doc_id: freq} merged over the shards (read on demand from their mmap)"""
+
+    def __init__(self, shards):
+        self._shards = shards
+        self._len = None
+
+    def __getitem__(self, term):
+        postings = {}
+        for shard in self._shards:
+            shard_postings = shard.get(term)
+            if shard_postings:
+                postings.update(shard_postings.items())
+        if not postings:
+            raise KeyError(term)
+        return postings
+
+    def __contains__(self, term):
+        return any(term in shard for shard in self._shards)
+
+    def __iter__(self):
+        seen = set()
+        for shard in self._shards:
+            for term in shard:
+                if term not in seen:
+                    seen.add(term)
+                    yield term
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
+
+
+class _ShardPool:
+    """
+    Workers of one generation of the shards (a process or a thread per
+    shard) and the per-document data the coordinator needs to merge and
+    hydrate results (doc ids, titles, lengths): postings stay in the shards.
+    Shared by the snapshots derived with with_params(); the workers stop
+    when the last of them is garbage collected.
+    """
+
+    def __init__(self, shards_dir, k1, b, backend, generation, executor):
+        shards = read_shards(shards_dir)
+        if shards is None:
+            print(f"Error: no shards in {shards_dir}. Run indexer.py --shards N first.")
+            paths, self.stats = [], {"total_docs": 0, "avg_doc_length": 0}
+        else:
+            paths, self.stats = shards
+        self.indexes = [BinaryIndex(path) for path in paths]
+        self.doc_ids = [doc_id for index in self.indexes for doc_id in index.doc_ids]
+        self.doc_numbers = {doc_id: number for number, doc_id in enumerate(self.doc_ids)}
+        self.doc_map = {}
+        self.doc_lengths = {}
+        for index in self.indexes:
+            self.doc_map.update(index.doc_map)
+            self.doc_lengths.update(index.doc_lengths)
+        self.inverted_index = ShardedPostings([index.inverted_index for index in self.indexes])
+        print(f"Sharded index loaded. {self.stats['total_docs']} documents in {len(paths)} shards.")
+
+        if executor == "process":
+            # pas de fork : a chaque rechargement, les threads du moteur (surveillance,
+            # serveur) tournent deja. forkserver (sinon spawn) part d'un processus
+            # sans threads ; _init_shard rouvre le shard depuis son chemin.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            self.executors = [ProcessPoolExecutor(1, context, _init_shard,
+                                                  (os.path.abspath(path), k1, b, backend, generation))
+                              for path in paths]
+            # chargement des shards en parallele, avant la premiere requete
+            for future in [executor.submit(_shard_ready) for executor in self.executors]:
+                future.result()
+            self.states = None
+        elif executor == "thread":
+            self.executors = [ThreadPoolExecutor(max(1, len(paths)))]
+            self.states = [_ShardState(path, k1, b, backend, generation) for path in paths]
+        else:
+            raise ValueError(f"Unknown executor: {executor}")
+        weakref.finalize(self, _shutdown, list(self.executors))
+
+    def rank(self, term_lists, model, k, k1, b, candidates=None):
+        """Per shard, the top-k of each query (scattered to every shard at once)"""
+        task = (term_lists, model, k, k1, b, candidates)
+        if self.states is None:
+            futures = [executor.submit(_rank_shard, task) for executor in self.executors]
+        else:
+            futures = [self.executors[0].submit(state.rank, *task) for state in self.states]
+        return [future.result() for future in futures]
+
+    def term_idf(self, term, model):
+        # chaque shard qui contient le terme a le meme idf (global)
+        for index in self.indexes:
+            idf = index.idf[model].get(term)
+            if idf is not None:
+                return idf
+        return IDF_FUNCTIONS[model](self.stats["total_docs"], 0)
+
+
+class ShardedSnapshot:
+    """
+    IndexSnapshot counterpart over the shards: rank() and rank_many() send
+    the query to every shard in parallel, each shard computes its exact
+    top-k with the global idf and avg_doc_length, and the coordinator keeps
+    the k best, ties broken by global document order. Results are the same
+    as with the single index for bm25 and tfidf; bm25f is not available (the
+    field index is not split in shards).
+    """
+
+    def __init__(self, shards_dir=SHARDS_DIR, k1=1.5, b=0.75, backend='python', generation=0,
+                 executor="process", pool=None):
+        self.k1 = k1
+        self.b = b
+        self.backend = backend
+        self.generation = generation
+        self._pool = pool or _ShardPool(shards_dir, k1, b, backend, generation, executor)
+        self.stats = self._pool.stats
+        self.doc_ids = self._pool.doc_ids
+        self.doc_numbers = self._pool.doc_numbers
+        self.doc_map = self._pool.doc_map
+        self.doc_lengths = self._pool.doc_lengths
+        self.inverted_index = self._pool.inverted_index
+        self.idf = {"bm25": {}, "tfidf": {}}
+        self.term_bounds = {}
+        self.doc_norms = {}
+        self.binary_index = None
+
+    def with_params(self, k1, b):
+        return ShardedSnapshot(k1=k1, b=b, backend=self.backend, generation=self.generation, pool=self._pool)
+
+    def term_idf(self, term, model='bm25'):
+        return self._pool.term_idf(term, model)
+
+    def score_bm25(self, term, doc_id):
+        freq = self.inverted_index.get(term, {}).get(doc_id, 0)
+        if freq == 0:
+            return 0.0
+        norm = bm25_length_norms({doc_id: self.doc_lengths[doc_id]}, self.stats.get("avg_doc_length", 0),
+                                 self.k1, self.b)[doc_id]
+        return self.term_idf(term, 'bm25') * (freq * (self.k1 + 1) / (freq + norm))
+
+    def score_tfidf(self, term, doc_id):
+        freq = self.inverted_index.get(term, {}).get(doc_id, 0)
+        return freq * self.term_idf(term, 'tfidf') if freq else 0.0
+
+    def _select_top_k(self, scores, k):
+        numbers = self.doc_numbers
+        return heapq.nlargest(k, scores.items(), key=lambda item: (round(item[1], 4), -numbers[item[0]]))
+
+    def _merge(self, shard_rankings, k):
+        scores = {}
+        for ranked in shard_rankings:
+            scores.update(ranked)
+        return self._select_top_k(scores, k)
+
+    def _check_model(self, model):
+        if model == 'bm25f':
+            # l'index des champs n'est pas partitionne
+            raise ValueError("bm25f needs the single index (no field index in the shards)")
+
+    def rank(self, query_terms, model, k, pruning=True, candidates=None):
+        self._check_model(model)
+        if candidates is not None:
+            candidates = list(candidates)
+        per_shard = self._pool.rank([query_terms], model, k, self.k1, self.b, candidates)
+        return self._merge([rankings[0] for rankings in per_shard], k)
+
+    def rank_many(self, term_lists, model, k):
+        self._check_model(model)
+        if not term_lists:
+            return []
+        per_shard = self._pool.rank(term_lists, model, k, self.k1, self.b)
+        return [self._merge([rankings[i] for rankings in per_shard], k) for i in range(len(term_lists))]
+
+
+class ShardedSearchEngine(SearchEngine):
+    """
+    SearchEngine over the shards written by indexer.py --shards N. Ranking
+    is scattered to one process per shard (executor="process", to use
+    several cores and keep postings out of the coordinator) or to threads
+    (executor="thread"); result cache, pagination, snippets, phrases and
+    live reload work as with a single index. bm25f needs the single index.
+    """
+
+    models = ("bm25", "tfidf") #pas d'index des champs dans les shards
+
+    def __init__(self, shards_dir=SHARDS_DIR, executor="process", **options):
+        self.shards_dir = shards_dir
+        self.executor = executor
+        super().__init__(**options)
+
+    def _load_snapshot(self, generation):
+        return ShardedSnapshot(self.shards_dir, self.k1, self.b, self.backend, generation, self.executor)
+
+    def _rank_parallel(self, snapshot, term_lists, model, k, workers):
+        # les shards classent deja en parallele
+        return snapshot.rank_many(term_lists, model, k)
@@ -0,0 +1,132 @@
+import os
+from array import array
+
+try:
+    from src.binary_index import _to_array, _to_bytes
+    from src.forward_index import RecordFile, encode_term_block, find_term_payloads
+    from src.instrumentation import current_trace
+except ImportError:
+    from binary_index import _to_array, _to_bytes
+    from forward_index import RecordFile, encode_term_block, find_term_payloads
+    from instrumentation import current_trace
+
+# index des snippets, ecrit par l'indexeur : pour chaque document, son texte
+# (utf-8) suivi du repertoire de ses termes stemmes (forward_index), chaque
+# terme ayant les positions (uint32, octets du texte) de ses occurrences
+SNIPPETS_FILE = os.path.join("data", "snippets.dat")
+SNIPPETS_INDEX_FILE = os.path.join("data", "snippets.idx")
+
+# fenetre du snippet, en octets du texte : CONTEXT avant le premier terme, WIDTH en tout
+SNIPPET_CONTEXT = 50
+SNIPPET_WIDTH = 200
+
+
+def token_offsets(text, tokens, offsets):
+    """
+    Snippet record of a document: (utf-8 text, {term: byte offsets}) from
+    the stemmed tokens and their character offsets
+    (Preprocessor.process_with_offsets).
+    """
+    positions = {}
+    byte_offset = 0
+    char_offset = 0
+    for term, offset in zip(tokens, offsets):
+        if offset < 0:
+            continue
+        # conversion incrementale caractere -> octet (les offsets sont croissants)
+        byte_offset += len(text[char_offset:offset].encode("utf-8"))
+        char_offset = offset
+        positions.setdefault(term, []).append(byte_offset)
+    return text.encode("utf-8"), positions
+
+
+def _record_parts(record):
+    text, positions = record
+    return [text, encode_term_block({term: _to_bytes(array("I", offsets)) for term, offsets in positions.items()})]
+
+
+def write_snippet_index(records, data_file=SNIPPETS_FILE, index_file=SNIPPETS_INDEX_FILE):
+    """Writes a new snippet index from {doc_id: (text bytes, positions)}"""
+    SnippetIndex(data_file, index_file).write(records)
+
+
+class SnippetIndex(RecordFile):
+    """
+    Reader (and incremental writer) of the snippet index.
+
+    A snippet costs a binary search per query term in the sorted term list
+    of the document and a read of the window bytes through mmap: the full
+    text is neither loaded nor scanned.
+    """
+
+    MAGIC = b"BDRSNP01"
+    VERSION = 2 # v2 : repertoire des termes partage avec l'index positionnel
+
+    def __init__(self, data_file=SNIPPETS_FILE, index_file=SNIPPETS_INDEX_FILE):
+        super().__init__(data_file, index_file)
+
+    def _parts(self, record):
+        # (texte, offsets des termes) -> [texte, repertoire des termes]
+        return _record_parts(record)
+
+    def term_offsets(self, doc_id, terms):
+        """{term: [byte offsets]} of the given terms in a document"""
+        mm, start, _ = self.part(doc_id, 1)
+        payloads = find_term_payloads(mm, start, terms)
+        trace = current_trace()
+        if trace is not None:
+            trace.count("snippet_bytes", sum(len(payload) for payload in payloads.values()))
+        return {term: _to_array("I", payload) for term, payload in payloads.items()}
+
+    def _text(self, doc_id, start, end):
+        """Text of a document between two byte offsets, cut on character boundaries"""
+        position, text_length, _ = self.records[doc_id]
+        mm = self._map(position + text_length)
+        start, end = position + start, position + end
+        # un octet 10xxxxxx est la suite d'un caractere multi-octets
+        while start < end and mm[start] & 0xC0 == 0x80:
+            start += 1
+        while end < position + text_length and mm[end] & 0xC0 == 0x80:
+            end -= 1
+        trace = current_trace()
+        if trace is not None:
+            trace.count("snippet_bytes", end - start)
+        return mm[start:end].decode("utf-8")
+
+    def snippet(self, doc_id, query_terms):
+        """
+        Extract of the document around the window of SNIPPET_WIDTH bytes that
+        contains the most distinct query terms (then the most occurrences),
+        or its beginning if none occurs.
+        """
+        text_length = self.records[doc_id][1]
+        occurrences = sorted((offset, term) for term, term_offsets in self.term_offsets(doc_id, query_terms).items()
+                             for offset in term_offsets)
+        if not occurrences:
+            return self._text(doc_id, 0, min(text_length, SNIPPET_WIDTH)) + "..."
+
+        # fenetre glissante sur les occurrences triees
+        span = SNIPPET_WIDTH - SNIPPET_CONTEXT
+        best_key, best_anchor = None, 0
+        counts = {}
+        left = 0
+        for right, (offset, term) in enumerate(occurrences):
+            counts[term] = counts.get(term, 0) + 1
+            while offset - occurrences[left][0] >= span:
+                left_term = occurrences[left][1]
+                counts[left_term] -= 1
+                if not counts[left_term]:
+                    del counts[left_term]
+                left += 1
+            key = (len(counts), right - left + 1)
+            if best_key is None or key > best_key:
+                best_key, best_anchor = key, occurrences[left][0]
+
+        start = max(0, best_anchor - SNIPPET_CONTEXT)
+        end = min(text_length, best_anchor + span)
+        snippet = self._text(doc_id, start, end)
+        if start > 0:
+            snippet = "..." + snippet
+        if end < text_length:
+            snippet = snippet + "..."
+        return snippet